@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Callable,
+    Iterator,
+)
+
+from uvicorn.middleware.wsgi import WSGIResponder
+
+
+def close_wsgi_responses(wsgi_application: Callable) -> Callable:
+    # WSGIResponder из uvicorn не вызывает close() у ответа, а Django по
+    # нему отправляет request_finished и закрывает соединения с БД
+    def application(environ: dict, start_response: Callable) -> Iterator[bytes]:
+        response = wsgi_application(environ, start_response)
+        try:
+            yield from response
+        finally:
+            response.close()
+
+    return application
+
+
+class BoundedWSGIApplication:
+    """
+    ASGI-приложение для деплоя с одним процессом на много соединений.
+
+    Django 2.2 не умеет ASGI, поэтому каждый запрос целиком, со всеми
+    middleware, выполняет WSGI-приложение Django в пуле из threads
+    потоков. Соединения с клиентами держит цикл событий, запрос, который
+    ждёт свободный поток, занимает только корутину, а соединений с БД на
+    процесс не больше threads.
+    """
+
+    def __init__(self, wsgi_application: Callable, threads: int):
+        self.wsgi_application = close_wsgi_responses(wsgi_application)
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads,
+            thread_name_prefix='asgi-db',
+        )
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            await self.serve_lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported scope type {scope["type"]}')
+        await WSGIResponder(self.wsgi_application, self.executor, scope)(receive, send)
+
+    async def serve_lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # дожидаемся запросов, которые ещё выполняются в пуле
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,127 @@
+import csv
+import json
+from datetime import datetime
+from typing import (
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+)
+
+from django.utils import timezone
+
+
+TRANSACTION_EXPORT_COLUMNS = (
+    'sender',
+    'recipient',
+    'amount',
+    'exchange_rate',
+    'created_at',
+)
+TRANSACTION_EXPORT_FIELDS = (
+    'sender_id',
+    'recipient_id',
+    'amount',
+    'exchange_rate',
+    'created_at',
+)
+
+# первыми идут поля курсора, см. retrieve_transaction_rows_page
+TRANSACTION_PAGE_FIELDS = (
+    'id',
+    'created_at',
+    'sender_id',
+    'recipient_id',
+    'amount',
+    'exchange_rate',
+)
+
+# строки отдаются клиенту пачками, чтобы не делать запись в сокет на
+# каждую транзакцию
+ROWS_PER_CHUNK = 500
+
+
+def format_datetime(value: datetime, tz=None) -> str:
+    # тот же формат, что у DateTimeField из DRF
+    value = timezone.localtime(value, tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class LinesBuffer:
+    """
+    Файлоподобный объект для csv.writer: копит строки, которые затем
+    забираются целиком через flush_lines().
+    """
+
+    def __init__(self):
+        self._lines = []
+
+    def write(self, line: str) -> None:
+        self._lines.append(line)
+
+    def flush_lines(self) -> str:
+        lines = ''.join(self._lines)
+        self._lines = []
+        return lines
+
+
+def stream_transactions_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    buffer = LinesBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(TRANSACTION_EXPORT_COLUMNS)
+    for number, (sender, recipient, amount, exchange_rate, created_at) in enumerate(rows, 1):
+        writer.writerow(
+            (sender, recipient, amount, exchange_rate, format_datetime(created_at)),
+        )
+        if number % ROWS_PER_CHUNK == 0:
+            yield buffer.flush_lines()
+    yield buffer.flush_lines()
+
+
+def stream_transactions_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    lines = []
+    for sender, recipient, amount, exchange_rate, created_at in rows:
+        lines.append(json.dumps({
+            'sender': sender,
+            'recipient': recipient,
+            'amount': str(amount),
+            'exchange_rate': str(exchange_rate),
+            'created_at': format_datetime(created_at),
+        }))
+        lines.append('\n')
+        if len(lines) == ROWS_PER_CHUNK * 2:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def dump_transactions_page(
+        rows: Sequence[tuple],
+        next_cursor: Optional[str],
+) -> bytes:
+    """
+    JSON страницы истории в том же виде, что отдаёт JSONRenderer для
+    TransactionSerializer, но собранный из кортежей values_list за один
+    проход, без полей DRF и промежуточных словарей.
+    """
+    tz = timezone.get_current_timezone()
+    items = []
+    for _, created_at, sender, recipient, amount, exchange_rate in rows:
+        items.append(
+            f'{{"sender":{sender},"recipient":{recipient},'
+            f'"amount":"{amount}","exchange_rate":"{exchange_rate}",'
+            f'"created_at":"{format_datetime(created_at, tz)}"}}'
+        )
+    return (
+        '{"transactions":[' + ','.join(items) + '],'
+        f'"next":{json.dumps(next_cursor)},"status":200}}'
+    ).encode()
+
+
+TRANSACTION_EXPORTERS = {
+    'csv': (stream_transactions_csv, 'text/csv'),
+    'ndjson': (stream_transactions_ndjson, 'application/x-ndjson'),
+}
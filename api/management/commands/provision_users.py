@@ -0,0 +1,52 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from ...provisioning import (
+    CSV,
+    FILE_FORMATS,
+    NDJSON,
+    ProvisioningProgress,
+    provision_users,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Create users with wallets from a CSV or NDJSON file with '
+        'email, password, currency and init_balance. Users that already '
+        'exist are skipped, so an interrupted run can be restarted'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format',
+            choices=FILE_FORMATS,
+            help='File format, detected by extension by default',
+        )
+        parser.add_argument('--processes', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            file_format = NDJSON if path.endswith(('.ndjson', '.jsonl')) else CSV
+
+        def report(progress: ProvisioningProgress) -> None:
+            self.stdout.write(
+                f'read {progress.read}, created {progress.created}, '
+                f'skipped {progress.skipped}, invalid {progress.invalid}, '
+                f'{progress.rows_per_second:.1f} rows/s'
+            )
+
+        progress = provision_users(
+            path=path,
+            file_format=file_format,
+            processes=options['processes'],
+            chunk_size=options['chunk_size'],
+            on_progress=report,
+            on_error=lambda message: self.stderr.write(message),
+        )
+        report(progress)
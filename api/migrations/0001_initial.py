@@ -0,0 +1,33 @@
+# Generated by Django 2.2 on 2026-10-17 17:40
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Значение заголовка Idempotency-Key', max_length=255, verbose_name='Ключ идемпотентности')),
+                ('response', django.contrib.postgres.fields.jsonb.JSONField(help_text='Тело первого ответа', verbose_name='Тело первого ответа')),
+                ('status_code', models.PositiveSmallIntegerField(help_text='HTTP-статус первого ответа', verbose_name='HTTP-статус первого ответа')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, help_text='Дата и время первого запроса', verbose_name='Дата и время первого запроса')),
+                ('user', models.ForeignKey(help_text='Пользователь, отправивший запрос', on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='idempotencykey_unique_user_key'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.contrib.postgres import fields
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys',
+        verbose_name='Пользователь',
+        help_text='Пользователь, отправивший запрос',
+    )
+    key = models.CharField(
+        max_length=255,
+        verbose_name='Ключ идемпотентности',
+        help_text='Значение заголовка Idempotency-Key',
+    )
+    response = fields.JSONField(
+        verbose_name='Тело первого ответа',
+        help_text='Тело первого ответа',
+    )
+    status_code = models.PositiveSmallIntegerField(
+        verbose_name='HTTP-статус первого ответа',
+        help_text='HTTP-статус первого ответа',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата и время первого запроса',
+        help_text='Дата и время первого запроса',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'],
+                name='idempotencykey_unique_user_key',
+            ),
+        ]
@@ -0,0 +1,206 @@
+import csv
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import (
+    Decimal,
+    InvalidOperation,
+    ROUND_HALF_DOWN,
+)
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from customauth.models import CustomUser
+from wallet.models import (
+    CURRENCIES,
+    Wallet,
+)
+
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FILE_FORMATS = (CSV, NDJSON)
+
+
+class ProvisioningRow(NamedTuple):
+    line: int
+    email: str
+    password: str
+    currency: str
+    init_balance: Decimal
+
+
+class ProvisioningProgress:
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.read = 0
+        self.created = 0
+        self.skipped = 0
+        self.invalid = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started_at
+        return self.read / elapsed if elapsed else 0.0
+
+
+def read_records(path: str, file_format: str) -> Iterator[Tuple[int, Dict]]:
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == CSV:
+            # строка 1 - заголовок
+            for line, record in enumerate(csv.DictReader(source), 2):
+                yield line, record
+        else:
+            for line, text in enumerate(source, 1):
+                if not text.strip():
+                    continue
+                try:
+                    yield line, json.loads(text)
+                except ValueError:
+                    # битая строка считается некорректной записью
+                    yield line, None
+
+
+def parse_record(line: int, record: Dict) -> ProvisioningRow:
+    try:
+        email = CustomUser.objects.normalize_email(record['email'].strip())
+        password = record['password']
+        currency = record['currency']
+        init_balance = Decimal(str(record['init_balance']))
+    except (KeyError, TypeError, AttributeError, InvalidOperation) as error:
+        raise ValueError(f'line {line}: malformed record') from error
+    if not email or not password:
+        raise ValueError(f'line {line}: email and password are required')
+    if currency not in CURRENCIES:
+        raise ValueError(f'line {line}: unknown currency {currency}')
+    if not 0 <= init_balance <= 999999999:
+        raise ValueError(f'line {line}: init_balance is out of range')
+    init_balance = init_balance.quantize(Decimal('.01'), ROUND_HALF_DOWN)
+    return ProvisioningRow(line, email, password, currency, init_balance)
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    return [make_password(password) for password in passwords]
+
+
+def insert_users_and_wallets(rows: List[ProvisioningRow], password_hashes: List[str]) -> None:
+    with transaction.atomic():
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                email=row.email,
+                password=password_hash,
+                is_staff=False,
+                is_superuser=False,
+                is_active=True,
+            )
+            for row, password_hash in zip(rows, password_hashes)
+        ])
+        Wallet.objects.bulk_create([
+            Wallet(
+                owner=user,
+                currency=row.currency,
+                balance=row.init_balance,
+                initial_balance=row.init_balance,
+            )
+            for row, user in zip(rows, users)
+        ])
+
+
+def read_chunks(
+        path: str,
+        file_format: str,
+        chunk_size: int,
+        progress: ProvisioningProgress,
+        on_error: Callable[[str], None],
+) -> Iterator[List[ProvisioningRow]]:
+    # пользователи, которые уже есть в БД, пропускаются до хеширования:
+    # повторный запуск на том же файле продолжает с места остановки
+    seen_emails = set()
+
+    def filter_new(rows: List[ProvisioningRow]) -> List[ProvisioningRow]:
+        existing = set(
+            CustomUser.objects.filter(
+                email__in=[row.email for row in rows],
+            ).values_list('email', flat=True)
+        )
+        new_rows = [row for row in rows if row.email not in existing]
+        progress.skipped += len(rows) - len(new_rows)
+        return new_rows
+
+    chunk = []
+    for line, record in read_records(path, file_format):
+        progress.read += 1
+        try:
+            row = parse_record(line, record)
+        except ValueError as error:
+            progress.invalid += 1
+            on_error(str(error))
+            continue
+        if row.email in seen_emails:
+            progress.skipped += 1
+            continue
+        seen_emails.add(row.email)
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield filter_new(chunk)
+            chunk = []
+    if chunk:
+        yield filter_new(chunk)
+
+
+def provision_users(
+        path: str,
+        file_format: str,
+        processes: int,
+        chunk_size: int,
+        on_progress: Optional[Callable[[ProvisioningProgress], None]] = None,
+        on_error: Optional[Callable[[str], None]] = None,
+) -> ProvisioningProgress:
+    """
+    Создаёт пользователей и кошельки из файла пачками по chunk_size.
+
+    Пароли хешируются в processes процессах, пока основной процесс
+    вставляет уже готовые пачки. Каждая пачка вставляется в своей
+    транзакции, поэтому после сбоя файл можно просто запустить заново.
+    """
+    progress = ProvisioningProgress()
+    on_progress = on_progress or (lambda progress: None)
+    on_error = on_error or (lambda message: None)
+    chunks = read_chunks(path, file_format, chunk_size, progress, on_error)
+    # дочерние процессы только хешируют пароли и не трогают БД
+    with ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as executor:
+        in_flight = deque()
+
+        def insert_oldest() -> None:
+            ready_rows, future = in_flight.popleft()
+            insert_users_and_wallets(ready_rows, future.result())
+            progress.created += len(ready_rows)
+            on_progress(progress)
+
+        for rows in chunks:
+            if not rows:
+                # вся пачка уже в БД
+                on_progress(progress)
+                continue
+            passwords = [row.password for row in rows]
+            in_flight.append((rows, executor.submit(hash_passwords, passwords)))
+            # держим в очереди по две пачки на процесс, чтобы процессы не
+            # простаивали, пока вставляется очередная пачка
+            while len(in_flight) > processes * 2 or (in_flight and in_flight[0][1].done()):
+                insert_oldest()
+        while in_flight:
+            insert_oldest()
+    return progress
@@ -1,5 +1,14 @@
 from .user_registration import UserRegistrationSerializer
 from .money_transfer import (
+    MoneyTransferBatchSerializer,
     MoneyTransferSerializer,
+    PendingTransferSerializer,
     TransactionSerializer,
+    TransactionsExportSerializer,
+    TransactionsPageSerializer,
 )
+from .wallet_statement import (
+    WalletStatementRequestSerializer,
+    WalletStatementSerializer,
+)
+from .wallet_balance import WalletBalanceSerializer
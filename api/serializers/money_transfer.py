@@ -1,6 +1,12 @@
 from rest_framework import serializers
 
-from wallet.models import Transaction
+from api.exports import TRANSACTION_EXPORTERS
+from wallet.exceptions import WalletOperationException
+from wallet.models import (
+    PendingTransfer,
+    Transaction,
+)
+from wallet.services import decode_transactions_cursor
 
 
 class MoneyTransferSerializer(serializers.Serializer):
@@ -20,6 +26,27 @@ class MoneyTransferSerializer(serializers.Serializer):
     )
 
 
+class MoneyTransferBatchSerializer(serializers.Serializer):
+
+    MAX_TRANSFERS = 1000
+
+    transfers = MoneyTransferSerializer(
+        many=True,
+        allow_empty=False,
+    )
+    all_or_nothing = serializers.BooleanField(
+        required=False,
+        default=True,
+    )
+
+    def validate_transfers(self, transfers: list):
+        if len(transfers) > self.MAX_TRANSFERS:
+            raise serializers.ValidationError(
+                f'No more than {self.MAX_TRANSFERS} transfers per batch',
+            )
+        return transfers
+
+
 class TransactionSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -31,3 +58,48 @@ class TransactionSerializer(serializers.ModelSerializer):
             'exchange_rate',
             'created_at',
         ]
+
+
+class TransactionsPageSerializer(serializers.Serializer):
+
+    limit = serializers.IntegerField(
+        required=False,
+        default=100,
+        min_value=1,
+        max_value=1000,
+    )
+    cursor = serializers.CharField(
+        required=False,
+    )
+
+    def validate_cursor(self, cursor: str):
+        try:
+            return decode_transactions_cursor(cursor)
+        except WalletOperationException as error:
+            raise serializers.ValidationError(str(error))
+
+
+class TransactionsExportSerializer(serializers.Serializer):
+
+    type = serializers.ChoiceField(
+        choices=sorted(TRANSACTION_EXPORTERS),
+        required=False,
+        default='csv',
+    )
+
+
+class PendingTransferSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = PendingTransfer
+        fields = [
+            'id',
+            'sender_wallet_id',
+            'recipient_wallet_id',
+            'amount',
+            'status',
+            'transaction',
+            'error',
+            'created_at',
+            'processed_at',
+        ]
@@ -0,0 +1,15 @@
+from rest_framework import serializers
+
+
+class WalletBalanceSerializer(serializers.Serializer):
+
+    wallet = serializers.IntegerField(
+        source='wallet.pk',
+    )
+    currency = serializers.CharField(
+        source='wallet.currency',
+    )
+    balance = serializers.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+    )
@@ -0,0 +1,41 @@
+from rest_framework import serializers
+
+
+class WalletStatementRequestSerializer(serializers.Serializer):
+
+    start = serializers.DateTimeField(
+        required=True,
+        help_text='Начало периода выписки',
+    )
+    end = serializers.DateTimeField(
+        required=False,
+        help_text='Конец периода выписки, по умолчанию текущий момент',
+    )
+
+
+class WalletStatementSerializer(serializers.Serializer):
+
+    wallet = serializers.IntegerField(
+        source='wallet.pk',
+    )
+    currency = serializers.CharField(
+        source='wallet.currency',
+    )
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    opening_balance = serializers.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+    )
+    closing_balance = serializers.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+    )
+    incoming = serializers.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+    )
+    outgoing = serializers.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+    )
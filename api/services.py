@@ -1,9 +1,24 @@
+from datetime import datetime
 from decimal import Decimal
+from typing import (
+    Callable,
+    Dict,
+    Optional,
+    Tuple,
+)
+
+from django.conf import settings
+from django.db import (
+    IntegrityError,
+    transaction,
+)
+from django.utils import timezone
 
 from customauth.models import CustomUser
 from customauth.services import create_user
 from wallet.exceptions import WalletCreationException
 from wallet.services import create_wallet
+from .models import IdempotencyKey
 
 
 def create_user_and_wallet(
@@ -27,3 +42,77 @@ def create_user_and_wallet(
         )
     except WalletCreationException:
         pass
+
+
+def get_idempotent_response(
+        user: CustomUser,
+        key: str,
+) -> Optional[Tuple[Dict, int]]:
+    return IdempotencyKey.objects.filter(
+        user=user,
+        key=key,
+    ).values_list('response', 'status_code').first()
+
+
+def save_idempotent_response(
+        user: CustomUser,
+        key: str,
+        response: Dict,
+        status_code: int,
+) -> IdempotencyKey:
+    # уникальный индекс (user, key) не даёт параллельному повтору
+    # провести перевод второй раз: его вставка упадёт с IntegrityError
+    return IdempotencyKey.objects.create(
+        user=user,
+        key=key,
+        response=response,
+        status_code=status_code,
+    )
+
+
+def run_idempotently(
+        user: CustomUser,
+        key: Optional[str],
+        action: Callable[[], Tuple[Dict, int]],
+) -> Tuple[Dict, int]:
+    if not key:
+        return action()
+
+    stored_response = get_idempotent_response(user=user, key=key)
+    if stored_response is not None:
+        return stored_response
+
+    try:
+        with transaction.atomic():
+            response, status_code = action()
+            save_idempotent_response(
+                user=user,
+                key=key,
+                response=response,
+                status_code=status_code,
+            )
+    except IntegrityError:
+        # параллельный запрос с тем же ключом успел первым, наш перевод
+        # откатился вместе с вставкой ключа
+        stored_response = get_idempotent_response(user=user, key=key)
+        if stored_response is None:
+            raise
+        return stored_response
+    return response, status_code
+
+
+def delete_expired_idempotency_keys(
+        now: Optional[datetime] = None,
+        batch_size: int = 1000,
+) -> int:
+    now = now or timezone.now()
+    expired_keys = IdempotencyKey.objects.filter(
+        created_at__lt=now - settings.IDEMPOTENCY_KEY_TTL,
+    )
+    deleted = 0
+    while True:
+        batch_ids = list(expired_keys.values_list('pk', flat=True)[:batch_size])
+        if not batch_ids:
+            return deleted
+        IdempotencyKey.objects.filter(pk__in=batch_ids).delete()
+        deleted += len(batch_ids)
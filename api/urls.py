@@ -2,8 +2,13 @@ from django.urls import path
 from rest_framework.authtoken.views import ObtainAuthToken
 
 from .views import (
+    PendingTransferView,
+    TransmitMoneyBatchView,
     TransmitMoneyView,
+    TransactionsExportView,
     UserRegistrationView,
+    WalletBalanceView,
+    WalletStatementView,
     WalletTransactionsView,
 )
 
@@ -12,5 +17,10 @@ urlpatterns = [
     path('v1/signin/', ObtainAuthToken.as_view()),
     path('v1/signup/', UserRegistrationView.as_view()),
     path('v1/transmit_money/', TransmitMoneyView.as_view()),
+    path('v1/transmit_money/batch/', TransmitMoneyBatchView.as_view()),
+    path('v1/transmit_money/<int:pending_transfer_id>/', PendingTransferView.as_view()),
     path('v1/transactions/<int:wallet_id>/', WalletTransactionsView.as_view()),
+    path('v1/transactions/<int:wallet_id>/export', TransactionsExportView.as_view()),
+    path('v1/wallets/<int:wallet_id>/balance/', WalletBalanceView.as_view()),
+    path('v1/wallets/<int:wallet_id>/statement/', WalletStatementView.as_view()),
 ]
@@ -1,25 +1,63 @@
+import re
+
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
+    HTTP_202_ACCEPTED,
     HTTP_400_BAD_REQUEST,
     HTTP_500_INTERNAL_SERVER_ERROR,
 )
 from rest_framework.views import APIView
 
 from wallet.services import (
+    create_pending_transfer,
     transfer_money_between_wallets,
-    retrieve_transactions_by_wallet_id,
+    transfer_money_in_batch,
+    iterate_transactions_by_wallet_id,
+    retrieve_pending_transfer,
+    retrieve_transaction_rows_page,
+    retrieve_wallet_balance,
+    retrieve_wallet_statement,
+)
+from .exports import (
+    TRANSACTION_EXPORTERS,
+    TRANSACTION_EXPORT_FIELDS,
+    TRANSACTION_PAGE_FIELDS,
+    dump_transactions_page,
+)
+from .models import IdempotencyKey
+from .services import (
+    create_user_and_wallet,
+    run_idempotently,
 )
-from .services import create_user_and_wallet
 from .serializers import (
+    MoneyTransferBatchSerializer,
     MoneyTransferSerializer,
-    TransactionSerializer,
+    PendingTransferSerializer,
+    TransactionsExportSerializer,
+    TransactionsPageSerializer,
     UserRegistrationSerializer,
+    WalletBalanceSerializer,
+    WalletStatementRequestSerializer,
+    WalletStatementSerializer,
 )
 
 
+IDEMPOTENCY_KEY_MAX_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+
 class UserRegistrationView(APIView):
 
     def post(self, request):
@@ -63,20 +101,131 @@ class TransmitMoneyView(APIView):
     ]
 
     def post(self, request):
+        idempotency_key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {
+                    'error': f'Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters',
+                    'status': HTTP_400_BAD_REQUEST,
+                },
+                status=HTTP_400_BAD_REQUEST,
+            )
+
         input_serializer = MoneyTransferSerializer(data=request.data)
         if input_serializer.is_valid():
             try:
-                transaction = transfer_money_between_wallets(
+                transmit = (
+                    self.enqueue_money_transfer
+                    if 'respond-async' in request.META.get('HTTP_PREFER', '')
+                    else self.transmit_money
+                )
+                response, status = run_idempotently(
+                    user=request.user,
+                    key=idempotency_key,
+                    action=lambda: transmit(
+                        user=request.user,
+                        validated_data=input_serializer.validated_data,
+                    ),
+                )
+                return Response(response, status=status)
+            except Exception as error:
+                return Response(
+                    {
+                        'error': str(error),
+                        'status': HTTP_500_INTERNAL_SERVER_ERROR,
+                    },
+                    status=HTTP_500_INTERNAL_SERVER_ERROR,
+                )
+        return Response(
+            {
+                'error': input_serializer.errors,
+                'status': HTTP_400_BAD_REQUEST,
+            },
+            status=HTTP_400_BAD_REQUEST,
+        )
+
+    @staticmethod
+    def transmit_money(user, validated_data):
+        transaction = transfer_money_between_wallets(
+            sender=user,
+            sender_wallet_id=validated_data['sender'],
+            recipient_wallet_id=validated_data['recipient'],
+            amount=validated_data['amount'],
+        )
+        return (
+            {
+                'message': f'You successfully transmitted '
+                           f'{transaction.amount} {transaction.sender.currency} '
+                           f'to {transaction.recipient}',
+                'status': HTTP_200_OK,
+            },
+            HTTP_200_OK,
+        )
+
+    @staticmethod
+    def enqueue_money_transfer(user, validated_data):
+        pending_transfer = create_pending_transfer(
+            sender=user,
+            sender_wallet_id=validated_data['sender'],
+            recipient_wallet_id=validated_data['recipient'],
+            amount=validated_data['amount'],
+        )
+        return (
+            {
+                'id': pending_transfer.pk,
+                'message': 'Transfer is accepted for processing',
+                'status': HTTP_202_ACCEPTED,
+            },
+            HTTP_202_ACCEPTED,
+        )
+
+
+class PendingTransferView(APIView):
+
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request, pending_transfer_id):
+        try:
+            pending_transfer = retrieve_pending_transfer(
+                user=request.user,
+                pending_transfer_id=pending_transfer_id,
+            )
+            return Response(
+                {
+                    'transfer': PendingTransferSerializer(pending_transfer).data,
+                    'status': HTTP_200_OK,
+                }
+            )
+        except Exception as error:
+            return Response(
+                {
+                    'error': str(error),
+                    'status': HTTP_500_INTERNAL_SERVER_ERROR,
+                },
+                status=HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class TransmitMoneyBatchView(APIView):
+
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def post(self, request):
+        input_serializer = MoneyTransferBatchSerializer(data=request.data)
+        if input_serializer.is_valid():
+            try:
+                results = transfer_money_in_batch(
                     sender=request.user,
-                    sender_wallet_id=input_serializer.validated_data['sender'],
-                    recipient_wallet_id=input_serializer.validated_data['recipient'],
-                    amount=input_serializer.validated_data['amount'],
+                    transfers=input_serializer.validated_data['transfers'],
+                    all_or_nothing=input_serializer.validated_data['all_or_nothing'],
                 )
                 return Response(
                     {
-                        'message': f'You successfully transmitted '
-                                   f'{transaction.amount} {transaction.sender.currency} '
-                                   f'to {transaction.recipient}',
+                        'results': results,
                         'status': HTTP_200_OK,
                     },
                     status=HTTP_200_OK,
@@ -105,18 +254,146 @@ class WalletTransactionsView(APIView):
     ]
 
     def get(self, request, wallet_id):
+        input_serializer = TransactionsPageSerializer(data=request.query_params)
+        if not input_serializer.is_valid():
+            return Response(
+                {
+                    'error': input_serializer.errors,
+                    'status': HTTP_400_BAD_REQUEST,
+                },
+                status=HTTP_400_BAD_REQUEST,
+            )
+        try:
+            rows, next_cursor = retrieve_transaction_rows_page(
+                user=request.user,
+                wallet_id=wallet_id,
+                fields=TRANSACTION_PAGE_FIELDS,
+                limit=input_serializer.validated_data['limit'],
+                after=input_serializer.validated_data.get('cursor'),
+            )
+            # страница собирается сразу в байты JSON: поштучная
+            # сериализация TransactionSerializer на больших страницах
+            # занимает большую часть времени запроса
+            return HttpResponse(
+                dump_transactions_page(rows, next_cursor),
+                content_type='application/json',
+            )
+        except Exception as error:
+            return Response(
+                {
+                    'error': str(error),
+                    'status': HTTP_500_INTERNAL_SERVER_ERROR,
+                },
+                status=HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class TransactionsExportView(APIView):
+
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request, wallet_id):
+        input_serializer = TransactionsExportSerializer(data=request.query_params)
+        if not input_serializer.is_valid():
+            return Response(
+                {
+                    'error': input_serializer.errors,
+                    'status': HTTP_400_BAD_REQUEST,
+                },
+                status=HTTP_400_BAD_REQUEST,
+            )
+        export_type = input_serializer.validated_data['type']
+        stream_transactions, content_type = TRANSACTION_EXPORTERS[export_type]
+        try:
+            rows = iterate_transactions_by_wallet_id(
+                user=request.user,
+                wallet_id=wallet_id,
+                fields=TRANSACTION_EXPORT_FIELDS,
+                chunk_size=settings.TRANSACTIONS_EXPORT_CHUNK_SIZE,
+            )
+        except Exception as error:
+            return Response(
+                {
+                    'error': str(error),
+                    'status': HTTP_500_INTERNAL_SERVER_ERROR,
+                },
+                status=HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        content = (chunk.encode() for chunk in stream_transactions(rows))
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        gzipped = bool(ACCEPTS_GZIP_RE.search(accept_encoding))
+        if gzipped:
+            content = compress_sequence(content)
+        response = StreamingHttpResponse(
+            content,
+            content_type=f'{content_type}; charset=utf-8',
+        )
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['Content-Disposition'] = (
+            f'attachment; filename="wallet-{wallet_id}-transactions.{export_type}"'
+        )
+        return response
+
+
+class WalletStatementView(APIView):
+
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request, wallet_id):
+        input_serializer = WalletStatementRequestSerializer(data=request.query_params)
+        if not input_serializer.is_valid():
+            return Response(
+                {
+                    'error': input_serializer.errors,
+                    'status': HTTP_400_BAD_REQUEST,
+                },
+                status=HTTP_400_BAD_REQUEST,
+            )
         try:
-            transactions = retrieve_transactions_by_wallet_id(
+            statement = retrieve_wallet_statement(
                 user=request.user,
                 wallet_id=wallet_id,
+                start=input_serializer.validated_data['start'],
+                end=input_serializer.validated_data.get('end', timezone.now()),
+            )
+            return Response(
+                {
+                    'statement': WalletStatementSerializer(statement).data,
+                    'status': HTTP_200_OK,
+                }
             )
-            transactions_serialized = TransactionSerializer(
-                transactions,
-                many=True,
+        except Exception as error:
+            return Response(
+                {
+                    'error': str(error),
+                    'status': HTTP_500_INTERNAL_SERVER_ERROR,
+                },
+                status=HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class WalletBalanceView(APIView):
+
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request, wallet_id):
+        try:
+            wallet_balance = retrieve_wallet_balance(
+                user=request.user,
+                wallet_id=wallet_id,
             )
             return Response(
                 {
-                    'transactions': transactions_serialized.data,
+                    'balance': WalletBalanceSerializer(wallet_balance).data,
                     'status': HTTP_200_OK,
                 }
             )
@@ -0,0 +1,231 @@
+"""
+Сколько одновременных клиентов выдерживает чтение истории и баланса
+кошелька: uvicorn с wallet_demo.asgi (один процесс, пул ASGI_DB_THREADS
+потоков) против gunicorn с wallet_demo.wsgi (синхронные воркеры).
+
+Все клиенты сначала открывают соединения, затем одновременно отправляют
+запросы; каждый клиент шлёт --requests запросов подряд. Клиенты - это
+корутины на сырых сокетах, поэтому тысяча соединений не требует тысячи
+потоков и в генераторе нагрузки.
+
+    python -m benchmarks.asgi_concurrency --clients 100 1000 --requests 5
+"""
+import argparse
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import (
+    List,
+    Tuple,
+)
+
+from .http_serving import (
+    get_server_env,
+    seed,
+    wait_until_ready,
+)
+from .utils import (
+    benchmark_database,
+    percentile,
+    setup_django,
+)
+
+
+ENDPOINTS = {
+    'transactions': '/api/v1/transactions/{wallet_id}/?limit=50',
+    'balance': '/api/v1/wallets/{wallet_id}/balance/',
+}
+
+
+def raise_open_files_limit(connections: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = connections + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+
+async def read_response(reader: asyncio.StreamReader) -> Tuple[int, bool]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by server')
+    status = int(status_line.split()[1])
+    content_length = 0
+    keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            content_length = int(value)
+        elif name == 'connection' and value.strip().lower() == 'close':
+            keep_alive = False
+    await reader.readexactly(content_length)
+    return status, keep_alive
+
+
+class Client:
+    """
+    Соединение keep-alive, которое переоткрывается, если сервер закрыл
+    его после ответа (синхронные воркеры gunicorn так делают всегда).
+    """
+
+    def __init__(self, host: str, port: int, request: bytes):
+        self.host = host
+        self.port = port
+        self.request = request
+        self.reader = None
+        self.writer = None
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def get(self) -> int:
+        if self.writer is None:
+            await self.connect()
+        self.writer.write(self.request)
+        status, keep_alive = await read_response(self.reader)
+        if not keep_alive:
+            self.close()
+        return status
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def run_clients(
+        host: str,
+        port: int,
+        path: str,
+        token: str,
+        clients_count: int,
+        requests_count: int,
+        timeout: float,
+):
+    request = (
+        f'GET {path} HTTP/1.1\r\n'
+        f'Host: {host}\r\n'
+        f'Authorization: Token {token}\r\n'
+        f'\r\n'
+    ).encode()
+    latencies: List[float] = []
+    errors = Counter()
+    clients = [Client(host, port, request) for _ in range(clients_count)]
+
+    async def connect(client: Client) -> None:
+        try:
+            await asyncio.wait_for(client.connect(), timeout)
+        except (OSError, asyncio.TimeoutError) as error:
+            errors[f'connect: {type(error).__name__}'] += 1
+
+    await asyncio.gather(*[connect(client) for client in clients])
+    opened = sum(client.writer is not None for client in clients)
+
+    async def load(client: Client) -> None:
+        for _ in range(requests_count):
+            started_at = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(client.get(), timeout)
+                if status != 200:
+                    errors[status] += 1
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as error:
+                errors[type(error).__name__] += 1
+                client.close()
+            latencies.append(time.perf_counter() - started_at)
+        client.close()
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[load(client) for client in clients])
+    return opened, time.perf_counter() - started_at, latencies, errors
+
+
+def run_profile(name: str, command: list, env: dict, port: int, **load_options) -> None:
+    server = subprocess.Popen(
+        command,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(f'http://127.0.0.1:{port}')
+        opened, elapsed, latencies, errors = asyncio.run(
+            run_clients(host='127.0.0.1', port=port, **load_options),
+        )
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    failed = sum(errors.values())
+    print(f'{name}, {load_options["clients_count"]} clients:')
+    print(f'  connections:    {opened} opened')
+    print(f'  requests:       {len(latencies)}, failed {failed}')
+    print(f'  errors:         {dict(errors)}')
+    print(f'  throughput:     {(len(latencies) - failed) / elapsed:.1f} requests/s')
+    print(f'  latency p50:    {percentile(latencies, 50) * 1000:.2f}ms')
+    print(f'  latency p99:    {percentile(latencies, 99) * 1000:.2f}ms')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--requests', type=int, default=5, help='requests per client')
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='transactions')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--db-threads', type=int, default=20, help='ASGI_DB_THREADS for uvicorn')
+    parser.add_argument('--transactions', type=int, default=1000)
+    parser.add_argument('--timeout', type=float, default=30, help='per request, seconds')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    raise_open_files_limit(max(args.clients))
+    setup_django()
+    with benchmark_database():
+        wallet_id, token = seed(args.transactions)
+        for clients_count in args.clients:
+            load_options = {
+                'path': ENDPOINTS[args.endpoint].format(wallet_id=wallet_id),
+                'token': token,
+                'clients_count': clients_count,
+                'requests_count': args.requests,
+                'timeout': args.timeout,
+            }
+            backlog = str(max(2048, clients_count))
+            run_profile(
+                f'uvicorn, 1 process, {args.db_threads} DB threads',
+                [
+                    sys.executable, '-m', 'uvicorn',
+                    'wallet_demo.asgi:application',
+                    '--host', '127.0.0.1',
+                    '--port', str(args.port),
+                    '--backlog', backlog,
+                    '--no-access-log',
+                ],
+                get_server_env(ASGI_DB_THREADS=str(args.db_threads)),
+                args.port,
+                **load_options,
+            )
+            run_profile(
+                f'gunicorn, {args.workers} sync workers',
+                [
+                    'gunicorn',
+                    '-c', 'python:wallet_demo.gunicorn_conf',
+                    '--backlog', backlog,
+                    'wallet_demo.wsgi',
+                ],
+                get_server_env(
+                    GUNICORN_BIND=f'127.0.0.1:{args.port}',
+                    WEB_CONCURRENCY=str(args.workers),
+                ),
+                args.port,
+                **load_options,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Чтение истории кошелька по HTTP: текущий запуск (runserver, DEBUG,
+новое соединение с БД на каждый запрос) против продакшн-профиля
+(gunicorn, settings_production, постоянные соединения).
+
+Оба сервера запускаются подпроцессами на тестовой базе бенчмарка.
+
+    python -m benchmarks.http_serving --clients 16 --requests 200 --workers 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+import requests
+
+from .utils import (
+    benchmark_database,
+    create_wallets,
+    percentile,
+    setup_django,
+)
+
+
+def seed(transactions_count: int):
+    from rest_framework.authtoken.models import Token
+
+    from wallet.models import Transaction
+
+    sender_wallet, recipient_wallet = create_wallets(
+        count=2,
+        currencies=['USD'],
+        init_balance=Decimal(1000),
+    )
+    Transaction.objects.bulk_create([
+        Transaction(
+            sender=sender_wallet,
+            recipient=recipient_wallet,
+            amount=Decimal('1.00'),
+        )
+        for _ in range(transactions_count)
+    ])
+    token = Token.objects.create(user=sender_wallet.owner)
+    return sender_wallet.pk, token.key
+
+
+def get_server_env(**overrides) -> dict:
+    from django.db import connection
+
+    database = connection.settings_dict
+    env = dict(os.environ)
+    env.update({
+        'DJANGO_SETTINGS_MODULE': 'wallet_demo.settings_production',
+        'DJANGO_SECRET_KEY': 'benchmark',
+        'DJANGO_LOG_LEVEL': 'WARNING',
+        'DB_NAME': database['NAME'],
+        'DB_USER': database['USER'],
+        'DB_PASSWORD': database['PASSWORD'],
+        'DB_HOST': database['HOST'],
+        'DB_PORT': str(database['PORT']),
+    })
+    env.update(overrides)
+    return env
+
+
+def wait_until_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{url}/health/', timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'Server at {url} did not start')
+
+
+def load(url: str, token: str, wallet_id: int, clients: int, requests_count: int):
+    latencies = []
+    errors = Counter()
+    lock = threading.Lock()
+
+    def client() -> None:
+        session = requests.Session()
+        session.headers['Authorization'] = f'Token {token}'
+        local_latencies = []
+        local_errors = Counter()
+        for _ in range(requests_count):
+            started_at = time.perf_counter()
+            try:
+                response = session.get(
+                    f'{url}/api/v1/transactions/{wallet_id}/',
+                    params={'limit': 50},
+                    timeout=30,
+                )
+                if response.status_code != 200:
+                    local_errors[response.status_code] += 1
+            except requests.RequestException as error:
+                local_errors[type(error).__name__] += 1
+            local_latencies.append(time.perf_counter() - started_at)
+        session.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.update(local_errors)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started_at, latencies, errors
+
+
+def run_profile(name: str, command: list, env: dict, url: str, **load_options) -> None:
+    server = subprocess.Popen(
+        command,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(url)
+        elapsed, latencies, errors = load(url=url, **load_options)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    print(f'{name}:')
+    print(f'  requests:       {len(latencies)}')
+    print(f'  errors:         {dict(errors)}')
+    print(f'  throughput:     {len(latencies) / elapsed:.1f} requests/s')
+    print(f'  latency p50:    {percentile(latencies, 50) * 1000:.2f}ms')
+    print(f'  latency p99:    {percentile(latencies, 99) * 1000:.2f}ms')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='requests per client')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--transactions', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        wallet_id, token = seed(args.transactions)
+        url = f'http://127.0.0.1:{args.port}'
+        load_options = {
+            'token': token,
+            'wallet_id': wallet_id,
+            'clients': args.clients,
+            'requests_count': args.requests,
+        }
+        run_profile(
+            'runserver, DEBUG, CONN_MAX_AGE=0',
+            [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{args.port}', '--noreload'],
+            get_server_env(DJANGO_DEBUG='1', DB_CONN_MAX_AGE='0'),
+            url,
+            **load_options,
+        )
+        run_profile(
+            f'gunicorn, {args.workers} workers, production settings',
+            [
+                'gunicorn',
+                '-c', 'python:wallet_demo.gunicorn_conf',
+                'wallet_demo.wsgi',
+            ],
+            get_server_env(
+                GUNICORN_BIND=f'127.0.0.1:{args.port}',
+                WEB_CONCURRENCY=str(args.workers),
+            ),
+            url,
+            **load_options,
+        )
+
+
+if __name__ == '__main__':
+    main()
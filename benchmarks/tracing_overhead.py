@@ -0,0 +1,126 @@
+"""
+Во что обходится трассировка переводу: время transfer_money_between_wallets
+без трассировки, с выключенной (TRACING_SAMPLE_RATE = 0) и с записью
+каждой трассы, плюс стоимость одного выключенного спана отдельно.
+
+Выключенная трассировка должна добавлять к переводу меньше 1%:
+
+    python -m benchmarks.tracing_overhead --transfers 2000
+"""
+import argparse
+import time
+import timeit
+from contextlib import ExitStack
+from decimal import Decimal
+from typing import List
+
+from .utils import (
+    benchmark_database,
+    create_wallets,
+    percentile,
+    setup_django,
+)
+
+
+# спанов на один перевод в режиме locking: корень и пять этапов
+SPANS_PER_TRANSFER = 6
+
+
+class DiscardingExporter:
+
+    def export(self, spans) -> None:
+        for span in spans:
+            span.to_dict('benchmark')
+
+
+def measure_transfers(wallets: List, transfers: int) -> List[float]:
+    from wallet.services import transfer_money_between_wallets
+
+    latencies = []
+    for number in range(transfers):
+        sender = wallets[number % len(wallets)]
+        recipient = wallets[(number + 1) % len(wallets)]
+        started_at = time.perf_counter()
+        transfer_money_between_wallets(
+            sender=sender.owner,
+            sender_wallet_id=sender.pk,
+            recipient_wallet_id=recipient.pk,
+            amount=Decimal('0.01'),
+        )
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+def measure_noop_span(tracer, repeat: int) -> float:
+    def trace():
+        with tracer.trace('transfer_money_between_wallets'):
+            with tracer.span('transfer.lock_wallets'):
+                pass
+
+    return timeit.timeit(trace, number=repeat) / repeat / 2
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transfers', type=int, default=2000)
+    parser.add_argument('--wallets', type=int, default=20)
+    parser.add_argument('--round-size', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from unittest import mock
+
+    from wallet_demo import tracing
+
+    with benchmark_database():
+        wallets = create_wallets(
+            count=args.wallets,
+            currencies=['USD'],
+            init_balance=Decimal(1000000),
+        )
+        # прогрев: соединение, кеш курсов
+        measure_transfers(wallets, 50)
+
+        noop_tracer = tracing.Tracer(sample_rate=0.0, exporter=DiscardingExporter())
+        modes = {
+            'without tracing': [
+                mock.patch.object(tracing.Tracer, name, lambda *args, **kwargs: tracing.NOOP_SPAN)
+                for name in ('trace', 'span', 'start_span')
+            ],
+            'disabled': [
+                mock.patch.object(tracing.tracer, 'sample_rate', 0.0),
+            ],
+            'every trace sampled': [
+                mock.patch.object(tracing.tracer, 'sample_rate', 1.0),
+                mock.patch.object(tracing.tracer, 'exporter', DiscardingExporter()),
+            ],
+        }
+        results = {name: [] for name in modes}
+        # режимы чередуются небольшими сериями, чтобы рост таблиц и
+        # фоновая работа БД не попадали в разницу между ними
+        for _ in range(args.transfers // args.round_size):
+            for name, patches in modes.items():
+                with ExitStack() as stack:
+                    for patch in patches:
+                        stack.enter_context(patch)
+                    results[name].extend(measure_transfers(wallets, args.round_size))
+
+    baseline = percentile(results['without tracing'], 50)
+    for name, latencies in results.items():
+        p50 = percentile(latencies, 50)
+        print(
+            f'{name:20} p50 {p50 * 1000:.3f}ms, '
+            f'p99 {percentile(latencies, 99) * 1000:.3f}ms, '
+            f'{(p50 / baseline - 1) * 100:+.2f}%',
+        )
+
+    span_cost = measure_noop_span(noop_tracer, 100000)
+    print(
+        f'disabled span: {span_cost * 1e9:.0f}ns, '
+        f'{SPANS_PER_TRANSFER} per transfer = '
+        f'{SPANS_PER_TRANSFER * span_cost / baseline * 100:.4f}% of p50 transfer',
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Сериализация страницы истории: TransactionSerializer с JSONRenderer
+против сборки JSON из кортежей values_list (dump_transactions_page).
+
+БД не нужна: строки создаются в памяти, сравнивается только время
+сериализации и совпадение результата.
+
+    python -m benchmarks.transaction_serializers --rows 10000 100000
+"""
+import argparse
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from .utils import setup_django
+
+
+def run(rows_count: int, repeats: int) -> bool:
+    from django.utils import timezone
+    from rest_framework.renderers import JSONRenderer
+
+    from api.exports import dump_transactions_page
+    from api.serializers import TransactionSerializer
+    from wallet.models import Transaction
+
+    started_at = timezone.now()
+    transactions = [
+        Transaction(
+            pk=rows_count - number,
+            sender_id=number % 100 + 1,
+            recipient_id=number % 37 + 1,
+            amount=(Decimal(number % 100000) / 100).quantize(Decimal('0.01')),
+            exchange_rate=Decimal('63.54691'),
+            created_at=started_at - timedelta(seconds=number),
+        )
+        for number in range(rows_count)
+    ]
+    rows = [
+        (
+            transaction.pk,
+            transaction.created_at,
+            transaction.sender_id,
+            transaction.recipient_id,
+            transaction.amount,
+            transaction.exchange_rate,
+        )
+        for transaction in transactions
+    ]
+
+    def drf() -> bytes:
+        return JSONRenderer().render({
+            'transactions': TransactionSerializer(transactions, many=True).data,
+            'next': None,
+            'status': 200,
+        })
+
+    def fast() -> bytes:
+        return dump_transactions_page(rows, None)
+
+    timings = {}
+    for name, serialize in (('drf', drf), ('fast', fast)):
+        best = None
+        for _ in range(repeats):
+            serialize_started_at = time.perf_counter()
+            serialize()
+            elapsed = time.perf_counter() - serialize_started_at
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+
+    same = drf() == fast()
+    print(f'rows:             {rows_count}')
+    print(f'drf:              {timings["drf"] * 1000:.1f}ms')
+    print(f'fast:             {timings["fast"] * 1000:.1f}ms')
+    print(f'speedup:          {timings["drf"] / timings["fast"]:.1f}x')
+    print(f'same output:      {same}')
+    return same
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    same = True
+    for rows_count in args.rows:
+        same = run(rows_count=rows_count, repeats=args.repeats) and same
+    raise SystemExit(0 if same else 1)
+
+
+if __name__ == '__main__':
+    main()
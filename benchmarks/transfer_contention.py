@@ -0,0 +1,126 @@
+"""
+Переводы между небольшим числом кошельков из нескольких потоков.
+
+Проверяет, что при конкуренции за одни и те же строки не теряются
+обновления и не возникает перерасход, и измеряет пропускную способность.
+
+    python -m benchmarks.transfer_contention --threads 8 --transfers 200 --wallets 2
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from .utils import (
+    benchmark_database,
+    create_wallets,
+    percentile,
+    setup_django,
+)
+
+
+def run(threads: int, transfers: int, wallets_count: int, amount: Decimal) -> bool:
+    from django.db import connection
+    from django.db.models import Sum
+
+    from wallet.models import (
+        Transaction,
+        Wallet,
+    )
+    from wallet.services import transfer_money_between_wallets
+
+    init_balance = Decimal(1000)
+    wallets = create_wallets(
+        count=wallets_count,
+        currencies=['USD'],
+        init_balance=init_balance,
+    )
+    latencies = []
+    errors = Counter()
+    lock = threading.Lock()
+
+    def worker(seed: int) -> None:
+        generator = random.Random(seed)
+        local_latencies = []
+        local_errors = Counter()
+        try:
+            for _ in range(transfers):
+                sender_wallet, recipient_wallet = generator.sample(wallets, 2)
+                started_at = time.perf_counter()
+                try:
+                    transfer_money_between_wallets(
+                        sender=sender_wallet.owner,
+                        sender_wallet_id=sender_wallet.pk,
+                        recipient_wallet_id=recipient_wallet.pk,
+                        amount=amount,
+                    )
+                except Exception as error:
+                    local_errors[type(error).__name__] += 1
+                local_latencies.append(time.perf_counter() - started_at)
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.update(local_errors)
+
+    workers = [
+        threading.Thread(target=worker, args=(seed,))
+        for seed in range(threads)
+    ]
+    started_at = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    wallet_ids = [wallet.pk for wallet in wallets]
+    balances = dict(Wallet.objects.filter(pk__in=wallet_ids).values_list('pk', 'balance'))
+    sent = dict(
+        Transaction.objects.filter(sender_id__in=wallet_ids)
+        .values_list('sender_id').annotate(total=Sum('amount'))
+    )
+    received = dict(
+        Transaction.objects.filter(recipient_id__in=wallet_ids)
+        .values_list('recipient_id').annotate(total=Sum('amount'))
+    )
+    consistent = all(
+        balances[pk] == init_balance - sent.get(pk, 0) + received.get(pk, 0) and balances[pk] >= 0
+        for pk in wallet_ids
+    )
+    consistent = consistent and sum(balances.values()) == init_balance * wallets_count
+
+    total = threads * transfers
+    print(f'transfers:        {total}')
+    print(f'errors:           {dict(errors)}')
+    print(f'elapsed:          {elapsed:.3f}s')
+    print(f'throughput:       {total / elapsed:.1f} transfers/s')
+    print(f'latency p50:      {percentile(latencies, 50) * 1000:.2f}ms')
+    print(f'latency p99:      {percentile(latencies, 99) * 1000:.2f}ms')
+    print(f'balances correct: {consistent}')
+    return consistent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--transfers', type=int, default=100, help='transfers per thread')
+    parser.add_argument('--wallets', type=int, default=2)
+    parser.add_argument('--amount', type=Decimal, default=Decimal('1.00'))
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        consistent = run(
+            threads=args.threads,
+            transfers=args.transfers,
+            wallets_count=args.wallets,
+            amount=args.amount,
+        )
+    raise SystemExit(0 if consistent else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,527 @@
+"""
+Пропускная способность переводов: transfer_money_between_wallets
+напрямую и POST /api/v1/transmit_money/ под gunicorn.
+
+N клиентов параллельно переводят деньги между кошельками. Доля
+переводов на «горячие» кошельки (--hot-share) и доля переводов с
+конвертацией валют (--fx-share) настраиваются. Отчёт: пропускная
+способность, задержки p50/p95/p99, ожидание блокировок строк и проверка,
+что по каждому кошельку баланс сходится с историей переводов.
+
+Результаты пишутся в JSON (--output) и сравниваются с прошлым запуском
+(--baseline):
+
+    python -m benchmarks.transfer_throughput --clients 16 --transfers 200 \\
+        --hot-share 0.5 --fx-share 0.3 --target service http --output after.json \\
+        --baseline before.json
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import (
+    Counter,
+    defaultdict,
+)
+from datetime import datetime
+from decimal import Decimal
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import requests
+
+from .http_serving import (
+    get_server_env,
+    wait_until_ready,
+)
+from .utils import (
+    benchmark_database,
+    create_wallets,
+    percentile,
+    setup_django,
+)
+
+
+# курсы к EUR, из них выводятся кросс-курсы всех пар
+PIVOT_RATES = {
+    'USD': 1.1,
+    'RUB': 70.5,
+    'GBP': 0.85,
+}
+INIT_BALANCE = Decimal(1000000)
+
+Transfer = Tuple['Wallet', 'Wallet']
+
+
+def create_exchange_rates() -> None:
+    from wallet.services import (
+        create_exchange_rate,
+        derive_cross_rates,
+        exchange_rates_cache,
+    )
+
+    rates_by_currency = derive_cross_rates(pivot_currency='EUR', pivot_rates=PIVOT_RATES)
+    for currency, rates in rates_by_currency.items():
+        create_exchange_rate(currency=currency, exchange_rates=rates)
+    exchange_rates_cache.invalidate()
+
+
+def create_benchmark_wallets(
+        prefix: str,
+        wallets_count: int,
+        hot_wallets_count: int,
+        currencies: Sequence[str],
+        hot_shards: int,
+) -> Tuple[List['Wallet'], Dict[Tuple[bool, str], List['Wallet']]]:
+    from wallet.services import enable_wallet_balance_shards
+
+    # первые hot_wallets_count кошельков каждой валюты - горячие
+    wallets = create_wallets(
+        count=wallets_count,
+        currencies=currencies,
+        init_balance=INIT_BALANCE,
+        prefix=prefix,
+    )
+    groups = defaultdict(list)
+    for wallet in wallets:
+        is_hot = len(groups[True, wallet.currency]) < hot_wallets_count
+        groups[is_hot, wallet.currency].append(wallet)
+    if hot_shards:
+        for currency in currencies:
+            for wallet in groups[True, currency]:
+                enable_wallet_balance_shards(wallet.pk, hot_shards)
+    return wallets, groups
+
+
+def plan_transfers(
+        groups: Dict[Tuple[bool, str], List['Wallet']],
+        currencies: Sequence[str],
+        count: int,
+        hot_share: float,
+        fx_share: float,
+        seed: int,
+) -> List[Transfer]:
+    # отправители - обычные кошельки, горячие только принимают переводы,
+    # как кошельки магазинов
+    generator = random.Random(seed)
+    senders = [wallet for currency in currencies for wallet in groups[False, currency]]
+    transfers = []
+    while len(transfers) < count:
+        sender_wallet = generator.choice(senders)
+        currency = sender_wallet.currency
+        if len(currencies) > 1 and generator.random() < fx_share:
+            currency = generator.choice([other for other in currencies if other != currency])
+        recipients = groups[generator.random() < hot_share, currency]
+        if not recipients:
+            continue
+        recipient_wallet = generator.choice(recipients)
+        if recipient_wallet.pk != sender_wallet.pk:
+            transfers.append((sender_wallet, recipient_wallet))
+    return transfers
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Раз в interval секунд считает соединения с тестовой базой, которые
+    ждут блокировку (pg_stat_activity.wait_event_type = 'Lock').
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        from django.db import connection
+
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.wait(self.interval):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                    )
+                    self.samples.append(cursor.fetchone()[0])
+        finally:
+            connection.close()
+
+    def stop(self) -> Dict[str, float]:
+        self.stopped.set()
+        self.join()
+        return {
+            'mean': sum(self.samples) / len(self.samples) if self.samples else 0.0,
+            'max': max(self.samples, default=0),
+            'samples': len(self.samples),
+        }
+
+
+def time_lock_statements(lock_waits: List[float]) -> Callable:
+    # время запросов, которые берут блокировку строк кошельков: SELECT ...
+    # FOR UPDATE в режиме locking и UPDATE в режиме returning; почти всё
+    # это время при конкуренции - ожидание блокировки
+    def wrapper(execute, sql, params, many, context):
+        if 'FOR UPDATE' not in sql and 'UPDATE ' not in sql:
+            return execute(sql, params, many, context)
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            lock_waits.append(time.perf_counter() - started_at)
+
+    return wrapper
+
+
+def transfer_via_service(amount: Decimal) -> Callable[['Wallet', 'Wallet'], Optional[str]]:
+    from wallet.services import transfer_money_between_wallets
+
+    def transfer(sender_wallet, recipient_wallet) -> Optional[str]:
+        try:
+            transfer_money_between_wallets(
+                sender=sender_wallet.owner,
+                sender_wallet_id=sender_wallet.pk,
+                recipient_wallet_id=recipient_wallet.pk,
+                amount=amount,
+            )
+        except Exception as error:
+            return type(error).__name__
+        return None
+
+    return transfer
+
+
+def transfer_via_http(url: str, tokens: Dict[int, str], amount: Decimal) -> Callable:
+    local = threading.local()
+
+    def transfer(sender_wallet, recipient_wallet) -> Optional[str]:
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        try:
+            response = session.post(
+                f'{url}/api/v1/transmit_money/',
+                json={
+                    'sender': sender_wallet.pk,
+                    'recipient': recipient_wallet.pk,
+                    'amount': str(amount),
+                },
+                headers={'Authorization': f'Token {tokens[sender_wallet.owner_id]}'},
+                timeout=30,
+            )
+        except requests.RequestException as error:
+            return type(error).__name__
+        if response.status_code != 200:
+            return f'HTTP {response.status_code}'
+        return None
+
+    return transfer
+
+
+def drive(
+        transfer: Callable,
+        plans: List[List[Transfer]],
+        time_locks: bool,
+        sample_interval: float,
+) -> Tuple[float, List[float], List[float], Counter, Dict[str, float]]:
+    from django.db import connection
+
+    latencies = []
+    lock_waits = []
+    errors = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(len(plans) + 1)
+
+    def client(plan: List[Transfer]) -> None:
+        local_latencies = []
+        local_lock_waits = []
+        local_errors = Counter()
+        wrapper = time_lock_statements(local_lock_waits)
+        try:
+            start.wait()
+            with connection.execute_wrapper(wrapper):
+                for sender_wallet, recipient_wallet in plan:
+                    lock_waits_before = len(local_lock_waits)
+                    started_at = time.perf_counter()
+                    error = transfer(sender_wallet, recipient_wallet)
+                    local_latencies.append(time.perf_counter() - started_at)
+                    if error is not None:
+                        local_errors[error] += 1
+                    # на перевод - суммарное время его блокирующих запросов
+                    if time_locks:
+                        local_lock_waits[lock_waits_before:] = [
+                            sum(local_lock_waits[lock_waits_before:]),
+                        ]
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            lock_waits.extend(local_lock_waits)
+            errors.update(local_errors)
+
+    threads = [threading.Thread(target=client, args=(plan,)) for plan in plans]
+    for thread in threads:
+        thread.start()
+    sampler = LockWaitSampler(sample_interval)
+    sampler.start()
+    start.wait()
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+    return elapsed, latencies, lock_waits if time_locks else [], errors, sampler.stop()
+
+
+def check_conservation(wallets: List['Wallet'], succeeded: int) -> Dict:
+    from wallet.models import Transaction
+    from wallet.services import (
+        convert_amount,
+        get_ledger_balance,
+        get_wallet_balance,
+    )
+
+    # баланс каждого кошелька = начальный - списания + зачисления после
+    # конвертации = баланс по журналу проводок, и ни один перевод не
+    # потерян и не продублирован
+    wallet_ids = [wallet.pk for wallet in wallets]
+    expected = {wallet.pk: wallet.initial_balance for wallet in wallets}
+    transactions = Transaction.objects.filter(sender_id__in=wallet_ids).values_list(
+        'sender_id', 'recipient_id', 'amount', 'exchange_rate',
+    )
+    transactions_count = 0
+    for sender_id, recipient_id, amount, exchange_rate in transactions.iterator():
+        transactions_count += 1
+        expected[sender_id] -= amount
+        expected[recipient_id] += convert_amount(amount, exchange_rate)
+    mismatched = []
+    negative = []
+    for wallet in wallets:
+        wallet.refresh_from_db()
+        balance = get_wallet_balance(wallet)
+        ledger_balance = get_ledger_balance(wallet)
+        if not balance == ledger_balance == expected[wallet.pk]:
+            mismatched.append({
+                'wallet': wallet.pk,
+                'balance': str(balance),
+                'ledger_balance': str(ledger_balance),
+                'expected': str(expected[wallet.pk]),
+            })
+        if wallet.balance < 0:
+            negative.append(wallet.pk)
+    return {
+        'consistent': not mismatched and not negative and transactions_count == succeeded,
+        'transactions': transactions_count,
+        'succeeded_transfers': succeeded,
+        'mismatched_wallets': mismatched,
+        'negative_wallets': negative,
+    }
+
+
+def summarize(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    return {
+        'p50': percentile(values, 50) * 1000,
+        'p95': percentile(values, 95) * 1000,
+        'p99': percentile(values, 99) * 1000,
+        'max': max(values) * 1000,
+    }
+
+
+def run_target(target: str, args: argparse.Namespace, run_number: int) -> Dict:
+    from django.conf import settings
+    from rest_framework.authtoken.models import Token
+
+    currencies = args.currencies
+    wallets, groups = create_benchmark_wallets(
+        prefix=f'bench-{target}-{run_number}',
+        wallets_count=args.wallets,
+        hot_wallets_count=args.hot_wallets,
+        currencies=currencies,
+        hot_shards=args.hot_shards,
+    )
+    plans = [
+        plan_transfers(
+            groups=groups,
+            currencies=currencies,
+            count=args.transfers,
+            hot_share=args.hot_share,
+            fx_share=args.fx_share,
+            seed=seed,
+        )
+        for seed in range(args.clients)
+    ]
+
+    server = None
+    if target == 'service':
+        settings.WALLET_TRANSFER_MODE = args.mode
+        transfer = transfer_via_service(args.amount)
+    else:
+        tokens = Token.objects.bulk_create([
+            Token(key=Token().generate_key(), user_id=wallet.owner_id)
+            for wallet in wallets
+        ])
+        url = f'http://127.0.0.1:{args.port}'
+        server = subprocess.Popen(
+            ['gunicorn', '-c', 'python:wallet_demo.gunicorn_conf', 'wallet_demo.wsgi'],
+            env=get_server_env(
+                GUNICORN_BIND=f'127.0.0.1:{args.port}',
+                WEB_CONCURRENCY=str(args.workers),
+                WALLET_TRANSFER_MODE=args.mode,
+            ),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        wait_until_ready(url)
+        transfer = transfer_via_http(
+            url=url,
+            tokens={token.user_id: token.key for token in tokens},
+            amount=args.amount,
+        )
+    try:
+        elapsed, latencies, lock_waits, errors, lock_waiters = drive(
+            transfer=transfer,
+            plans=plans,
+            time_locks=target == 'service',
+            sample_interval=args.sample_interval,
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    total = len(latencies)
+    succeeded = total - sum(errors.values())
+    return {
+        'target': target,
+        'transfers': total,
+        'succeeded': succeeded,
+        'errors': dict(errors),
+        'elapsed_s': elapsed,
+        'throughput': succeeded / elapsed,
+        'latency_ms': summarize(latencies),
+        'lock_wait_ms': summarize(lock_waits),
+        'lock_waiters': lock_waiters,
+        'conservation': check_conservation(wallets, succeeded),
+    }
+
+
+def print_result(result: Dict, baseline: Optional[Dict]) -> None:
+    def change(value: float, key: str, metric: Optional[str] = None) -> str:
+        if baseline is None:
+            return ''
+        before = baseline[key] if metric is None else (baseline[key] or {}).get(metric)
+        if not before:
+            return ''
+        return f' ({(value - before) / before * 100:+.1f}%)'
+
+    latency = result['latency_ms']
+    conservation = result['conservation']
+    print(f'{result["target"]}:')
+    print(f'  transfers:      {result["transfers"]}, succeeded {result["succeeded"]}')
+    print(f'  errors:         {result["errors"]}')
+    print(f'  throughput:     {result["throughput"]:.1f} transfers/s'
+          f'{change(result["throughput"], "throughput")}')
+    for metric in ('p50', 'p95', 'p99'):
+        print(f'  latency {metric}:    {latency[metric]:.2f}ms'
+              f'{change(latency[metric], "latency_ms", metric)}')
+    if result['lock_wait_ms'] is not None:
+        print(f'  lock wait p50:  {result["lock_wait_ms"]["p50"]:.2f}ms, '
+              f'p99 {result["lock_wait_ms"]["p99"]:.2f}ms')
+    print(f'  lock waiters:   mean {result["lock_waiters"]["mean"]:.2f}, '
+          f'max {result["lock_waiters"]["max"]}')
+    print(f'  conservation:   {"ok" if conservation["consistent"] else "FAILED"}')
+    if not conservation['consistent']:
+        print(f'    {json.dumps(conservation, indent=2)}')
+
+
+def get_git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--transfers', type=int, default=200, help='transfers per client')
+    parser.add_argument('--wallets', type=int, default=200)
+    parser.add_argument('--hot-wallets', type=int, default=1, help='hot wallets per currency')
+    parser.add_argument('--hot-share', type=float, default=0.2,
+                        help='share of transfers to hot wallets')
+    parser.add_argument('--hot-shards', type=int, default=0,
+                        help='split hot wallet balances into this many shards')
+    parser.add_argument('--fx-share', type=float, default=0.3,
+                        help='share of transfers between different currencies')
+    parser.add_argument('--currencies', nargs='+', default=['USD', 'EUR'])
+    parser.add_argument('--amount', type=Decimal, default=Decimal('1.00'))
+    parser.add_argument('--mode', choices=['locking', 'returning'], default='locking',
+                        help='WALLET_TRANSFER_MODE')
+    parser.add_argument('--target', nargs='+', choices=['service', 'http'], default=['service'])
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers for http')
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--sample-interval', type=float, default=0.01,
+                        help='lock waiters sampling interval, seconds')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare with results of a previous run')
+    args = parser.parse_args()
+
+    baselines = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baselines = {
+                result['target']: result
+                for result in json.load(baseline_file)['results']
+            }
+
+    setup_django()
+    with benchmark_database():
+        create_exchange_rates()
+        results = []
+        for run_number, target in enumerate(args.target):
+            result = run_target(target, args, run_number)
+            print_result(result, baselines.get(target))
+            results.append(result)
+
+    if args.output:
+        parameters = {
+            name: str(value) if isinstance(value, Decimal) else value
+            for name, value in vars(args).items()
+            if name not in ('output', 'baseline')
+        }
+        with open(args.output, 'w') as output_file:
+            json.dump(
+                {
+                    'benchmark': 'transfer_throughput',
+                    'created_at': datetime.now().isoformat(),
+                    'revision': get_git_revision(),
+                    'python': sys.version.split()[0],
+                    'parameters': parameters,
+                    'results': results,
+                },
+                output_file,
+                indent=2,
+            )
+    consistent = all(result['conservation']['consistent'] for result in results)
+    raise SystemExit(0 if consistent else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import math
+import os
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import (
+    List,
+    Sequence,
+)
+
+import django
+
+
+def setup_django() -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wallet_demo.settings')
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(keepdb: bool = False):
+    # бенчмарки работают в отдельной тестовой базе, как и pytest,
+    # чтобы не трогать данные рабочей базы
+    from django.test.utils import (
+        setup_databases,
+        teardown_databases,
+    )
+
+    old_config = setup_databases(
+        verbosity=0,
+        interactive=False,
+        keepdb=keepdb,
+    )
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0, keepdb=keepdb)
+
+
+def create_wallets(
+        count: int,
+        currencies: Sequence[str],
+        init_balance: Decimal,
+        prefix: str = 'bench',
+) -> List['Wallet']:
+    from customauth.models import CustomUser
+    from wallet.models import Wallet
+
+    # пароль не нужен, поэтому пропускаем дорогое хеширование
+    users = CustomUser.objects.bulk_create([
+        CustomUser(
+            email=f'{prefix}-{number}@example.com',
+            password='!',
+        )
+        for number in range(count)
+    ])
+    users = CustomUser.objects.filter(
+        email__in=[user.email for user in users],
+    ).order_by('pk')
+    Wallet.objects.bulk_create([
+        Wallet(
+            owner=user,
+            currency=currencies[number % len(currencies)],
+            balance=init_balance,
+            initial_balance=init_balance,
+        )
+        for number, user in enumerate(users)
+    ])
+    return list(
+        Wallet.objects.filter(owner__in=users).select_related('owner').order_by('pk'),
+    )
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
@@ -0,0 +1,75 @@
+from typing import Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import (
+    LRUCache,
+    SharedCache,
+)
+from .models import CustomUser
+
+
+def build_token_cache():
+    if settings.AUTH_TOKEN_CACHE_ALIAS is not None:
+        return SharedCache(
+            alias=settings.AUTH_TOKEN_CACHE_ALIAS,
+            ttl=settings.AUTH_TOKEN_CACHE_TTL,
+            prefix='auth-token:',
+        )
+    return LRUCache(
+        max_size=settings.AUTH_TOKEN_CACHE_SIZE,
+        ttl=settings.AUTH_TOKEN_CACHE_TTL,
+    )
+
+
+token_cache = build_token_cache()
+
+
+# хеш пароля в кеш не попадает: у загруженного из кеша пользователя
+# поле password отложенное и при обращении читается из БД
+CACHED_USER_FIELDS = [
+    field.attname
+    for field in CustomUser._meta.concrete_fields
+    if field.attname != 'password'
+]
+
+
+def dump_user(user: CustomUser) -> tuple:
+    return tuple(
+        getattr(user, field_name)
+        for field_name in CACHED_USER_FIELDS
+    )
+
+
+def load_user(values: tuple) -> CustomUser:
+    # каждый запрос получает свой экземпляр пользователя, кешируются
+    # только значения полей
+    return CustomUser.from_db(DEFAULT_DB_ALIAS, CACHED_USER_FIELDS, values)
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который держит соответствие токена и
+    пользователя в кеше и не ходит в БД на каждый запрос.
+
+    Записи удаляются сигналами при удалении токена и при сохранении или
+    удалении пользователя (см. customauth.signals). Изменения в обход
+    сигналов, например QuerySet.update(), видны не позже чем через
+    AUTH_TOKEN_CACHE_TTL. Так же запаздывают и изменения через сигналы,
+    если кеш в памяти процесса (AUTH_TOKEN_CACHE_ALIAS = None), а
+    процессов несколько: сигнал сбрасывает запись только у себя.
+    """
+
+    def authenticate_credentials(self, key: str) -> Tuple[CustomUser, Token]:
+        cached = token_cache.get(key)
+        if cached is not None:
+            user_values, created = cached
+            user = load_user(user_values)
+            return user, Token(key=key, user=user, created=created)
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (dump_user(user), token.created))
+        return user, token
@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Optional,
+)
+
+from django.core.cache import caches
+
+
+class LRUCache:
+    """
+    Ограниченный по размеру кеш в памяти процесса с вытеснением давно
+    не использованных записей и сроком жизни записи.
+    """
+
+    def __init__(
+            self,
+            max_size: int,
+            ttl: float,
+            timer: Callable[[], float] = time.monotonic,
+    ):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._timer = timer
+        self._lock = Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if self._timer() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, self._timer() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SharedCache:
+    """
+    Тот же интерфейс поверх кеша Django из CACHES: записи и их удаление
+    видны всем процессам, которые к нему подключены.
+    """
+
+    def __init__(self, alias: str, ttl: float, prefix: str):
+        self._cache = caches[alias]
+        self._ttl = ttl
+        self._prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(self._prefix + key)
+
+    def set(self, key: str, value: Any) -> None:
+        self._cache.set(self._prefix + key, value, self._ttl)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(self._prefix + key)
+
+    def clear(self) -> None:
+        # чужие записи общего кеша не трогаем, устаревшие истекут по TTL
+        pass
@@ -0,0 +1,25 @@
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .models import CustomUser
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance: Token, **kwargs) -> None:
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_user_tokens(sender, instance: CustomUser, created: bool = False, **kwargs) -> None:
+    # в кеше лежат поля пользователя, в том числе is_active, поэтому
+    # любое изменение пользователя сбрасывает его токены
+    if created:
+        return
+    for key in Token.objects.filter(user_id=instance.pk).values_list('key', flat=True):
+        token_cache.delete(key)
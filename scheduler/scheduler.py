@@ -1,7 +1,14 @@
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from wallet.services import update_exchange_rates
+from api.services import delete_expired_idempotency_keys
+from wallet.services import (
+    compact_exchange_rates,
+    create_balance_snapshots,
+    create_ledger_checkpoints,
+    fold_balance_shards,
+    update_exchange_rates,
+)
 
 
 list_jobs = (
@@ -10,6 +17,31 @@ list_jobs = (
         'trigger': CronTrigger.from_crontab('*/3 * * * *'),
         'replace_existing': True,
     },
+    {
+        'func': compact_exchange_rates,
+        'trigger': CronTrigger.from_crontab('30 * * * *'),
+        'replace_existing': True,
+    },
+    {
+        'func': delete_expired_idempotency_keys,
+        'trigger': CronTrigger.from_crontab('*/10 * * * *'),
+        'replace_existing': True,
+    },
+    {
+        'func': fold_balance_shards,
+        'trigger': CronTrigger.from_crontab('* * * * *'),
+        'replace_existing': True,
+    },
+    {
+        'func': create_ledger_checkpoints,
+        'trigger': CronTrigger.from_crontab('*/5 * * * *'),
+        'replace_existing': True,
+    },
+    {
+        'func': create_balance_snapshots,
+        'trigger': CronTrigger.from_crontab('10 0 * * *'),
+        'replace_existing': True,
+    },
 )
 
 
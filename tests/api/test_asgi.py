@@ -0,0 +1,229 @@
+import asyncio
+import json
+from decimal import Decimal
+
+import pytest
+from django.core.wsgi import get_wsgi_application
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (
+    APIRequestFactory,
+    force_authenticate,
+)
+
+from api.asgi import BoundedWSGIApplication
+from api.views import WalletTransactionsView
+from wallet.services import create_transaction
+
+
+@pytest.fixture
+def application():
+    application = BoundedWSGIApplication(get_wsgi_application(), threads=2)
+    yield application
+    application.executor.shutdown()
+
+
+def make_scope(path, query_string=b'', token=None):
+    headers = [(b'host', b'testserver')]
+    if token is not None:
+        headers.append((b'authorization', f'Token {token}'.encode()))
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'query_string': query_string,
+        'headers': headers,
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 50000),
+    }
+
+
+async def call(application, scope):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    # WSGIResponder передаёт имена заголовков в том регистре, что и Django
+    headers = {name.lower(): value for name, value in messages[0]['headers']}
+    return messages[0]['status'], headers, body
+
+
+def request(application, *args, **kwargs):
+    return asyncio.run(call(application, make_scope(*args, **kwargs)))
+
+
+def create_wallets_with_transactions(two_wallets, count):
+    user_1, wallet_1, wallet_2 = two_wallets
+    for _ in range(count):
+        create_transaction(
+            sender=wallet_1,
+            recipient=wallet_2,
+            amount=Decimal('10.50'),
+            exchange_rate=Decimal('63.54691'),
+        )
+    token = Token.objects.create(user=user_1)
+    return user_1, wallet_1, token.key
+
+
+@pytest.mark.django_db(transaction=True)
+def test_transactions__proper_call__same_body_as_wsgi_view(application, two_wallets):
+    # arrange
+    user_1, wallet_1, token = create_wallets_with_transactions(two_wallets, 3)
+    wsgi_request = APIRequestFactory().get(
+        f'/api/v1/transactions/{wallet_1.pk}/',
+        {'limit': 2},
+    )
+    force_authenticate(wsgi_request, user=user_1)
+    wsgi_response = WalletTransactionsView.as_view()(wsgi_request, wallet_1.pk)
+
+    # act
+    status, headers, body = request(
+        application,
+        f'/api/v1/transactions/{wallet_1.pk}/',
+        query_string=b'limit=2',
+        token=token,
+    )
+
+    # assert
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert body == wsgi_response.content
+    assert len(json.loads(body)['transactions']) == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_transactions__invalid_limit__return_400(application, two_wallets):
+    # arrange
+    _, wallet_1, token = create_wallets_with_transactions(two_wallets, 1)
+
+    # act
+    status, _, body = request(
+        application,
+        f'/api/v1/transactions/{wallet_1.pk}/',
+        query_string=b'limit=0',
+        token=token,
+    )
+
+    # assert
+    assert status == 400
+    assert json.loads(body)['status'] == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_balance__proper_call__return_200_and_balance(application, two_wallets):
+    # arrange
+    _, wallet_1, token = create_wallets_with_transactions(two_wallets, 0)
+
+    # act
+    status, _, body = request(
+        application,
+        f'/api/v1/wallets/{wallet_1.pk}/balance/',
+        token=token,
+    )
+
+    # assert
+    assert status == 200
+    assert json.loads(body) == {
+        'balance': {
+            'wallet': wallet_1.pk,
+            'currency': 'USD',
+            'balance': '50.00',
+        },
+        'status': 200,
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('token', [None, 'unknown'])
+def test_balance__not_authenticated__return_401(application, two_wallets, token):
+    # arrange
+    _, wallet_1, _ = create_wallets_with_transactions(two_wallets, 0)
+
+    # act
+    status, headers, body = request(
+        application,
+        f'/api/v1/wallets/{wallet_1.pk}/balance/',
+        token=token,
+    )
+
+    # assert
+    assert status == 401
+    assert headers[b'www-authenticate'] == b'Token'
+    assert 'detail' in json.loads(body)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_other_paths__served_by_django(application, two_wallets):
+    # arrange
+    _, wallet_1, token = create_wallets_with_transactions(two_wallets, 2)
+
+    # act
+    status, _, body = request(
+        application,
+        f'/api/v1/wallets/{wallet_1.pk}/statement/',
+        query_string=b'start=2020-01-01T00:00:00Z',
+        token=token,
+    )
+
+    # assert
+    assert status == 200
+    assert json.loads(body)['statement']['outgoing'] == '21.00'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_balance__more_requests_than_threads__all_served(application, two_wallets):
+    # arrange
+    _, wallet_1, token = create_wallets_with_transactions(two_wallets, 0)
+    scope = make_scope(f'/api/v1/wallets/{wallet_1.pk}/balance/', token=token)
+
+    async def call_many():
+        return await asyncio.gather(*[
+            call(application, scope)
+            for _ in range(50)
+        ])
+
+    # act
+    responses = asyncio.run(call_many())
+
+    # assert
+    assert [status for status, _, _ in responses] == [200] * 50
+    assert len(application.executor._threads) <= 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_balance__request_id__returned_in_response(application, two_wallets):
+    # arrange
+    _, wallet_1, token = create_wallets_with_transactions(two_wallets, 0)
+    scope = make_scope(f'/api/v1/wallets/{wallet_1.pk}/balance/', token=token)
+    scope['headers'].append((b'x-request-id', b'req-42'))
+
+    # act
+    status, headers, _ = asyncio.run(call(application, scope))
+
+    # assert
+    assert status == 200
+    assert headers[b'x-request-id'] == b'req-42'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_balance__disallowed_host__rejected_by_django(application, settings, two_wallets):
+    # arrange
+    _, wallet_1, token = create_wallets_with_transactions(two_wallets, 0)
+    settings.ALLOWED_HOSTS = ['api.example.com']
+
+    # act
+    status, _, _ = request(
+        application,
+        f'/api/v1/wallets/{wallet_1.pk}/balance/',
+        token=token,
+    )
+
+    # assert
+    assert status == 400
@@ -0,0 +1,93 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+from api.provisioning import (
+    CSV,
+    NDJSON,
+    provision_users,
+)
+from customauth.models import CustomUser
+from customauth.services import create_user
+from wallet.models import Wallet
+
+
+@pytest.fixture
+def fast_hasher(settings):
+    settings.PASSWORD_HASHERS = [
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ]
+
+
+@pytest.mark.django_db
+def test_provision_users__csv__create_users_and_wallets(tmp_path, fast_hasher):
+    # arrange
+    path = tmp_path / 'users.csv'
+    path.write_text(
+        'email,password,currency,init_balance\n'
+        'first@test.com,secret1,USD,10.5\n'
+        'second@test.com,secret2,RUB,0\n'
+        'broken@test.com,secret3,XXX,1\n'
+        'first@test.com,secret1,USD,10.5\n'
+    )
+
+    # act
+    progress = provision_users(
+        path=str(path),
+        file_format=CSV,
+        processes=2,
+        chunk_size=1,
+    )
+
+    # assert
+    assert (progress.read, progress.created, progress.skipped, progress.invalid) == (4, 2, 1, 1)
+    user = CustomUser.objects.get(email='first@test.com')
+    assert user.check_password('secret1')
+    wallet = Wallet.objects.get(owner=user)
+    assert wallet.currency == 'USD'
+    assert wallet.balance == wallet.initial_balance == Decimal('10.50')
+    assert not CustomUser.objects.filter(email='broken@test.com').exists()
+
+
+@pytest.mark.django_db
+def test_provision_users__rerun__skip_existing_users(tmp_path, fast_hasher):
+    # arrange
+    create_user(
+        email='first@test.com',
+        password='old',
+    )
+    path = tmp_path / 'users.ndjson'
+    path.write_text('\n'.join(
+        json.dumps({'email': email, 'password': 'secret', 'currency': 'EUR', 'init_balance': 1})
+        for email in ['first@test.com', 'second@test.com', 'third@test.com']
+    ) + '\nnot json\n')
+
+    # act
+    first = provision_users(path=str(path), file_format=NDJSON, processes=1, chunk_size=2)
+    second = provision_users(path=str(path), file_format=NDJSON, processes=1, chunk_size=2)
+
+    # assert
+    assert (first.created, first.skipped, first.invalid) == (2, 1, 1)
+    assert (second.created, second.skipped, second.invalid) == (0, 3, 1)
+    assert CustomUser.objects.get(email='first@test.com').check_password('old')
+    assert Wallet.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_provision_users_command__proper_call__report_progress(tmp_path, fast_hasher, capsys):
+    # arrange
+    path = tmp_path / 'users.csv'
+    path.write_text(
+        'email,password,currency,init_balance\n'
+        'first@test.com,secret1,USD,10\n'
+    )
+
+    # act
+    call_command('provision_users', str(path), '--processes', '1')
+
+    # assert
+    output = capsys.readouterr().out
+    assert 'created 1' in output
+    assert 'rows/s' in output
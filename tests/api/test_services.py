@@ -1,7 +1,16 @@
 import pytest
+from datetime import timedelta
 from decimal import Decimal
+from unittest.mock import MagicMock
 
-from api.services import create_user_and_wallet
+from django.utils import timezone
+
+from api.models import IdempotencyKey
+from api.services import (
+    create_user_and_wallet,
+    delete_expired_idempotency_keys,
+    run_idempotently,
+)
 from customauth.services import create_user
 from wallet.exceptions import WalletCreationException
 
@@ -74,3 +83,87 @@ def test_create_user_and_wallet__unknown_currency__user_created(mocker):
         currency=currency,
         init_balance=init_balance,
     )
+
+
+@pytest.mark.django_db
+def test_run_idempotently__repeated_key__action_called_once():
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='password1',
+    )
+    action = MagicMock(return_value=({'message': 'done'}, 200))
+
+    # act
+    first_response = run_idempotently(user=user, key='key-1', action=action)
+    second_response = run_idempotently(user=user, key='key-1', action=action)
+
+    # assert
+    assert first_response == second_response == ({'message': 'done'}, 200)
+    action.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_run_idempotently__action_failed__key_not_stored():
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='password1',
+    )
+    action = MagicMock(side_effect=ValueError('Something went wrong'))
+
+    # act
+    with pytest.raises(ValueError):
+        run_idempotently(user=user, key='key-1', action=action)
+
+    # assert
+    assert not IdempotencyKey.objects.exists()
+
+
+@pytest.mark.django_db
+def test_run_idempotently__no_key__action_called_every_time():
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='password1',
+    )
+    action = MagicMock(return_value=({'message': 'done'}, 200))
+
+    # act
+    run_idempotently(user=user, key=None, action=action)
+    run_idempotently(user=user, key=None, action=action)
+
+    # assert
+    assert action.call_count == 2
+    assert not IdempotencyKey.objects.exists()
+
+
+@pytest.mark.django_db
+def test_delete_expired_idempotency_keys__proper_call__only_expired_deleted(settings):
+    # arrange
+    settings.IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+    user = create_user(
+        email='test@test.com',
+        password='password1',
+    )
+    for number in range(5):
+        IdempotencyKey.objects.create(
+            user=user,
+            key=f'old-{number}',
+            response={},
+            status_code=200,
+        )
+    IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+    IdempotencyKey.objects.create(
+        user=user,
+        key='fresh',
+        response={},
+        status_code=200,
+    )
+
+    # act
+    deleted = delete_expired_idempotency_keys(batch_size=2)
+
+    # assert
+    assert deleted == 5
+    assert list(IdempotencyKey.objects.values_list('key', flat=True)) == ['fresh']
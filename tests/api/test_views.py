@@ -1,22 +1,37 @@
 import pytest
+import csv
+import gzip
+import io
+import json
 from decimal import Decimal
 
+from django.utils import timezone
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import (
     APIRequestFactory,
     force_authenticate,
 )
 
+from api.exports import TRANSACTION_PAGE_FIELDS
+from api.serializers import TransactionSerializer
 from api.views import (
+    PendingTransferView,
+    TransactionsExportView,
+    TransmitMoneyBatchView,
     TransmitMoneyView,
     UserRegistrationView,
+    WalletBalanceView,
+    WalletStatementView,
     WalletTransactionsView,
 )
 from customauth.models import CustomUser
 from customauth.services import create_user
 from wallet.services import (
+    create_pending_transfer,
     create_transaction,
     create_wallet,
+    encode_transactions_cursor,
 )
 
 
@@ -276,7 +291,269 @@ def test_transfer_money__proper_call__return_200_and_message(mocker):
 
 
 @pytest.mark.django_db
-def test_transactions__proper_call__return_200_and_transactions(mocker):
+def test_transfer_money__repeated_idempotency_key__transferred_once(mocker):
+    # arrange
+    user_1 = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfer_money_between_wallets_mocker = mocker.patch(
+        'api.views.transfer_money_between_wallets',
+        return_value=create_transaction(
+            sender=wallet_1,
+            recipient=wallet_2,
+            amount=Decimal(40.5),
+            exchange_rate=Decimal(1),
+        ),
+    )
+    client = APIRequestFactory()
+    data = {
+        'sender': wallet_1.pk,
+        'recipient': wallet_2.pk,
+        'amount': Decimal(40.5)
+    }
+    view = TransmitMoneyView.as_view()
+    responses = []
+
+    # act
+    for _ in range(2):
+        request = client.post(
+            '/api/v1/transmit_money/',
+            data=data,
+            format='json',
+            HTTP_IDEMPOTENCY_KEY='transfer-1',
+        )
+        force_authenticate(request, user=user_1)
+        responses.append(view(request))
+
+    # assert
+    assert responses[0].status_code == responses[1].status_code == 200
+    assert responses[0].data == responses[1].data
+    transfer_money_between_wallets_mocker.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_transfer_money__too_long_idempotency_key__return_400(mocker):
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    transfer_money_between_wallets_mocker = mocker.patch(
+        'api.views.transfer_money_between_wallets',
+    )
+    client = APIRequestFactory()
+    data = {
+        'sender': 100,
+        'recipient': 101,
+        'amount': Decimal(40.5)
+    }
+    view = TransmitMoneyView.as_view()
+    request = client.post(
+        '/api/v1/transmit_money/',
+        data=data,
+        format='json',
+        HTTP_IDEMPOTENCY_KEY='k' * 256,
+    )
+    force_authenticate(request, user=user)
+
+    # act
+    response = view(request)
+
+    # assert
+    assert response.status_code == 400
+    assert response.data['status'] == 400
+    transfer_money_between_wallets_mocker.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_transfer_money__respond_async__return_202_and_id(mocker):
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    transfer_money_between_wallets_mocker = mocker.patch(
+        'api.views.transfer_money_between_wallets',
+    )
+    client = APIRequestFactory()
+    data = {
+        'sender': 100,
+        'recipient': 101,
+        'amount': Decimal(40.5)
+    }
+    view = TransmitMoneyView.as_view()
+    request = client.post(
+        '/api/v1/transmit_money/',
+        data=data,
+        format='json',
+        HTTP_PREFER='respond-async',
+    )
+    force_authenticate(request, user=user)
+
+    # act
+    response = view(request)
+
+    # assert
+    assert response.status_code == 202
+    assert response.data['status'] == 202
+    assert response.data['id'] is not None
+    transfer_money_between_wallets_mocker.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_pending_transfer__proper_call__return_200_and_transfer():
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    pending_transfer = create_pending_transfer(
+        sender=user,
+        sender_wallet_id=100,
+        recipient_wallet_id=101,
+        amount=Decimal(40.5),
+    )
+    client = APIRequestFactory()
+    view = PendingTransferView.as_view()
+    request = client.get(
+        f'/api/v1/transmit_money/{pending_transfer.pk}/',
+        format='json',
+    )
+    force_authenticate(request, user=user)
+
+    # act
+    response = view(request, pending_transfer.pk)
+
+    # assert
+    assert response.status_code == 200
+    assert response.data['transfer']['id'] == pending_transfer.pk
+    assert response.data['transfer']['status'] == 'pending'
+
+
+@pytest.mark.django_db
+def test_pending_transfer__other_user__return_500_and_error():
+    # arrange
+    user_1 = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    pending_transfer = create_pending_transfer(
+        sender=user_1,
+        sender_wallet_id=100,
+        recipient_wallet_id=101,
+        amount=Decimal(40.5),
+    )
+    client = APIRequestFactory()
+    view = PendingTransferView.as_view()
+    request = client.get(
+        f'/api/v1/transmit_money/{pending_transfer.pk}/',
+        format='json',
+    )
+    force_authenticate(request, user=user_2)
+
+    # act
+    response = view(request, pending_transfer.pk)
+
+    # assert
+    assert response.status_code == 500
+    assert response.data['error'] is not None
+
+
+@pytest.mark.django_db
+def test_transfer_money_batch__proper_call__return_200_and_results(mocker):
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    transfer_money_in_batch_mocker = mocker.patch(
+        'api.views.transfer_money_in_batch',
+        return_value=[{'sender': 1, 'recipient': 2, 'amount': Decimal(40.5), 'transaction': 1}],
+    )
+    client = APIRequestFactory()
+    data = {
+        'transfers': [
+            {'sender': 1, 'recipient': 2, 'amount': Decimal('40.5')},
+        ],
+        'all_or_nothing': False,
+    }
+    view = TransmitMoneyBatchView.as_view()
+    request = client.post(
+        '/api/v1/transmit_money/batch/',
+        data=data,
+        format='json',
+    )
+    force_authenticate(request, user=user)
+
+    # act
+    response = view(request)
+
+    # assert
+    assert response.status_code == 200
+    assert response.data['status'] == 200
+    assert len(response.data['results']) == 1
+    transfer_money_in_batch_mocker.assert_called_once_with(
+        sender=user,
+        transfers=[{'sender': 1, 'recipient': 2, 'amount': Decimal('40.50')}],
+        all_or_nothing=False,
+    )
+
+
+@pytest.mark.django_db
+def test_transfer_money_batch__invalid_item__return_400_and_exception_raised(mocker):
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    transfer_money_in_batch_mocker = mocker.patch(
+        'api.views.transfer_money_in_batch',
+    )
+    client = APIRequestFactory()
+    data = {
+        'transfers': [
+            {'sender': 1, 'recipient': 2, 'amount': Decimal('40.5')},
+            {'sender': 1, 'recipient': 2},
+        ],
+    }
+    view = TransmitMoneyBatchView.as_view()
+    request = client.post(
+        '/api/v1/transmit_money/batch/',
+        data=data,
+        format='json',
+    )
+    force_authenticate(request, user=user)
+
+    # act
+    response = view(request)
+
+    # assert
+    assert response.status_code == 400
+    assert response.data['status'] == 400
+    transfer_money_in_batch_mocker.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_transactions__proper_call__return_200_and_transactions():
     # arrange
     user_1 = create_user(
         email='test@test.com',
@@ -314,14 +591,6 @@ def test_transactions__proper_call__return_200_and_transactions(mocker):
         amount=Decimal(300.0),
         exchange_rate=Decimal(0.01598),
     )
-    retrieve_transactions_by_wallet_id_mocker = mocker.patch(
-        'api.views.retrieve_transactions_by_wallet_id',
-        return_value=[
-            transaction_1,
-            transaction_2,
-            transaction_3,
-        ],
-    )
     client = APIRequestFactory()
     view = WalletTransactionsView.as_view()
     request = client.get(
@@ -334,13 +603,18 @@ def test_transactions__proper_call__return_200_and_transactions(mocker):
     response = view(request, wallet_1.pk)
 
     # assert
+    # формат тот же, что у TransactionSerializer с JSONRenderer
+    expected = JSONRenderer().render({
+        'transactions': TransactionSerializer(
+            [transaction_3, transaction_2, transaction_1],
+            many=True,
+        ).data,
+        'next': None,
+        'status': 200,
+    })
     assert response.status_code == 200
-    assert response.data['status'] == 200
-    assert len(response.data['transactions']) == 3
-    retrieve_transactions_by_wallet_id_mocker.assert_called_once_with(
-        user=user_1,
-        wallet_id=wallet_1.pk,
-    )
+    assert response['Content-Type'] == 'application/json'
+    assert response.content == expected
 
 
 @pytest.mark.django_db
@@ -350,9 +624,9 @@ def test_transactions__empty_transaction__return_200_and_empty_list(mocker):
         email='test@test.com',
         password='test',
     )
-    retrieve_transactions_by_wallet_id_mocker = mocker.patch(
-        'api.views.retrieve_transactions_by_wallet_id',
-        return_value=[],
+    retrieve_transaction_rows_page_mocker = mocker.patch(
+        'api.views.retrieve_transaction_rows_page',
+        return_value=([], None),
     )
     client = APIRequestFactory()
     view = WalletTransactionsView.as_view()
@@ -367,9 +641,12 @@ def test_transactions__empty_transaction__return_200_and_empty_list(mocker):
 
     # assert
     assert response.status_code == 200
-    assert response.data['status'] == 200
-    assert response.data['transactions'] == []
-    retrieve_transactions_by_wallet_id_mocker.assert_called_once()
+    assert json.loads(response.content) == {
+        'transactions': [],
+        'next': None,
+        'status': 200,
+    }
+    retrieve_transaction_rows_page_mocker.assert_called_once()
 
 
 @pytest.mark.django_db
@@ -379,8 +656,8 @@ def test_transactions__exception_occured__return_500_and_error(mocker):
         email='test@test.com',
         password='test',
     )
-    retrieve_transactions_by_wallet_id_mocker = mocker.patch(
-        'api.views.retrieve_transactions_by_wallet_id',
+    retrieve_transaction_rows_page_mocker = mocker.patch(
+        'api.views.retrieve_transaction_rows_page',
         side_effect=Exception,
     )
     client = APIRequestFactory()
@@ -398,4 +675,254 @@ def test_transactions__exception_occured__return_500_and_error(mocker):
     assert response.status_code == 500
     assert response.data['status'] == 500
     assert response.data['error'] is not None
-    retrieve_transactions_by_wallet_id_mocker.assert_called_once()
+    retrieve_transaction_rows_page_mocker.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_transactions__limit_and_cursor__passed_to_service(mocker):
+    # arrange
+    user_1 = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    created_at = timezone.now()
+    cursor = encode_transactions_cursor(created_at=created_at, pk=42)
+    retrieve_transaction_rows_page_mocker = mocker.patch(
+        'api.views.retrieve_transaction_rows_page',
+        return_value=([], 'next-cursor'),
+    )
+    client = APIRequestFactory()
+    view = WalletTransactionsView.as_view()
+    request = client.get(
+        '/api/v1/transactions/100/',
+        {'limit': 2, 'cursor': cursor},
+    )
+    force_authenticate(request, user=user_1)
+
+    # act
+    response = view(request, 100)
+
+    # assert
+    assert response.status_code == 200
+    assert json.loads(response.content)['next'] == 'next-cursor'
+    retrieve_transaction_rows_page_mocker.assert_called_once_with(
+        user=user_1,
+        wallet_id=100,
+        fields=TRANSACTION_PAGE_FIELDS,
+        limit=2,
+        after=(created_at, 42),
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [
+    {'limit': 0},
+    {'limit': 1001},
+    {'cursor': 'not-a-cursor'},
+])
+def test_transactions__invalid_page_params__return_400(mocker, params):
+    # arrange
+    user_1 = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    retrieve_transaction_rows_page_mocker = mocker.patch(
+        'api.views.retrieve_transaction_rows_page',
+    )
+    client = APIRequestFactory()
+    view = WalletTransactionsView.as_view()
+    request = client.get('/api/v1/transactions/100/', params)
+    force_authenticate(request, user=user_1)
+
+    # act
+    response = view(request, 100)
+
+    # assert
+    assert response.status_code == 400
+    assert response.data['status'] == 400
+    retrieve_transaction_rows_page_mocker.assert_not_called()
+
+
+def create_export_transactions(two_wallets, count):
+    user_1, wallet_1, wallet_2 = two_wallets
+    transactions = [
+        create_transaction(
+            sender=wallet_1,
+            recipient=wallet_2,
+            amount=Decimal('10.50'),
+            exchange_rate=Decimal('63.54691'),
+        )
+        for _ in range(count)
+    ]
+    return user_1, wallet_1, transactions
+
+
+def get_export(user, wallet_id, params=None, **headers):
+    client = APIRequestFactory()
+    view = TransactionsExportView.as_view()
+    request = client.get(
+        f'/api/v1/transactions/{wallet_id}/export',
+        params or {},
+        **headers,
+    )
+    force_authenticate(request, user=user)
+    return view(request, wallet_id)
+
+
+@pytest.mark.django_db
+def test_transactions_export__csv__stream_all_rows(two_wallets):
+    # arrange
+    user_1, wallet_1, transactions = create_export_transactions(two_wallets, 3)
+
+    # act
+    response = get_export(user_1, wallet_1.pk)
+    content = b''.join(response.streaming_content).decode()
+
+    # assert
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    rows = list(csv.DictReader(io.StringIO(content)))
+    expected = TransactionSerializer(transactions, many=True).data
+    assert rows == [
+        {key: str(value) for key, value in transaction.items()}
+        for transaction in expected
+    ]
+
+
+@pytest.mark.django_db
+def test_transactions_export__ndjson_gzip__same_format_as_serializer(two_wallets):
+    # arrange
+    user_1, wallet_1, transactions = create_export_transactions(two_wallets, 3)
+
+    # act
+    response = get_export(
+        user_1,
+        wallet_1.pk,
+        {'type': 'ndjson'},
+        HTTP_ACCEPT_ENCODING='gzip, deflate',
+    )
+    content = gzip.decompress(b''.join(response.streaming_content)).decode()
+
+    # assert
+    assert response.status_code == 200
+    assert response['Content-Encoding'] == 'gzip'
+    assert response['Content-Type'] == 'application/x-ndjson; charset=utf-8'
+    rows = [json.loads(line) for line in content.splitlines()]
+    assert rows == TransactionSerializer(transactions, many=True).data
+
+
+@pytest.mark.django_db
+def test_transactions_export__unknown_type__return_400(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = create_export_transactions(two_wallets, 1)
+
+    # act
+    response = get_export(user_1, wallet_1.pk, {'type': 'xml'})
+
+    # assert
+    assert response.status_code == 400
+    assert response.data['status'] == 400
+
+
+@pytest.mark.django_db
+def test_transactions_export__not_own_wallet__return_500_and_error():
+    # arrange
+    user_1 = create_user(
+        email='test@test.com',
+        password='test',
+    )
+
+    # act
+    response = get_export(user_1, 100)
+
+    # assert
+    assert response.status_code == 500
+    assert response.data['error'] is not None
+
+
+@pytest.mark.django_db
+def test_wallet_statement__proper_call__return_200_and_statement(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = create_export_transactions(two_wallets, 2)
+    client = APIRequestFactory()
+    view = WalletStatementView.as_view()
+    request = client.get(
+        f'/api/v1/wallets/{wallet_1.pk}/statement/',
+        {'start': '2020-01-01T00:00:00Z'},
+    )
+    force_authenticate(request, user=user_1)
+
+    # act
+    response = view(request, wallet_1.pk)
+
+    # assert
+    assert response.status_code == 200
+    assert response.data['status'] == 200
+    statement = response.data['statement']
+    assert statement['wallet'] == wallet_1.pk
+    assert statement['currency'] == 'USD'
+    assert statement['outgoing'] == '21.00'
+    assert statement['incoming'] == '0.00'
+
+
+@pytest.mark.django_db
+def test_wallet_statement__no_start__return_400(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = create_export_transactions(two_wallets, 1)
+    client = APIRequestFactory()
+    view = WalletStatementView.as_view()
+    request = client.get(f'/api/v1/wallets/{wallet_1.pk}/statement/')
+    force_authenticate(request, user=user_1)
+
+    # act
+    response = view(request, wallet_1.pk)
+
+    # assert
+    assert response.status_code == 400
+    assert response.data['status'] == 400
+
+
+@pytest.mark.django_db
+def test_wallet_balance__proper_call__return_200_and_balance(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = two_wallets
+    client = APIRequestFactory()
+    view = WalletBalanceView.as_view()
+    request = client.get(f'/api/v1/wallets/{wallet_1.pk}/balance/')
+    force_authenticate(request, user=user_1)
+
+    # act
+    response = view(request, wallet_1.pk)
+
+    # assert
+    assert response.status_code == 200
+    assert response.data == {
+        'balance': {
+            'wallet': wallet_1.pk,
+            'currency': 'USD',
+            'balance': '50.00',
+        },
+        'status': 200,
+    }
+
+
+@pytest.mark.django_db
+def test_wallet_balance__not_own_wallet__return_500_and_error(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = two_wallets
+    other_user = create_user(
+        email='test3@test.com',
+        password='test3',
+    )
+    client = APIRequestFactory()
+    view = WalletBalanceView.as_view()
+    request = client.get(f'/api/v1/wallets/{wallet_1.pk}/balance/')
+    force_authenticate(request, user=other_user)
+
+    # act
+    response = view(request, wallet_1.pk)
+
+    # assert
+    assert response.status_code == 500
+    assert response.data['error'] == 'This is not your wallet'
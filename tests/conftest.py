@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+import pytest
+
+from customauth.authentication import token_cache
+from customauth.services import create_user
+from wallet.services import (
+    create_wallet,
+    exchange_rates_cache,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_exchange_rates_cache():
+    exchange_rates_cache.invalidate()
+    yield
+    exchange_rates_cache.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+@pytest.fixture
+def recipient_currency():
+    return 'RUB'
+
+
+@pytest.fixture
+def two_wallets(recipient_currency):
+    # кошелёк на 50 USD и пустой кошелёк другого пользователя; валюту
+    # второго модуль задаёт своей фикстурой recipient_currency
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency=recipient_currency,
+        init_balance=Decimal(0),
+    )
+    return user_1, wallet_1, wallet_2
@@ -0,0 +1,172 @@
+import pytest
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+
+from customauth.authentication import (
+    CachingTokenAuthentication,
+    token_cache,
+)
+from customauth.cache import (
+    LRUCache,
+    SharedCache,
+)
+from customauth.services import create_user
+
+
+class FakeTimer:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def authenticate(key):
+    request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {key}')
+    return CachingTokenAuthentication().authenticate(request)
+
+
+@pytest.mark.django_db
+def test_authenticate__repeated_request__served_from_cache(django_assert_num_queries):
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    token = Token.objects.create(user=user)
+
+    # act
+    with django_assert_num_queries(1):
+        first_user, first_token = authenticate(token.key)
+    with django_assert_num_queries(0):
+        cached_user, cached_token = authenticate(token.key)
+
+    # assert
+    assert cached_user == user
+    assert cached_user is not first_user
+    assert cached_user.email == user.email
+    assert cached_token.key == token.key
+    assert cached_token.created == token.created
+
+
+@pytest.mark.django_db
+def test_authenticate__cached_user__password_not_cached(django_assert_num_queries):
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    token = Token.objects.create(user=user)
+    authenticate(token.key)
+
+    # act
+    cached_user, _ = authenticate(token.key)
+
+    # assert
+    user_values, _ = token_cache.get(token.key)
+    assert user.password not in user_values
+    assert cached_user.get_deferred_fields() == {'password'}
+    with django_assert_num_queries(1):
+        assert cached_user.check_password('test')
+
+
+@pytest.mark.django_db
+def test_authenticate__token_deleted__raise_exception():
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    token = Token.objects.create(user=user)
+    authenticate(token.key)
+
+    # act
+    token.delete()
+
+    # assert
+    with pytest.raises(AuthenticationFailed):
+        authenticate(token.key)
+
+
+@pytest.mark.django_db
+def test_authenticate__shared_cache_token_deleted_elsewhere__raise_exception(mocker):
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    token = Token.objects.create(user=user)
+    # процесс, который обслуживает запросы, и процесс, где удаляют токен,
+    # видят один и тот же кеш
+    mocker.patch(
+        'customauth.authentication.token_cache',
+        SharedCache(alias='default', ttl=60, prefix='auth-token:'),
+    )
+    mocker.patch(
+        'customauth.signals.token_cache',
+        SharedCache(alias='default', ttl=60, prefix='auth-token:'),
+    )
+    authenticate(token.key)
+
+    # act
+    token.delete()
+
+    # assert
+    with pytest.raises(AuthenticationFailed):
+        authenticate(token.key)
+
+
+@pytest.mark.django_db
+def test_authenticate__user_deactivated__raise_exception():
+    # arrange
+    user = create_user(
+        email='test@test.com',
+        password='test',
+    )
+    token = Token.objects.create(user=user)
+    authenticate(token.key)
+
+    # act
+    user.is_active = False
+    user.save()
+
+    # assert
+    assert token_cache.get(token.key) is None
+    with pytest.raises(AuthenticationFailed):
+        authenticate(token.key)
+
+
+def test_lru_cache__ttl_expired__return_none():
+    # arrange
+    timer = FakeTimer()
+    cache = LRUCache(max_size=10, ttl=60, timer=timer)
+    cache.set('key', 'value')
+
+    # act
+    timer.now = 59
+    fresh = cache.get('key')
+    timer.now = 60
+    expired = cache.get('key')
+
+    # assert
+    assert fresh == 'value'
+    assert expired is None
+    assert len(cache) == 0
+
+
+def test_lru_cache__size_exceeded__evict_least_recently_used():
+    # arrange
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+
+    # act
+    cache.set('c', 3)
+
+    # assert
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
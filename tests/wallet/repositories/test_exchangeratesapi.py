@@ -1,29 +1,65 @@
+import json
+import threading
+import time
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
 import pytest
-from unittest.mock import MagicMock
 
 from wallet.repositories.exceptions import ExchangeRatesApiException
-from wallet.repositories.exchangeratesapi import get_exchange_rates
+from wallet.repositories.exchangeratesapi import ExchangeRatesApiClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(parse_qs(urlparse(self.path).query))
+        if server.responses:
+            status, body, delay = server.responses.pop(0)
+        else:
+            status, body, delay = server.default_response
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
 
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.responses = []
+    server.default_response = (200, {'rates': {}}, 0)
+    server.url = f'http://127.0.0.1:{server.server_port}/latest'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
 
-def test_get_exchange_rates__proper_call__return_rates(mocker):
+
+def test_get_exchange_rates__proper_call__return_rates(stub_server):
     # arrange
-    response = mocker.patch(
-        'wallet.repositories.exchangeratesapi.requests.get',
-    )
-    expected_data = {
-        'rates': {
-            'USD': 1.5,
-            'RUB': 1,
-            'EUR': 1.3,
-        },
-    }
-    response.return_value = MagicMock(
-        status_code=200,
-        json=lambda: expected_data,
+    stub_server.responses.append(
+        (200, {'rates': {'USD': 1.5, 'RUB': 1, 'EUR': 1.3}}, 0),
     )
+    client = ExchangeRatesApiClient(url=stub_server.url)
 
     # act
-    rates = get_exchange_rates(
+    rates = client.get_exchange_rates(
         base_currency='RUB',
         target_currencies=['RUB', 'USD', 'EUR'],
     )
@@ -32,24 +68,98 @@ def test_get_exchange_rates__proper_call__return_rates(mocker):
     assert rates['USD'] == 1.5
     assert rates['RUB'] == 1
     assert rates['EUR'] == 1.3
+    assert stub_server.requests[0]['base'] == ['RUB']
+    assert stub_server.requests[0]['symbols'] == ['EUR,RUB,USD']
+    assert client.metrics[-1].base_currency == 'RUB'
+    assert client.metrics[-1].succeeded
 
 
-def test_get_exchange_rates__wrong_currencies__raise_exception(mocker):
+def test_get_exchange_rates__wrong_currencies__raise_exception(stub_server):
     # arrange
-    response = mocker.patch(
-        'wallet.repositories.exchangeratesapi.requests.get',
-    )
-    expected_data = {
-        'error': 'Unknown currency RUM',
-    }
-    response.return_value = MagicMock(
-        status_code=400,
-        json=lambda: expected_data,
+    stub_server.responses.append(
+        (400, {'error': 'Unknown currency RUM'}, 0),
     )
+    client = ExchangeRatesApiClient(url=stub_server.url)
 
     # act & assert
     with pytest.raises(ExchangeRatesApiException):
-        get_exchange_rates(
+        client.get_exchange_rates(
             base_currency='RUM',
             target_currencies=['RUB', 'USD', 'EUR'],
         )
+    assert not client.metrics[-1].succeeded
+
+
+def test_get_exchange_rates__server_error__retried(stub_server):
+    # arrange
+    stub_server.responses.extend([
+        (503, {'error': 'Service unavailable'}, 0),
+        (503, {'error': 'Service unavailable'}, 0),
+        (200, {'rates': {'USD': 1.5}}, 0),
+    ])
+    client = ExchangeRatesApiClient(url=stub_server.url, backoff_factor=0)
+
+    # act
+    rates = client.get_exchange_rates(
+        base_currency='EUR',
+        target_currencies=['USD'],
+    )
+
+    # assert
+    assert rates == {'USD': 1.5}
+    assert len(stub_server.requests) == 3
+
+
+def test_get_exchange_rates__retries_exhausted__raise_exception(stub_server):
+    # arrange
+    stub_server.default_response = (503, {'error': 'Service unavailable'}, 0)
+    client = ExchangeRatesApiClient(
+        url=stub_server.url,
+        retries=2,
+        backoff_factor=0,
+    )
+
+    # act & assert
+    with pytest.raises(ExchangeRatesApiException):
+        client.get_exchange_rates(
+            base_currency='EUR',
+            target_currencies=['USD'],
+        )
+    assert len(stub_server.requests) == 3
+
+
+def test_get_exchange_rates__slow_response__raise_exception(stub_server):
+    # arrange
+    stub_server.default_response = (200, {'rates': {'USD': 1.5}}, 0.5)
+    client = ExchangeRatesApiClient(
+        url=stub_server.url,
+        timeout=(1, 0.1),
+        retries=0,
+    )
+
+    # act & assert
+    with pytest.raises(ExchangeRatesApiException):
+        client.get_exchange_rates(
+            base_currency='EUR',
+            target_currencies=['USD'],
+        )
+
+
+def test_get_exchange_rates_many__proper_call__fetched_concurrently(stub_server):
+    # arrange
+    stub_server.default_response = (200, {'rates': {'EUR': 1.1}}, 0.3)
+    client = ExchangeRatesApiClient(url=stub_server.url, max_workers=4)
+
+    # act
+    started_at = time.perf_counter()
+    rates = client.get_exchange_rates_many(
+        base_currencies=['USD', 'RUB', 'GBP', 'EUR'],
+        target_currencies=['USD', 'RUB', 'GBP', 'EUR'],
+    )
+    elapsed = time.perf_counter() - started_at
+
+    # assert
+    assert set(rates.keys()) == {'USD', 'RUB', 'GBP', 'EUR'}
+    assert len(stub_server.requests) == 4
+    assert len(client.metrics) == 4
+    assert elapsed < 1.2
@@ -0,0 +1,139 @@
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+from prometheus_client import REGISTRY
+
+from wallet.cache import ExchangeRatesCache
+
+
+class FakeTimer:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_matrix__within_ttl__loaded_once():
+    # arrange
+    loader = MagicMock(return_value={'USD': {'RUB': Decimal('63.5')}})
+    version_getter = MagicMock(return_value=1)
+    timer = FakeTimer()
+    cache = ExchangeRatesCache(
+        loader=loader,
+        version_getter=version_getter,
+        ttl=30,
+        timer=timer,
+    )
+
+    # act
+    cache.get_matrix()
+    timer.now = 29
+    matrix = cache.get_matrix()
+
+    # assert
+    assert matrix['USD']['RUB'] == Decimal('63.5')
+    assert loader.call_count == 1
+    assert version_getter.call_count == 1
+
+
+def test_get_matrix__ttl_expired_same_version__not_reloaded():
+    # arrange
+    loader = MagicMock(return_value={'USD': {'RUB': Decimal('63.5')}})
+    version_getter = MagicMock(return_value=1)
+    timer = FakeTimer()
+    cache = ExchangeRatesCache(
+        loader=loader,
+        version_getter=version_getter,
+        ttl=30,
+        timer=timer,
+    )
+
+    # act
+    cache.get_matrix()
+    timer.now = 31
+    cache.get_matrix()
+
+    # assert
+    assert loader.call_count == 1
+    assert version_getter.call_count == 2
+
+
+def test_get_matrix__ttl_expired_new_version__reloaded():
+    # arrange
+    loader = MagicMock(side_effect=[
+        {'USD': {'RUB': Decimal('63.5')}},
+        {'USD': {'RUB': Decimal('64.1')}},
+    ])
+    version_getter = MagicMock(side_effect=[1, 2])
+    timer = FakeTimer()
+    cache = ExchangeRatesCache(
+        loader=loader,
+        version_getter=version_getter,
+        ttl=30,
+        timer=timer,
+    )
+
+    # act
+    cache.get_matrix()
+    timer.now = 31
+    rate = cache.get_rate(base_currency='USD', target_currency='RUB')
+
+    # assert
+    assert rate == Decimal('64.1')
+    assert loader.call_count == 2
+
+
+def test_invalidate__proper_call__matrix_reloaded():
+    # arrange
+    loader = MagicMock(return_value={})
+    version_getter = MagicMock(return_value=None)
+    cache = ExchangeRatesCache(
+        loader=loader,
+        version_getter=version_getter,
+        ttl=30,
+    )
+    cache.get_matrix()
+
+    # act
+    cache.invalidate()
+    cache.get_matrix()
+
+    # assert
+    assert loader.call_count == 2
+
+
+def test_get_matrix__lookups__counted_by_result():
+    # arrange
+    loader = MagicMock(return_value={'USD': {'RUB': Decimal('63.5')}})
+    version_getter = MagicMock(return_value=1)
+    timer = FakeTimer()
+    cache = ExchangeRatesCache(
+        loader=loader,
+        version_getter=version_getter,
+        ttl=30,
+        timer=timer,
+    )
+    before = {
+        result: get_lookups_count(result)
+        for result in ('hit', 'revalidated', 'loaded')
+    }
+
+    # act
+    cache.get_matrix()
+    cache.get_matrix()
+    timer.now = 31
+    cache.get_matrix()
+
+    # assert
+    assert get_lookups_count('loaded') - before['loaded'] == 1
+    assert get_lookups_count('hit') - before['hit'] == 1
+    assert get_lookups_count('revalidated') - before['revalidated'] == 1
+
+
+def get_lookups_count(result):
+    return REGISTRY.get_sample_value(
+        'wallet_exchange_rates_cache_lookups_total',
+        {'result': result},
+    ) or 0
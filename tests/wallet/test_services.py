@@ -1,6 +1,23 @@
+import threading
+import time
+
 import pytest
+from datetime import (
+    datetime,
+    timedelta,
+)
 from decimal import Decimal
 
+from django.db import (
+    DataError,
+    DatabaseError,
+    connection,
+)
+from django.db.transaction import atomic
+from django.db.models import Sum
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
 from customauth.services import create_user
 from wallet.exceptions import (
     ExchangeRateCreationException,
@@ -8,20 +25,52 @@ from wallet.exceptions import (
     WalletOperationException,
 )
 from wallet.models import (
+    DAY,
+    HOUR,
+    CurrentExchangeRate,
     ExchangeRate,
+    ExchangeRateAggregate,
+    LOCKING_TRANSFER_MODE,
+    RETURNING_TRANSFER_MODE,
+    LedgerEntry,
+    PendingTransfer,
+    Transaction,
     Wallet,
+    WalletBalanceSnapshot,
 )
 
 from wallet.services import (
+    compact_exchange_rates,
     convert_amount,
+    create_balance_snapshots,
     create_exchange_rate,
+    create_ledger_checkpoints,
+    create_pending_transfer,
     create_transaction,
     create_wallet,
+    decode_transactions_cursor,
     decrease_wallet_balance,
+    derive_cross_rates,
+    enable_wallet_balance_shards,
+    fold_balance_shards,
     get_current_exchange_rate,
+    get_day_start,
+    get_exchange_rate_at,
+    get_exchange_rates_at,
+    get_ledger_balance,
+    get_wallet_balance,
+    get_wallet_balance_at,
     increase_wallet_balance,
+    lock_wallets,
+    process_pending_transfers,
     retrieve_transactions_by_wallet_id,
+    retrieve_transaction_rows_page,
+    retrieve_transactions_page,
+    retrieve_wallet_statement,
+    set_wallet_balances,
     transfer_money_between_wallets,
+    transfer_money_in_batch,
+    transfer_money_with_returning,
     update_exchange_rates,
 )
 
@@ -41,6 +90,27 @@ def test_create_exchange_rate__proper_call__return_exchange_rate():
     assert exchange_rate.rates['EUR'] == 1.1
 
 
+@pytest.mark.django_db
+def test_create_exchange_rate__several_records__current_rate_replaced():
+    # arrange
+    create_exchange_rate(
+        currency='USD',
+        exchange_rates={'RUB': 63.5},
+    )
+
+    # act
+    exchange_rate = create_exchange_rate(
+        currency='USD',
+        exchange_rates={'RUB': 64.1},
+    )
+
+    # assert
+    current_exchange_rate = CurrentExchangeRate.objects.get(currency='USD')
+    assert CurrentExchangeRate.objects.count() == 1
+    assert current_exchange_rate.rates['RUB'] == 64.1
+    assert current_exchange_rate.exchange_rate == exchange_rate
+
+
 @pytest.mark.django_db
 def test_create_exchange_rate__unknown_currency__raise_exception():
     # act & assert
@@ -52,13 +122,14 @@ def test_create_exchange_rate__unknown_currency__raise_exception():
 
 
 @pytest.mark.django_db
-def test_update_exchange_rates__proper_call__called_4_times(mocker):
+def test_update_exchange_rates__proper_call__one_request_4_records(mocker):
     # arrange
     create_exchange_rate_mocker = mocker.patch(
         'wallet.services.create_exchange_rate',
     )
     get_exchange_rates_mocker = mocker.patch(
         'wallet.services.get_exchange_rates',
+        return_value={'USD': 1.1, 'RUB': 70.0, 'GBP': 0.85},
     )
 
     # act
@@ -66,7 +137,169 @@ def test_update_exchange_rates__proper_call__called_4_times(mocker):
 
     # assert
     assert create_exchange_rate_mocker.call_count == 4
-    assert get_exchange_rates_mocker.call_count == 4
+    assert get_exchange_rates_mocker.call_count == 1
+
+
+@pytest.mark.django_db
+def test_update_exchange_rates__proper_call__cross_rates_stored(mocker):
+    # arrange
+    mocker.patch(
+        'wallet.services.get_exchange_rates',
+        return_value={'USD': 1.1, 'RUB': 70.0, 'GBP': 0.85},
+    )
+
+    # act
+    update_exchange_rates()
+
+    # assert
+    assert ExchangeRate.objects.count() == 4
+    assert get_current_exchange_rate(
+        base_currency='USD',
+        target_currency='RUB',
+    ) == Decimal('63.63636')
+    assert get_current_exchange_rate(
+        base_currency='RUB',
+        target_currency='EUR',
+    ) == Decimal('0.01429')
+
+
+def test_derive_cross_rates__proper_call__return_full_matrix():
+    # act
+    cross_rates = derive_cross_rates(
+        pivot_currency='EUR',
+        pivot_rates={'USD': 1.25, 'GBP': 0.5},
+    )
+
+    # assert
+    assert cross_rates == {
+        'EUR': {'USD': 1.25, 'GBP': 0.5},
+        'USD': {'EUR': 0.8, 'GBP': 0.4},
+        'GBP': {'EUR': 2.0, 'USD': 2.5},
+    }
+
+
+@pytest.mark.django_db
+def test_compact_exchange_rates__old_raw_rates__rolled_into_hourly_aggregates():
+    # arrange
+    now = datetime(2020, 2, 20, 12, 0, tzinfo=timezone.utc)
+    hour_start = now - timedelta(days=8)
+    for minutes, rate in ((0, 63.5), (3, 64.7), (6, 62.1), (9, 63.9)):
+        exchange_rate = create_exchange_rate(
+            currency='USD',
+            exchange_rates={'RUB': rate},
+        )
+        ExchangeRate.objects.filter(pk=exchange_rate.pk).update(
+            created_at=hour_start + timedelta(minutes=minutes),
+        )
+    fresh_exchange_rate = create_exchange_rate(
+        currency='USD',
+        exchange_rates={'RUB': 64.0},
+    )
+    ExchangeRate.objects.filter(pk=fresh_exchange_rate.pk).update(
+        created_at=now - timedelta(hours=1),
+    )
+
+    # act
+    compact_exchange_rates(now=now)
+
+    # assert
+    aggregate = ExchangeRateAggregate.objects.get()
+    assert list(ExchangeRate.objects.all()) == [fresh_exchange_rate]
+    assert aggregate.period == HOUR
+    assert aggregate.currency == 'USD'
+    assert aggregate.target_currency == 'RUB'
+    assert aggregate.period_start == hour_start
+    assert aggregate.open == Decimal('63.5')
+    assert aggregate.high == Decimal('64.7')
+    assert aggregate.low == Decimal('62.1')
+    assert aggregate.close == Decimal('63.9')
+
+
+@pytest.mark.django_db
+def test_compact_exchange_rates__current_rate_is_old__current_rate_kept():
+    # arrange
+    now = datetime(2020, 2, 20, 12, 0, tzinfo=timezone.utc)
+    exchange_rate = create_exchange_rate(
+        currency='USD',
+        exchange_rates={'RUB': 63.5},
+    )
+    ExchangeRate.objects.filter(pk=exchange_rate.pk).update(
+        created_at=now - timedelta(days=30),
+    )
+
+    # act
+    compact_exchange_rates(now=now)
+
+    # assert
+    assert list(ExchangeRate.objects.all()) == [exchange_rate]
+    assert not ExchangeRateAggregate.objects.exists()
+
+
+@pytest.mark.django_db
+def test_compact_exchange_rates__held_back_rate_in_aggregated_hour__merged_into_aggregate():
+    # arrange
+    now = datetime(2020, 2, 20, 12, 0, tzinfo=timezone.utc)
+    hour_start = now - timedelta(days=8)
+    for minutes, rate in ((0, 63.5), (3, 64.7), (6, 62.1)):
+        exchange_rate = create_exchange_rate(
+            currency='USD',
+            exchange_rates={'RUB': rate},
+        )
+        ExchangeRate.objects.filter(pk=exchange_rate.pk).update(
+            created_at=hour_start + timedelta(minutes=minutes),
+        )
+    # последний курс часа был текущим и остался несвёрнутым
+    compact_exchange_rates(now=now)
+    fresh_exchange_rate = create_exchange_rate(
+        currency='USD',
+        exchange_rates={'RUB': 64.0},
+    )
+    ExchangeRate.objects.filter(pk=fresh_exchange_rate.pk).update(
+        created_at=now + timedelta(minutes=30),
+    )
+
+    # act
+    compact_exchange_rates(now=now + timedelta(hours=1))
+
+    # assert
+    aggregate = ExchangeRateAggregate.objects.get()
+    assert list(ExchangeRate.objects.all()) == [fresh_exchange_rate]
+    assert aggregate.period_start == hour_start
+    assert aggregate.open == Decimal('63.5')
+    assert aggregate.high == Decimal('64.7')
+    assert aggregate.low == Decimal('62.1')
+    assert aggregate.close == Decimal('62.1')
+
+
+@pytest.mark.django_db
+def test_compact_exchange_rates__old_hourly_aggregates__rolled_into_daily_aggregates():
+    # arrange
+    now = datetime(2020, 6, 20, 12, 0, tzinfo=timezone.utc)
+    day_start = datetime(2020, 1, 10, tzinfo=timezone.utc)
+    for hours, ohlc in ((0, ('63.5', '64.0', '63.0', '63.8')), (5, ('63.8', '66.0', '62.5', '65.1'))):
+        open_rate, high_rate, low_rate, close_rate = map(Decimal, ohlc)
+        ExchangeRateAggregate.objects.create(
+            period=HOUR,
+            currency='USD',
+            target_currency='RUB',
+            period_start=day_start + timedelta(hours=hours),
+            open=open_rate,
+            high=high_rate,
+            low=low_rate,
+            close=close_rate,
+        )
+
+    # act
+    compact_exchange_rates(now=now)
+
+    # assert
+    aggregate = ExchangeRateAggregate.objects.get()
+    assert aggregate.period == DAY
+    assert aggregate.period_start == day_start
+    assert aggregate.open == Decimal('63.5')
+    assert aggregate.high == Decimal('66.0')
+    assert aggregate.low == Decimal('62.5')
+    assert aggregate.close == Decimal('65.1')
 
 
 @pytest.mark.django_db
@@ -280,6 +513,48 @@ def test_get_current_exchange_rate__proper_call__return_current_rates():
     assert current_exchange_rate == Decimal('63.5')
 
 
+@pytest.mark.django_db
+def test_get_current_exchange_rate__several_records__return_latest_rate():
+    # arrange
+    create_exchange_rate(
+        currency='RUB',
+        exchange_rates={'USD': 63.5},
+    )
+    create_exchange_rate(
+        currency='RUB',
+        exchange_rates={'USD': 64.1},
+    )
+
+    # act
+    current_exchange_rate = get_current_exchange_rate(
+        base_currency='RUB',
+        target_currency='USD',
+    )
+
+    # assert
+    assert current_exchange_rate == Decimal('64.1')
+
+
+@pytest.mark.django_db
+def test_get_current_exchange_rate__cached_matrix__no_queries(django_assert_num_queries):
+    # arrange
+    create_exchange_rate(
+        currency='RUB',
+        exchange_rates={'USD': 63.5},
+    )
+    get_current_exchange_rate(
+        base_currency='RUB',
+        target_currency='USD',
+    )
+
+    # act & assert
+    with django_assert_num_queries(0):
+        get_current_exchange_rate(
+            base_currency='RUB',
+            target_currency='USD',
+        )
+
+
 @pytest.mark.django_db
 def test_get_current_exchange_rate__unknown_currency__raise_exception():
     # act & assert
@@ -300,6 +575,200 @@ def test_get_current_exchange_rate__empty_query__raise_exception():
         )
 
 
+@pytest.mark.django_db
+def test_get_exchange_rate_at__proper_call__return_rate_at_moment():
+    # arrange
+    moment = datetime(2020, 2, 20, 12, 0, tzinfo=timezone.utc)
+    for minutes, rate in ((0, 63.5), (3, 64.7), (6, 62.1)):
+        exchange_rate = create_exchange_rate(
+            currency='USD',
+            exchange_rates={'RUB': rate},
+        )
+        ExchangeRate.objects.filter(pk=exchange_rate.pk).update(
+            created_at=moment + timedelta(minutes=minutes),
+        )
+
+    # act
+    exchange_rate = get_exchange_rate_at(
+        base_currency='USD',
+        target_currency='RUB',
+        timestamp=moment + timedelta(minutes=4),
+    )
+
+    # assert
+    assert exchange_rate == Decimal('64.7')
+
+
+@pytest.mark.django_db
+def test_get_exchange_rate_at__raw_rates_compacted__return_aggregate_open():
+    # arrange
+    hour_start = datetime(2020, 2, 20, 12, 0, tzinfo=timezone.utc)
+    ExchangeRateAggregate.objects.create(
+        period=HOUR,
+        currency='USD',
+        target_currency='RUB',
+        period_start=hour_start,
+        open=Decimal('63.5'),
+        high=Decimal('64.7'),
+        low=Decimal('62.1'),
+        close=Decimal('63.9'),
+    )
+
+    # act
+    exchange_rate = get_exchange_rate_at(
+        base_currency='USD',
+        target_currency='RUB',
+        timestamp=hour_start + timedelta(minutes=30),
+    )
+
+    # assert
+    assert exchange_rate == Decimal('63.5')
+
+
+@pytest.mark.django_db
+def test_get_exchange_rate_at__no_records__raise_exception():
+    # act & assert
+    with pytest.raises(ExchangeRate.DoesNotExist):
+        get_exchange_rate_at(
+            base_currency='USD',
+            target_currency='RUB',
+            timestamp=timezone.now(),
+        )
+
+
+@pytest.mark.django_db
+def test_get_exchange_rates_at__many_timestamps__resolved_in_3_queries(django_assert_num_queries):
+    # arrange
+    moment = datetime(2020, 2, 20, 12, 0, tzinfo=timezone.utc)
+    ExchangeRateAggregate.objects.create(
+        period=HOUR,
+        currency='USD',
+        target_currency='RUB',
+        period_start=moment - timedelta(hours=1),
+        open=Decimal('60.1'),
+        high=Decimal('60.1'),
+        low=Decimal('60.1'),
+        close=Decimal('60.1'),
+    )
+    for minutes, rate in ((0, 63.5), (3, 64.7), (6, 62.1)):
+        exchange_rate = create_exchange_rate(
+            currency='USD',
+            exchange_rates={'RUB': rate},
+        )
+        ExchangeRate.objects.filter(pk=exchange_rate.pk).update(
+            created_at=moment + timedelta(minutes=minutes),
+        )
+    offsets = [-30, 1, 4, 5, 100, 2]
+
+    # act
+    with django_assert_num_queries(3):
+        exchange_rates = get_exchange_rates_at(
+            base_currency='USD',
+            target_currency='RUB',
+            timestamps=[moment + timedelta(minutes=offset) for offset in offsets],
+        )
+
+    # assert
+    assert exchange_rates == [
+        Decimal('60.1'),
+        Decimal('63.5'),
+        Decimal('64.7'),
+        Decimal('64.7'),
+        Decimal('62.1'),
+        Decimal('63.5'),
+    ]
+
+
+@pytest.mark.django_db
+def test_get_exchange_rates_at__across_day_boundaries__same_as_single_lookups():
+    # arrange
+    for period, period_start, rate in (
+        (DAY, datetime(2025, 12, 31, tzinfo=timezone.utc), Decimal('0.8')),
+        (HOUR, datetime(2026, 1, 1, 23, 0, tzinfo=timezone.utc), Decimal('0.9')),
+    ):
+        ExchangeRateAggregate.objects.create(
+            period=period,
+            currency='USD',
+            target_currency='EUR',
+            period_start=period_start,
+            open=rate,
+            high=rate,
+            low=rate,
+            close=rate,
+        )
+    exchange_rate = create_exchange_rate(
+        currency='USD',
+        exchange_rates={'EUR': 0.95},
+    )
+    ExchangeRate.objects.filter(pk=exchange_rate.pk).update(
+        created_at=datetime(2026, 1, 2, 10, 0, tzinfo=timezone.utc),
+    )
+    new_york = timezone.get_fixed_timezone(-5 * 60)
+    timestamps = [
+        datetime(2026, 1, 1, 10, 0, tzinfo=new_york),
+        datetime(2026, 1, 2, 0, 30, tzinfo=timezone.utc),
+        datetime(2026, 1, 1, 23, 30, tzinfo=new_york),
+        datetime(2026, 1, 2, 12, 0, tzinfo=timezone.utc),
+    ]
+
+    # act
+    exchange_rates = get_exchange_rates_at(
+        base_currency='USD',
+        target_currency='EUR',
+        timestamps=timestamps,
+    )
+
+    # assert
+    assert exchange_rates == [
+        get_exchange_rate_at(
+            base_currency='USD',
+            target_currency='EUR',
+            timestamp=timestamp,
+        )
+        for timestamp in timestamps
+    ]
+    assert exchange_rates == [
+        Decimal('0.8'),
+        Decimal('0.9'),
+        Decimal('0.9'),
+        Decimal('0.95'),
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('timestamp', [
+    datetime(2026, 1, 2, 0, 30, tzinfo=timezone.utc),
+    datetime(2026, 1, 1, 19, 30, tzinfo=timezone.get_fixed_timezone(-5 * 60)),
+])
+def test_get_exchange_rates_at__only_earlier_aggregate__same_as_single_lookup(timestamp):
+    # arrange
+    ExchangeRateAggregate.objects.create(
+        period=HOUR,
+        currency='USD',
+        target_currency='EUR',
+        period_start=datetime(2026, 1, 1, 23, 0, tzinfo=timezone.utc),
+        open=Decimal('0.9'),
+        high=Decimal('0.9'),
+        low=Decimal('0.9'),
+        close=Decimal('0.9'),
+    )
+
+    # act
+    exchange_rates = get_exchange_rates_at(
+        base_currency='USD',
+        target_currency='EUR',
+        timestamps=[timestamp],
+    )
+
+    # assert
+    assert exchange_rates == [Decimal('0.9')]
+    assert exchange_rates == [get_exchange_rate_at(
+        base_currency='USD',
+        target_currency='EUR',
+        timestamp=timestamp,
+    )]
+
+
 @pytest.mark.django_db
 def test_transfer_money_between_wallets__proper_call__return_transaction(mocker):
     # arrange
@@ -487,8 +956,8 @@ def test_transfer_money_between_wallets__unable_to_increase__raise_excpetion(moc
     assert wallet_2.balance == Decimal('0.00')
 
 
-@pytest.mark.django_db
-def test_retrieve_transactions_by_wallet_id__proper_call__return_transactions():
+@pytest.mark.django_db(transaction=True)
+def test_transfer_money_between_wallets__concurrent_transfers__no_lost_updates():
     # arrange
     user_1 = create_user(
         email='test1@test.com',
@@ -505,49 +974,1505 @@ def test_retrieve_transactions_by_wallet_id__proper_call__return_transactions():
     )
     wallet_2 = create_wallet(
         user=user_2,
-        currency='RUB',
-        init_balance=Decimal(0),
+        currency='USD',
+        init_balance=Decimal(50),
     )
-    create_transaction(
-        sender=wallet_1,
-        recipient=wallet_2,
-        amount=Decimal(10.0),
-        exchange_rate=Decimal(63.54691),
+
+    def transfer_many(sender, sender_wallet, recipient_wallet):
+        try:
+            for _ in range(15):
+                try:
+                    transfer_money_between_wallets(
+                        sender=sender,
+                        sender_wallet_id=sender_wallet.pk,
+                        recipient_wallet_id=recipient_wallet.pk,
+                        amount=Decimal(7),
+                    )
+                except WalletOperationException:
+                    pass
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=transfer_many, args=args)
+        for args in [(user_1, wallet_1, wallet_2), (user_2, wallet_2, wallet_1)] * 4
+    ]
+
+    # act
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wallet_1 = Wallet.objects.get(pk=wallet_1.pk)
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+
+    # assert
+    sent_1 = Transaction.objects.filter(sender=wallet_1).aggregate(total=Sum('amount'))['total'] or 0
+    sent_2 = Transaction.objects.filter(sender=wallet_2).aggregate(total=Sum('amount'))['total'] or 0
+    assert wallet_1.balance + wallet_2.balance == Decimal('100.00')
+    assert wallet_1.balance == Decimal(50) - sent_1 + sent_2
+    assert wallet_1.balance >= 0
+    assert wallet_2.balance >= 0
+
+
+def get_transfers_count(sender_currency, recipient_currency):
+    return REGISTRY.get_sample_value(
+        'wallet_transfers_total',
+        {'sender_currency': sender_currency, 'recipient_currency': recipient_currency},
+    ) or 0
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('transfer_mode', ['locking', 'returning'])
+def test_transfer_money_between_wallets__committed__counted_by_currency_pair(
+        mocker,
+        settings,
+        transfer_mode,
+):
+    # arrange
+    settings.WALLET_TRANSFER_MODE = transfer_mode
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
     )
-    create_transaction(
-        sender=wallet_1,
-        recipient=wallet_2,
-        amount=Decimal(30.0),
-        exchange_rate=Decimal(61.33420),
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
     )
-    create_transaction(
-        sender=wallet_2,
-        recipient=wallet_1,
-        amount=Decimal(300.0),
-        exchange_rate=Decimal(0.01598),
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='RUB',
+        init_balance=Decimal(0),
+    )
+    mocker.patch(
+        'wallet.services.get_current_exchange_rate',
+        return_value=Decimal('63.54563'),
     )
+    before = get_transfers_count('USD', 'RUB')
 
     # act
-    transactions = retrieve_transactions_by_wallet_id(
-        user=user_1,
-        wallet_id=wallet_1.pk,
+    transfer_money_between_wallets(
+        sender=user_1,
+        sender_wallet_id=wallet_1.pk,
+        recipient_wallet_id=wallet_2.pk,
+        amount=Decimal(10),
     )
+    with pytest.raises(RuntimeError):
+        with atomic():
+            transfer_money_between_wallets(
+                sender=user_1,
+                sender_wallet_id=wallet_1.pk,
+                recipient_wallet_id=wallet_2.pk,
+                amount=Decimal(10),
+            )
+            raise RuntimeError('rolled back')
 
     # assert
-    assert len(transactions) == 3
+    assert get_transfers_count('USD', 'RUB') - before == 1
 
 
-@pytest.mark.django_db
-def test_retrieve_transactions_by_wallet_id__user_do_not_own_wallet__raise_exception():
+@pytest.mark.django_db(transaction=True)
+def test_transfer_money_with_returning__proper_call__two_queries(mocker, django_assert_num_queries):
     # arrange
     user_1 = create_user(
         email='test1@test.com',
         password='test1',
     )
-
-    # act & assert
-    with pytest.raises(WalletOperationException):
-        retrieve_transactions_by_wallet_id(
-            user=user_1,
-            wallet_id=100,
-        )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='RUB',
+        init_balance=Decimal(0),
+    )
+    mocker.patch(
+        'wallet.services.get_current_exchange_rate',
+        return_value=Decimal('63.54563'),
+    )
+
+    # act
+    with django_assert_num_queries(2):
+        transaction = transfer_money_with_returning(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(10.0),
+        )
+        str(transaction.recipient)
+    wallet_1 = Wallet.objects.get(pk=wallet_1.pk)
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+
+    # assert
+    stored_transaction = Transaction.objects.get(pk=transaction.pk)
+    assert stored_transaction.amount == Decimal('10.00')
+    assert stored_transaction.exchange_rate == Decimal('63.54563')
+    assert transaction.sender.balance == wallet_1.balance == Decimal('40.00')
+    assert transaction.recipient.balance == wallet_2.balance == Decimal('635.46')
+
+
+@pytest.mark.django_db
+def test_transfer_money_with_returning__too_big_transfer__raise_exception():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+
+    # act
+    with pytest.raises(WalletOperationException):
+        transfer_money_with_returning(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(60),
+        )
+    wallet_1 = Wallet.objects.get(pk=wallet_1.pk)
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+
+    # assert
+    assert wallet_1.balance == Decimal('50.00')
+    assert wallet_2.balance == Decimal('0.00')
+    assert not Transaction.objects.exists()
+
+
+@pytest.mark.django_db
+def test_transfer_money_with_returning__not_wallet_owner__raise_exception():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+
+    # act & assert
+    with pytest.raises(WalletOperationException):
+        transfer_money_with_returning(
+            sender=user_2,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(10),
+        )
+
+
+@pytest.mark.django_db
+def test_transfer_money_between_wallets__returning_mode__delegated(mocker, settings):
+    # arrange
+    settings.WALLET_TRANSFER_MODE = 'returning'
+    user = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    transfer_money_with_returning_mocker = mocker.patch(
+        'wallet.services.transfer_money_with_returning',
+    )
+
+    # act
+    transfer_money_between_wallets(
+        sender=user,
+        sender_wallet_id=1,
+        recipient_wallet_id=2,
+        amount=Decimal(10),
+    )
+
+    # assert
+    transfer_money_with_returning_mocker.assert_called_once_with(
+        sender=user,
+        sender_wallet_id=1,
+        recipient_wallet_id=2,
+        amount=Decimal(10),
+    )
+
+
+@pytest.mark.django_db
+def test_transfer_money_in_batch__proper_call__net_balances_applied(mocker):
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    wallet_3 = create_wallet(
+        user=user_2,
+        currency='RUB',
+        init_balance=Decimal(0),
+    )
+    mocker.patch(
+        'wallet.services.get_current_exchange_rate',
+        return_value=Decimal('63.54563'),
+    )
+    transfers = [
+        {'sender': wallet_1.pk, 'recipient': wallet_2.pk, 'amount': Decimal(30)},
+        {'sender': wallet_2.pk, 'recipient': wallet_3.pk, 'amount': Decimal(20)},
+        {'sender': wallet_1.pk, 'recipient': wallet_3.pk, 'amount': Decimal(10)},
+    ]
+
+    # act
+    results = transfer_money_in_batch(
+        sender=user_1,
+        transfers=transfers,
+    )
+    wallet_1 = Wallet.objects.get(pk=wallet_1.pk)
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+    wallet_3 = Wallet.objects.get(pk=wallet_3.pk)
+
+    # assert
+    assert [result['transaction'] for result in results] == list(
+        Transaction.objects.order_by('pk').values_list('pk', flat=True),
+    )
+    assert wallet_1.balance == Decimal('10.00')
+    assert wallet_2.balance == Decimal('10.00')
+    assert wallet_3.balance == Decimal('1906.37')
+
+
+@pytest.mark.django_db
+def test_transfer_money_in_batch__all_or_nothing_failed__nothing_applied():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfers = [
+        {'sender': wallet_1.pk, 'recipient': wallet_2.pk, 'amount': Decimal(30)},
+        {'sender': wallet_1.pk, 'recipient': wallet_2.pk, 'amount': Decimal(30)},
+    ]
+
+    # act
+    with pytest.raises(WalletOperationException):
+        transfer_money_in_batch(
+            sender=user_1,
+            transfers=transfers,
+        )
+    wallet_1 = Wallet.objects.get(pk=wallet_1.pk)
+
+    # assert
+    assert wallet_1.balance == Decimal('50.00')
+    assert not Transaction.objects.exists()
+
+
+@pytest.mark.django_db
+def test_transfer_money_in_batch__best_effort__failed_items_skipped():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfers = [
+        {'sender': wallet_1.pk, 'recipient': wallet_2.pk, 'amount': Decimal(30)},
+        {'sender': wallet_1.pk, 'recipient': wallet_2.pk, 'amount': Decimal(30)},
+        {'sender': wallet_2.pk, 'recipient': wallet_1.pk, 'amount': Decimal(5)},
+        {'sender': wallet_1.pk, 'recipient': 100500, 'amount': Decimal(5)},
+        {'sender': wallet_1.pk, 'recipient': wallet_2.pk, 'amount': Decimal(20)},
+    ]
+
+    # act
+    results = transfer_money_in_batch(
+        sender=user_1,
+        transfers=transfers,
+        all_or_nothing=False,
+    )
+    wallet_1 = Wallet.objects.get(pk=wallet_1.pk)
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+
+    # assert
+    assert ['transaction' in result for result in results] == [True, False, False, False, True]
+    assert all('error' in result for result in results[1:4])
+    assert wallet_1.balance == Decimal('0.00')
+    assert wallet_2.balance == Decimal('50.00')
+    assert Transaction.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_transfer_money_between_wallets__sharded_recipient__credit_goes_to_shard():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='USD',
+        init_balance=Decimal(5),
+    )
+    enable_wallet_balance_shards(wallet_id=wallet_2.pk, shards_count=4)
+
+    # act
+    for _ in range(3):
+        transfer_money_between_wallets(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(10),
+        )
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+
+    # assert
+    assert wallet_2.balance == Decimal('5.00')
+    assert sorted(wallet_2.balance_shards.values_list('balance', flat=True)) == [
+        Decimal('0.00'),
+        Decimal('10.00'),
+        Decimal('10.00'),
+        Decimal('10.00'),
+    ]
+    assert get_wallet_balance(wallet_2) == Decimal('35.00')
+
+
+@pytest.mark.django_db
+def test_transfer_money_between_wallets__sharded_sender__shards_folded_before_debit():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    enable_wallet_balance_shards(wallet_id=wallet_2.pk, shards_count=2)
+    for _ in range(2):
+        transfer_money_between_wallets(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(20),
+        )
+
+    # act
+    transfer_money_between_wallets(
+        sender=user_2,
+        sender_wallet_id=wallet_2.pk,
+        recipient_wallet_id=wallet_1.pk,
+        amount=Decimal(30),
+    )
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+
+    # assert
+    assert wallet_2.balance == Decimal('10.00')
+    assert get_wallet_balance(wallet_2) == Decimal('10.00')
+    with pytest.raises(WalletOperationException):
+        transfer_money_between_wallets(
+            sender=user_2,
+            sender_wallet_id=wallet_2.pk,
+            recipient_wallet_id=wallet_1.pk,
+            amount=Decimal(11),
+        )
+
+
+@pytest.mark.django_db
+def test_fold_balance_shards__proper_call__shards_moved_to_balance():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(1),
+    )
+    enable_wallet_balance_shards(wallet_id=wallet_2.pk, shards_count=3)
+    for _ in range(3):
+        transfer_money_between_wallets(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(7),
+        )
+
+    # act
+    fold_balance_shards()
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+
+    # assert
+    assert wallet_2.balance == Decimal('22.00')
+    assert set(wallet_2.balance_shards.values_list('balance', flat=True)) == {Decimal('0.00')}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_fold_balance_shards__concurrent_credit_to_shard__no_deadlock(mocker):
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(1),
+    )
+    enable_wallet_balance_shards(wallet_id=wallet_2.pk, shards_count=1)
+    transfer_money_between_wallets(
+        sender=user_1,
+        sender_wallet_id=wallet_1.pk,
+        recipient_wallet_id=wallet_2.pk,
+        amount=Decimal(7),
+    )
+    # зачисление уже обновило часть и ждёт, пока свёртка заблокирует
+    # кошелёк и встанет в очередь за этой частью; вставка перевода
+    # после этого берёт KEY SHARE на строку кошелька
+    shard_updated = threading.Event()
+    fold_started = threading.Event()
+    original_create_transaction = create_transaction
+
+    def create_transaction_after_fold(**kwargs):
+        shard_updated.set()
+        fold_started.wait(timeout=1)
+        time.sleep(0.2)
+        return original_create_transaction(**kwargs)
+
+    mocker.patch('wallet.services.create_transaction', side_effect=create_transaction_after_fold)
+    errors = []
+
+    def run_credit():
+        try:
+            transfer_money_between_wallets(
+                sender=user_1,
+                sender_wallet_id=wallet_1.pk,
+                recipient_wallet_id=wallet_2.pk,
+                amount=Decimal(5),
+            )
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def run_fold():
+        try:
+            shard_updated.wait(timeout=1)
+            fold_started.set()
+            fold_balance_shards()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run_credit), threading.Thread(target=run_fold)]
+
+    # act
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # assert
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+    assert errors == []
+    assert get_wallet_balance(wallet_2) == Decimal('13.00')
+    assert wallet_2.balance == Decimal('13.00')
+
+
+@pytest.mark.django_db
+def test_enable_wallet_balance_shards__count_lowered_to_0__shards_folded_and_debitable():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(1),
+    )
+    enable_wallet_balance_shards(wallet_id=wallet_2.pk, shards_count=3)
+    for _ in range(3):
+        transfer_money_between_wallets(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(7),
+        )
+
+    # act
+    enable_wallet_balance_shards(wallet_id=wallet_2.pk, shards_count=0)
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+    balance = get_wallet_balance(wallet_2)
+    transfer_money_between_wallets(
+        sender=user_1,
+        sender_wallet_id=wallet_2.pk,
+        recipient_wallet_id=wallet_1.pk,
+        amount=Decimal(22),
+    )
+
+    # assert
+    assert balance == Decimal('22.00')
+    assert wallet_2.shards_count == 0
+    assert Wallet.objects.get(pk=wallet_2.pk).balance == Decimal('0.00')
+    assert set(wallet_2.balance_shards.values_list('balance', flat=True)) == {Decimal('0.00')}
+
+
+@pytest.mark.django_db
+def test_decrease_wallet_balance__leftover_shards_without_sharding__shards_folded():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(1),
+    )
+    enable_wallet_balance_shards(wallet_id=wallet_1.pk, shards_count=2)
+    # зачисление, которое пришло в часть одновременно со снятием разбиения
+    wallet_1.balance_shards.filter(number=0).update(balance=Decimal(9))
+    Wallet.objects.filter(pk=wallet_1.pk).update(shards_count=0)
+    wallet_1 = Wallet.objects.get(pk=wallet_1.pk)
+
+    # act
+    with atomic():
+        decrease_wallet_balance(wallet=wallet_1, amount=Decimal(10))
+
+    # assert
+    assert Wallet.objects.get(pk=wallet_1.pk).balance == Decimal('0.00')
+
+
+@pytest.mark.django_db
+def test_process_pending_transfers__proper_call__transfers_applied_and_marked():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='USD',
+        init_balance=Decimal(10),
+    )
+    pending_transfers = [
+        create_pending_transfer(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(40),
+        ),
+        create_pending_transfer(
+            sender=user_2,
+            sender_wallet_id=wallet_2.pk,
+            recipient_wallet_id=wallet_1.pk,
+            amount=Decimal(15),
+        ),
+        create_pending_transfer(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(40),
+        ),
+        create_pending_transfer(
+            sender=user_2,
+            sender_wallet_id=wallet_2.pk,
+            recipient_wallet_id=wallet_1.pk,
+            amount=Decimal(1),
+        ),
+    ]
+
+    # act
+    processed = process_pending_transfers(batch_size=3)
+    wallet_1 = Wallet.objects.get(pk=wallet_1.pk)
+    wallet_2 = Wallet.objects.get(pk=wallet_2.pk)
+
+    # assert
+    statuses = [
+        PendingTransfer.objects.get(pk=pending_transfer.pk)
+        for pending_transfer in pending_transfers
+    ]
+    assert processed == 3
+    assert [pending_transfer.status for pending_transfer in statuses] == ['done', 'done', 'failed', 'pending']
+    assert statuses[0].transaction.amount == Decimal('40.00')
+    assert statuses[2].error
+    assert wallet_1.balance == Decimal('25.00')
+    assert wallet_2.balance == Decimal('35.00')
+
+
+@pytest.mark.django_db
+def test_process_pending_transfers__recipient_balance_overflow__only_that_transfer_failed():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    wallet_3 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    Wallet.objects.filter(pk=wallet_3.pk).update(balance=Decimal('999999990.00'))
+    pending_transfers = [
+        create_pending_transfer(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_3.pk,
+            amount=Decimal(20),
+        ),
+        create_pending_transfer(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=wallet_2.pk,
+            amount=Decimal(15),
+        ),
+    ]
+
+    # act
+    processed = process_pending_transfers(batch_size=10)
+
+    # assert
+    statuses = [
+        PendingTransfer.objects.get(pk=pending_transfer.pk)
+        for pending_transfer in pending_transfers
+    ]
+    assert processed == 2
+    assert [pending_transfer.status for pending_transfer in statuses] == ['failed', 'done']
+    assert statuses[0].error == 'Баланс получателя превысит допустимый.'
+    assert Wallet.objects.get(pk=wallet_1.pk).balance == Decimal('35.00')
+    assert Wallet.objects.get(pk=wallet_2.pk).balance == Decimal('15.00')
+    assert Wallet.objects.get(pk=wallet_3.pk).balance == Decimal('999999990.00')
+
+
+@pytest.mark.django_db
+def test_process_pending_transfers__data_error_in_group__group_retried_one_by_one(mocker):
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1, wallet_2, wallet_3 = [
+        create_wallet(user=user_1, currency='USD', init_balance=Decimal(50))
+        for _ in range(3)
+    ]
+    pending_transfers = [
+        create_pending_transfer(
+            sender=user_1,
+            sender_wallet_id=wallet_1.pk,
+            recipient_wallet_id=recipient_wallet.pk,
+            amount=Decimal(10),
+        )
+        for recipient_wallet in (wallet_2, wallet_3)
+    ]
+    original_set_wallet_balances = set_wallet_balances
+
+    def set_wallet_balances_failing_for_wallet_3(balances):
+        if wallet_3.pk in balances:
+            raise DataError('numeric field overflow')
+        original_set_wallet_balances(balances)
+
+    mocker.patch(
+        'wallet.services.set_wallet_balances',
+        side_effect=set_wallet_balances_failing_for_wallet_3,
+    )
+
+    # act
+    processed = process_pending_transfers(batch_size=10)
+
+    # assert
+    statuses = [
+        PendingTransfer.objects.get(pk=pending_transfer.pk)
+        for pending_transfer in pending_transfers
+    ]
+    assert processed == 2
+    assert [pending_transfer.status for pending_transfer in statuses] == ['done', 'failed']
+    assert statuses[1].error == 'numeric field overflow'
+    assert Wallet.objects.get(pk=wallet_1.pk).balance == Decimal('40.00')
+    assert Wallet.objects.get(pk=wallet_2.pk).balance == Decimal('60.00')
+    assert Wallet.objects.get(pk=wallet_3.pk).balance == Decimal('50.00')
+    assert Transaction.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_process_pending_transfers__empty_queue__return_0():
+    # act & assert
+    assert process_pending_transfers(batch_size=10) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_process_pending_transfers__concurrent_workers__no_deadlock(mocker):
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1, wallet_2 = [
+        create_wallet(user=user_1, currency='USD', init_balance=Decimal(50))
+        for _ in range(2)
+    ]
+    wallet_3, wallet_4 = [
+        create_wallet(user=user_2, currency='USD', init_balance=Decimal(50))
+        for _ in range(2)
+    ]
+    # каждому обработчику достаётся пачка, в которой группы отправителей
+    # идут в обратном порядке относительно пачки другого обработчика
+    for sender, sender_wallet, recipient_wallet in [
+        (user_1, wallet_1, wallet_2),
+        (user_2, wallet_3, wallet_4),
+        (user_2, wallet_4, wallet_3),
+        (user_1, wallet_2, wallet_1),
+    ]:
+        create_pending_transfer(
+            sender=sender,
+            sender_wallet_id=sender_wallet.pk,
+            recipient_wallet_id=recipient_wallet.pk,
+            amount=Decimal(10),
+        )
+    # оба обработчика держат первые блокировки одновременно, прежде чем
+    # пойти за следующими
+    barrier = threading.Barrier(2, timeout=1)
+    original_lock_wallets = lock_wallets
+
+    def lock_wallets_together(wallet_ids):
+        wallets = original_lock_wallets(wallet_ids)
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        return wallets
+
+    mocker.patch('wallet.services.lock_wallets', side_effect=lock_wallets_together)
+    errors = []
+
+    def run_worker():
+        try:
+            process_pending_transfers(batch_size=2)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run_worker) for _ in range(2)]
+
+    # act
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # assert
+    assert errors == []
+    assert list(PendingTransfer.objects.values_list('status', flat=True).distinct()) == ['done']
+    assert set(Wallet.objects.values_list('balance', flat=True)) == {Decimal('50.00')}
+
+
+@pytest.mark.django_db
+def test_retrieve_transactions_by_wallet_id__proper_call__return_transactions():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    user_2 = create_user(
+        email='test2@test.com',
+        password='test2',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_2,
+        currency='RUB',
+        init_balance=Decimal(0),
+    )
+    create_transaction(
+        sender=wallet_1,
+        recipient=wallet_2,
+        amount=Decimal(10.0),
+        exchange_rate=Decimal(63.54691),
+    )
+    create_transaction(
+        sender=wallet_1,
+        recipient=wallet_2,
+        amount=Decimal(30.0),
+        exchange_rate=Decimal(61.33420),
+    )
+    create_transaction(
+        sender=wallet_2,
+        recipient=wallet_1,
+        amount=Decimal(300.0),
+        exchange_rate=Decimal(0.01598),
+    )
+
+    # act
+    transactions = retrieve_transactions_by_wallet_id(
+        user=user_1,
+        wallet_id=wallet_1.pk,
+    )
+
+    # assert
+    assert len(transactions) == 3
+
+
+@pytest.mark.django_db
+def test_retrieve_transactions_by_wallet_id__user_do_not_own_wallet__raise_exception():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+
+    # act & assert
+    with pytest.raises(WalletOperationException):
+        retrieve_transactions_by_wallet_id(
+            user=user_1,
+            wallet_id=100,
+        )
+
+
+@pytest.mark.django_db
+def test_retrieve_transactions_page__several_pages__walk_all_transactions():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    created_at = timezone.now()
+    transactions = [
+        create_transaction(
+            sender=wallet_1,
+            recipient=wallet_2,
+            amount=Decimal(1),
+            exchange_rate=Decimal(1),
+        )
+        for _ in range(5)
+    ]
+    # одинаковое время у части транзакций: порядок держится на id
+    Transaction.objects.filter(
+        pk__in=[transaction.pk for transaction in transactions[:3]],
+    ).update(created_at=created_at)
+
+    # act
+    pages = []
+    after = None
+    while True:
+        page, cursor = retrieve_transactions_page(
+            user=user_1,
+            wallet_id=wallet_1.pk,
+            limit=2,
+            after=after,
+        )
+        pages.append([transaction.pk for transaction in page])
+        if cursor is None:
+            break
+        after = decode_transactions_cursor(cursor)
+
+    # assert
+    assert [len(page) for page in pages] == [2, 2, 1]
+    walked = [pk for page in pages for pk in page]
+    expected = list(
+        Transaction.objects
+        .order_by('-created_at', '-pk')
+        .values_list('pk', flat=True)
+    )
+    assert walked == expected
+
+
+def test_decode_transactions_cursor__garbage__raise_exception():
+    # act & assert
+    with pytest.raises(WalletOperationException):
+        decode_transactions_cursor('not-a-cursor')
+
+
+@pytest.mark.django_db
+def test_retrieve_transactions_page__large_table__ordered_index_scans():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallets = [
+        create_wallet(
+            user=user_1,
+            currency='USD',
+            init_balance=Decimal(0),
+        )
+        for _ in range(50)
+    ]
+    Transaction.objects.bulk_create(
+        [
+            Transaction(
+                sender=wallets[number % 50],
+                recipient=wallets[(number * 7 + 1) % 50],
+                amount=Decimal(1),
+            )
+            for number in range(20000)
+        ],
+        batch_size=5000,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE wallet_transaction')
+    captured = []
+
+    def capture(execute, sql, params, many, context):
+        captured.append((sql, params))
+        return execute(sql, params, many, context)
+
+    # act
+    with connection.execute_wrapper(capture):
+        page, cursor = retrieve_transactions_page(
+            user=user_1,
+            wallet_id=wallets[0].pk,
+            limit=20,
+        )
+    sql, params = captured[-1]
+    with connection.cursor() as db_cursor:
+        db_cursor.execute('EXPLAIN ' + sql, params)
+        plan = '\n'.join(row[0] for row in db_cursor.fetchall())
+
+    # assert
+    assert len(page) == 20
+    assert cursor is not None
+    assert 'UNION ALL' in sql
+    assert 'transaction_sender_created' in plan
+    assert 'transaction_recipient_created' in plan
+    assert 'Seq Scan' not in plan
+    assert 'Bitmap' not in plan
+    # сортируется только объединение двух обрезанных потоков
+    assert plan.count('Sort') == 1
+
+
+@pytest.mark.django_db
+def test_retrieve_transaction_rows_page__proper_call__same_page_as_models():
+    # arrange
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(50),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    for _ in range(3):
+        create_transaction(
+            sender=wallet_1,
+            recipient=wallet_2,
+            amount=Decimal(1),
+            exchange_rate=Decimal(1),
+        )
+
+    # act
+    rows, rows_cursor = retrieve_transaction_rows_page(
+        user=user_1,
+        wallet_id=wallet_1.pk,
+        fields=('id', 'created_at', 'amount'),
+        limit=2,
+    )
+    transactions, cursor = retrieve_transactions_page(
+        user=user_1,
+        wallet_id=wallet_1.pk,
+        limit=2,
+    )
+
+    # assert
+    assert rows == [
+        (transaction.pk, transaction.created_at, transaction.amount)
+        for transaction in transactions
+    ]
+    assert rows_cursor == cursor
+
+
+def create_statement_history():
+    user_1 = create_user(
+        email='test1@test.com',
+        password='test1',
+    )
+    wallet_1 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(100),
+    )
+    wallet_2 = create_wallet(
+        user=user_1,
+        currency='RUB',
+        init_balance=Decimal(0),
+    )
+    today = timezone.localdate()
+    first_day_start = get_day_start(today - timedelta(days=3))
+    Wallet.objects.update(created_at=first_day_start)
+    history = [
+        (wallet_1, wallet_2, Decimal('10.00'), Decimal('63.54691'), first_day_start + timedelta(hours=10)),
+        (wallet_2, wallet_1, Decimal('300.00'), Decimal('0.01598'), first_day_start + timedelta(days=1, hours=12)),
+        (wallet_1, wallet_2, Decimal('1.00'), Decimal('63.54691'), timezone.now() - timedelta(seconds=1)),
+    ]
+    for sender, recipient, amount, exchange_rate, created_at in history:
+        transaction = create_transaction(
+            sender=sender,
+            recipient=recipient,
+            amount=amount,
+            exchange_rate=exchange_rate,
+        )
+        Transaction.objects.filter(pk=transaction.pk).update(created_at=created_at)
+    wallet_1.refresh_from_db()
+    wallet_2.refresh_from_db()
+    return user_1, wallet_1, wallet_2, first_day_start
+
+
+@pytest.mark.django_db
+def test_create_balance_snapshots__closed_days__snapshot_per_active_wallet_and_day():
+    # arrange
+    _, wallet_1, wallet_2, first_day_start = create_statement_history()
+    first_day = timezone.localtime(first_day_start).date()
+
+    # act
+    created = create_balance_snapshots()
+    created_again = create_balance_snapshots()
+
+    # assert
+    assert created == 4
+    assert created_again == 0
+    snapshots = {
+        (snapshot.wallet_id, snapshot.date): snapshot
+        for snapshot in WalletBalanceSnapshot.objects.all()
+    }
+    first = snapshots[(wallet_1.pk, first_day)]
+    assert (first.balance, first.incoming, first.outgoing) == (
+        Decimal('90.00'), Decimal('0.00'), Decimal('10.00'),
+    )
+    second = snapshots[(wallet_1.pk, first_day + timedelta(days=1))]
+    assert (second.balance, second.incoming, second.outgoing) == (
+        Decimal('94.79'), Decimal('4.79'), Decimal('0.00'),
+    )
+    assert snapshots[(wallet_2.pk, first_day)].balance == Decimal('635.47')
+
+
+@pytest.mark.django_db
+def test_get_wallet_balance_at__with_and_without_snapshots__same_balance():
+    # arrange
+    _, wallet_1, _, first_day_start = create_statement_history()
+    moments = [
+        first_day_start - timedelta(hours=1),
+        first_day_start + timedelta(hours=11),
+        first_day_start + timedelta(days=2),
+        timezone.now(),
+    ]
+    replayed = [
+        get_wallet_balance_at(wallet=wallet_1, moment=moment)
+        for moment in moments
+    ]
+
+    # act
+    create_balance_snapshots()
+    with_snapshots = [
+        get_wallet_balance_at(wallet=wallet_1, moment=moment)
+        for moment in moments
+    ]
+
+    # assert
+    assert replayed == [
+        Decimal(0),
+        Decimal('90.00'),
+        Decimal('94.79'),
+        Decimal('93.79'),
+    ]
+    assert with_snapshots == replayed
+
+
+@pytest.mark.django_db
+def test_retrieve_wallet_statement__period_over_snapshots__balances_add_up():
+    # arrange
+    user_1, wallet_1, _, first_day_start = create_statement_history()
+    create_balance_snapshots()
+
+    # act
+    statement = retrieve_wallet_statement(
+        user=user_1,
+        wallet_id=wallet_1.pk,
+        start=first_day_start + timedelta(hours=11),
+        end=timezone.now(),
+    )
+
+    # assert
+    assert statement.opening_balance == Decimal('90.00')
+    assert statement.incoming == Decimal('4.79')
+    assert statement.outgoing == Decimal('1.00')
+    assert statement.closing_balance == Decimal('93.79')
+    assert (
+        statement.opening_balance + statement.incoming - statement.outgoing
+        == statement.closing_balance
+    )
+
+
+@pytest.mark.django_db
+def test_retrieve_wallet_statement__start_after_end__raise_exception():
+    # arrange
+    user_1, wallet_1, _, first_day_start = create_statement_history()
+
+    # act & assert
+    with pytest.raises(WalletOperationException):
+        retrieve_wallet_statement(
+            user=user_1,
+            wallet_id=wallet_1.pk,
+            start=first_day_start,
+            end=first_day_start - timedelta(days=1),
+        )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('mode', [LOCKING_TRANSFER_MODE, RETURNING_TRANSFER_MODE])
+def test_transfer_money_between_wallets__proper_call__debit_and_credit_entries(mocker, settings, two_wallets, mode):
+    # arrange
+    settings.WALLET_TRANSFER_MODE = mode
+    user_1, wallet_1, wallet_2 = two_wallets
+    mocker.patch(
+        'wallet.services.get_current_exchange_rate',
+        return_value=Decimal('63.54563'),
+    )
+
+    # act
+    transaction = transfer_money_between_wallets(
+        sender=user_1,
+        sender_wallet_id=wallet_1.pk,
+        recipient_wallet_id=wallet_2.pk,
+        amount=Decimal('10.50'),
+    )
+
+    # assert
+    assert list(
+        LedgerEntry.objects.order_by('pk').values_list('transaction_id', 'wallet_id', 'amount'),
+    ) == [
+        (transaction.pk, wallet_1.pk, Decimal('-10.50')),
+        (transaction.pk, wallet_2.pk, Decimal('667.23')),
+    ]
+    assert get_ledger_balance(wallet_1) == Decimal('39.50')
+    assert get_ledger_balance(wallet_2) == Decimal('667.23')
+
+
+@pytest.mark.django_db
+def test_transfer_money_in_batch__best_effort__entries_for_applied_transfers_only(two_wallets):
+    # arrange
+    user_1, wallet_1, wallet_2 = two_wallets
+    wallet_3 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfers = [
+        {'sender': wallet_1.pk, 'recipient': wallet_3.pk, 'amount': Decimal(30)},
+        {'sender': wallet_1.pk, 'recipient': wallet_3.pk, 'amount': Decimal(100)},
+        {'sender': wallet_3.pk, 'recipient': wallet_1.pk, 'amount': Decimal(5)},
+    ]
+
+    # act
+    transfer_money_in_batch(
+        sender=user_1,
+        transfers=transfers,
+        all_or_nothing=False,
+    )
+
+    # assert
+    assert LedgerEntry.objects.count() == 4
+    assert get_ledger_balance(wallet_1) == Decimal('25.00')
+    assert get_ledger_balance(wallet_3) == Decimal('25.00')
+    assert get_ledger_balance(wallet_2) == Decimal('0.00')
+
+
+@pytest.mark.django_db
+def test_ledger_entry__update_or_delete__rejected_by_database(two_wallets):
+    # arrange
+    user_1, wallet_1, wallet_2 = two_wallets
+    wallet_3 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfer_money_between_wallets(
+        sender=user_1,
+        sender_wallet_id=wallet_1.pk,
+        recipient_wallet_id=wallet_3.pk,
+        amount=Decimal(10),
+    )
+
+    # act & assert
+    with pytest.raises(DatabaseError), atomic():
+        LedgerEntry.objects.update(amount=0)
+    with pytest.raises(DatabaseError), atomic():
+        LedgerEntry.objects.all().delete()
+    assert LedgerEntry.objects.count() == 2
+
+
+def transfer_between_usd_wallets(user, sender_wallet, recipient_wallet, count):
+    for _ in range(count):
+        transfer_money_between_wallets(
+            sender=user,
+            sender_wallet_id=sender_wallet.pk,
+            recipient_wallet_id=recipient_wallet.pk,
+            amount=Decimal(1),
+        )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_ledger_checkpoints__settled_entries__checkpoint_per_active_wallet(two_wallets):
+    # arrange
+    user_1, wallet_1, wallet_2 = two_wallets
+    wallet_3 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfer_between_usd_wallets(user_1, wallet_1, wallet_3, 3)
+    create_ledger_checkpoints()
+
+    # act
+    created = create_ledger_checkpoints()
+
+    # assert
+    assert created == 2
+    assert dict(
+        wallet_1.balance_checkpoints.values_list('ledger_entry_id', 'balance'),
+    ) == {LedgerEntry.objects.latest('pk').pk: Decimal('47.00')}
+    assert wallet_2.balance_checkpoints.count() == 0
+    assert create_ledger_checkpoints() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_ledger_checkpoints__next_run__only_new_entries_read(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = two_wallets
+    wallet_3 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfer_between_usd_wallets(user_1, wallet_1, wallet_3, 3)
+    create_ledger_checkpoints()
+    create_ledger_checkpoints()
+    transfer_between_usd_wallets(user_1, wallet_3, wallet_1, 2)
+    create_ledger_checkpoints()
+
+    # act
+    created = create_ledger_checkpoints()
+
+    # assert
+    assert created == 2
+    assert wallet_1.balance_checkpoints.order_by('-ledger_entry_id')[0].balance == Decimal('49.00')
+    assert wallet_3.balance_checkpoints.order_by('-ledger_entry_id')[0].balance == Decimal('1.00')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_ledger_checkpoints__first_run__entries_left_for_next_run(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = two_wallets
+    wallet_3 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfer_between_usd_wallets(user_1, wallet_1, wallet_3, 3)
+
+    # act
+    created = create_ledger_checkpoints()
+
+    # assert
+    assert created == 0
+    assert get_ledger_balance(wallet_1) == Decimal('47.00')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_ledger_checkpoints__smaller_id_committed_later__entry_not_skipped(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = two_wallets
+    wallet_3, wallet_4, wallet_5 = [
+        create_wallet(user=user_1, currency='USD', init_balance=Decimal(50))
+        for _ in range(3)
+    ]
+    # перевод берёт меньшие id проводок, но коммитится после того, как
+    # более поздний перевод уже виден запускам
+    transfer_written = threading.Event()
+    later_transfer_done = threading.Event()
+    errors = []
+
+    def run_slow_transfer():
+        try:
+            with atomic():
+                transfer_between_usd_wallets(user_1, wallet_3, wallet_4, 1)
+                transfer_written.set()
+                later_transfer_done.wait(timeout=5)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run_slow_transfer)
+    thread.start()
+    transfer_written.wait(timeout=5)
+    transfer_between_usd_wallets(user_1, wallet_1, wallet_5, 2)
+    runs_before_commit = [create_ledger_checkpoints(), create_ledger_checkpoints()]
+    later_transfer_done.set()
+    thread.join()
+
+    # act
+    create_ledger_checkpoints()
+    create_ledger_checkpoints()
+
+    # assert
+    assert errors == []
+    assert runs_before_commit == [0, 0]
+    assert get_ledger_balance(wallet_4) == Decimal('51.00')
+    assert wallet_4.balance_checkpoints.latest('ledger_entry_id').balance == Decimal('51.00')
+    assert wallet_5.balance_checkpoints.latest('ledger_entry_id').balance == Decimal('52.00')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_ledger_balance__checkpoint_and_tail__equal_to_wallet_balance(two_wallets):
+    # arrange
+    user_1, wallet_1, _ = two_wallets
+    wallet_3 = create_wallet(
+        user=user_1,
+        currency='USD',
+        init_balance=Decimal(0),
+    )
+    transfer_between_usd_wallets(user_1, wallet_1, wallet_3, 3)
+    create_ledger_checkpoints()
+    create_ledger_checkpoints()
+    transfer_between_usd_wallets(user_1, wallet_3, wallet_1, 1)
+    transfer_between_usd_wallets(user_1, wallet_1, wallet_3, 5)
+
+    # act
+    balances = [get_ledger_balance(wallet_1), get_ledger_balance(wallet_3)]
+
+    # assert
+    assert balances == [
+        Wallet.objects.get(pk=wallet_1.pk).balance,
+        Wallet.objects.get(pk=wallet_3.pk).balance,
+    ]
+    assert balances == [Decimal('43.00'), Decimal('7.00')]
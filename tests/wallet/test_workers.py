@@ -0,0 +1,26 @@
+from django.db import OperationalError
+
+from wallet.workers import run_transfer_worker
+
+
+def test_run_transfer_worker__database_error__logged_and_retried(mocker):
+    # arrange
+    process_mocker = mocker.patch(
+        'wallet.workers.process_pending_transfers',
+        side_effect=[
+            OperationalError('deadlock detected'),
+            OperationalError('deadlock detected'),
+            3,
+            KeyboardInterrupt,
+        ],
+    )
+    sleep_mocker = mocker.patch('wallet.workers.time.sleep')
+    logger_mocker = mocker.patch('wallet.workers.logger')
+
+    # act
+    run_transfer_worker(batch_size=10, poll_interval=0.5)
+
+    # assert
+    assert process_mocker.call_count == 4
+    assert [call[0][0] for call in sleep_mocker.call_args_list] == [1.0, 2.0]
+    assert logger_mocker.exception.call_count == 2
@@ -0,0 +1,108 @@
+import os
+
+import pytest
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import (
+    MmapedDict,
+    mmap_key,
+)
+
+from wallet_demo.metrics import (
+    MULTIPROCESS_DIR_ENV,
+    render_metrics,
+)
+
+
+def get_sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.django_db
+def test_metrics_middleware__resolved_view__observed_with_view_name(client):
+    # arrange
+    labels = {'view': 'UserRegistrationView', 'method': 'POST', 'status': '400'}
+    before = get_sample('http_requests_total', labels)
+    duration_before = get_sample(
+        'http_request_duration_seconds_count',
+        {'view': 'UserRegistrationView', 'method': 'POST'},
+    )
+
+    # act
+    response = client.post('/api/v1/signup/', {}, content_type='application/json')
+
+    # assert
+    assert response.status_code == 400
+    assert get_sample('http_requests_total', labels) - before == 1
+    assert get_sample(
+        'http_request_duration_seconds_count',
+        {'view': 'UserRegistrationView', 'method': 'POST'},
+    ) - duration_before == 1
+
+
+@pytest.mark.django_db
+def test_metrics_middleware__db_queries__counted_per_view(client):
+    # arrange
+    labels = {'view': 'health_check'}
+    queries_before = get_sample('http_request_db_queries_sum', labels)
+    requests_before = get_sample('http_request_db_queries_count', labels)
+
+    # act
+    client.get('/health/')
+
+    # assert
+    assert get_sample('http_request_db_queries_sum', labels) - queries_before == 1
+    assert get_sample('http_request_db_queries_count', labels) - requests_before == 1
+    assert get_sample('http_request_db_duration_seconds_sum', labels) > 0
+
+
+@pytest.mark.django_db
+def test_metrics_middleware__unknown_path__observed_as_unresolved(client):
+    # arrange
+    labels = {'view': 'unresolved', 'method': 'GET', 'status': '404'}
+    before = get_sample('http_requests_total', labels)
+
+    # act
+    client.get('/unknown/')
+
+    # assert
+    assert get_sample('http_requests_total', labels) - before == 1
+
+
+@pytest.mark.django_db
+def test_metrics__proper_call__return_prometheus_text(client):
+    # arrange
+    client.get('/health/')
+
+    # act
+    response = client.get('/metrics')
+
+    # assert
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    body = response.content.decode()
+    assert 'http_request_duration_seconds_bucket{' in body
+    assert '# TYPE wallet_transfers_total counter' in body
+
+
+def test_render_metrics__multiprocess_dir__sum_workers(tmp_path, monkeypatch):
+    # arrange
+    monkeypatch.setenv(MULTIPROCESS_DIR_ENV, str(tmp_path))
+    key = mmap_key(
+        'wallet_transfers',
+        'wallet_transfers_total',
+        ['sender_currency', 'recipient_currency'],
+        ['USD', 'EUR'],
+    )
+    for pid, value in [(101, 2.0), (102, 3.0)]:
+        values = MmapedDict(os.path.join(tmp_path, f'counter_{pid}.db'))
+        values.write_value(key, value)
+        values.close()
+
+    # act
+    body = render_metrics().decode()
+
+    # assert
+    assert (
+        'wallet_transfers_total{recipient_currency="EUR",sender_currency="USD"} 5.0'
+        in body
+    )
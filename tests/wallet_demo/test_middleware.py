@@ -0,0 +1,51 @@
+import pytest
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from wallet_demo.middleware import ConnectionHealthCheckMiddleware
+from wallet_demo.views import health_check
+
+
+@pytest.fixture
+def middleware(settings):
+    settings.DB_HEALTH_CHECK_IDLE_TIME = 0
+    return ConnectionHealthCheckMiddleware(lambda request: HttpResponse())
+
+
+@pytest.mark.django_db
+def test_health_check__database_available__return_200():
+    # act
+    response = health_check(RequestFactory().get('/health/'))
+
+    # assert
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_connection_health_check__idle_connection_unusable__close_it(middleware, mocker):
+    # arrange
+    request = RequestFactory().get('/')
+    middleware(request)
+    connection.ensure_connection()
+    mocker.patch.object(connection, 'is_usable', return_value=False)
+    close_mocker = mocker.patch.object(connection, 'close')
+
+    # act
+    middleware(request)
+
+    # assert
+    close_mocker.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_connection_health_check__first_request__skip_check(middleware, mocker):
+    # arrange
+    connection.ensure_connection()
+    is_usable_mocker = mocker.patch.object(connection, 'is_usable')
+
+    # act
+    middleware(RequestFactory().get('/'))
+
+    # assert
+    is_usable_mocker.assert_not_called()
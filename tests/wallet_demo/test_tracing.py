@@ -0,0 +1,233 @@
+import json
+import logging
+from decimal import Decimal
+
+import pytest
+
+from wallet.models import (
+    LOCKING_TRANSFER_MODE,
+    RETURNING_TRANSFER_MODE,
+)
+from wallet.services import (
+    transfer_money_between_wallets,
+    update_exchange_rates,
+)
+from wallet_demo.tracing import (
+    NOOP_SPAN,
+    LogExporter,
+    Tracer,
+    ZipkinExporter,
+    current_trace,
+    tracer,
+)
+
+
+class RecordingExporter:
+
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append([span.to_dict('test') for span in spans])
+
+
+@pytest.fixture
+def exporter(mocker):
+    exporter = RecordingExporter()
+    mocker.patch.object(tracer, 'sample_rate', 1.0)
+    mocker.patch.object(tracer, 'exporter', exporter)
+    return exporter
+
+
+@pytest.fixture
+def recipient_currency():
+    # перевод без конвертации: курсы в этих тестах не загружены
+    return 'USD'
+
+
+def test_tracer__disabled__return_noop_span():
+    # arrange
+    disabled_tracer = Tracer(sample_rate=0.0, exporter=RecordingExporter())
+
+    # act
+    root = disabled_tracer.trace('operation')
+    child = disabled_tracer.span('operation.phase')
+
+    # assert
+    assert root is NOOP_SPAN
+    assert child is NOOP_SPAN
+    assert current_trace.get() is None
+
+
+def test_tracer__not_sampled__nested_traces_not_recorded():
+    # arrange
+    exporter = RecordingExporter()
+    sampling_tracer = Tracer(sample_rate=0.5, exporter=exporter, sampler=lambda: 0.9)
+
+    # act
+    with sampling_tracer.trace('request'):
+        nested = sampling_tracer.trace('operation')
+        phase = sampling_tracer.span('operation.phase')
+
+    # assert
+    assert nested is NOOP_SPAN
+    assert phase is NOOP_SPAN
+    assert exporter.traces == []
+    assert current_trace.get() is None
+
+
+def test_tracer__exception__span_tagged_with_error():
+    # arrange
+    exporter = RecordingExporter()
+    sampling_tracer = Tracer(sample_rate=1.0, exporter=exporter)
+
+    # act
+    with pytest.raises(ValueError):
+        with sampling_tracer.trace('operation'):
+            with sampling_tracer.span('operation.phase'):
+                raise ValueError
+
+    # assert
+    [spans] = exporter.traces
+    assert [span['tags']['error'] for span in spans] == ['ValueError', 'ValueError']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('mode, phases', [
+    (LOCKING_TRANSFER_MODE, [
+        'transfer.lock_wallets',
+        'transfer.exchange_rate',
+        'transfer.update_balances',
+        'transfer.create_transaction',
+        'transfer.create_ledger_entries',
+        'transfer.commit',
+    ]),
+    (RETURNING_TRANSFER_MODE, [
+        'transfer.lock_wallets',
+        'transfer.exchange_rate',
+        'transfer.update_returning',
+        'transfer.commit',
+    ]),
+])
+def test_transfer_money_between_wallets__sampled__phase_spans_exported(
+        exporter,
+        settings,
+        two_wallets,
+        mode,
+        phases,
+):
+    # arrange
+    settings.WALLET_TRANSFER_MODE = mode
+    user_1, wallet_1, wallet_2 = two_wallets
+
+    # act
+    transfer_money_between_wallets(
+        sender=user_1,
+        sender_wallet_id=wallet_1.pk,
+        recipient_wallet_id=wallet_2.pk,
+        amount=Decimal(10),
+    )
+
+    # assert
+    [spans] = exporter.traces
+    root = spans[-1]
+    assert root['name'] == 'transfer_money_between_wallets'
+    assert root['tags']['mode'] == mode
+    assert 'parentId' not in root
+    assert [span['name'] for span in spans[:-1]] == phases
+    assert {span['parentId'] for span in spans[:-1]} == {root['id']}
+    assert {span['traceId'] for span in spans} == {root['traceId']}
+
+
+@pytest.mark.django_db
+def test_update_exchange_rates__sampled__phase_spans_exported(exporter, mocker):
+    # arrange
+    mocker.patch(
+        'wallet.services.get_exchange_rates',
+        return_value={'USD': 1.1, 'RUB': 70.0, 'GBP': 0.85},
+    )
+
+    # act
+    update_exchange_rates()
+
+    # assert
+    [spans] = exporter.traces
+    assert [span['name'] for span in spans] == [
+        'exchange_rates.fetch',
+        'exchange_rates.derive',
+        'exchange_rates.store',
+        'exchange_rates.invalidate_cache',
+        'update_exchange_rates',
+    ]
+
+
+@pytest.mark.django_db
+def test_tracing_middleware__request_id__returned_and_set_on_spans(client, exporter):
+    # act
+    response = client.get('/health/', HTTP_X_REQUEST_ID='req-42')
+
+    # assert
+    assert response['X-Request-ID'] == 'req-42'
+    [spans] = exporter.traces
+    assert spans[-1]['name'] == 'http.request'
+    assert spans[-1]['tags'] == {
+        'method': 'GET',
+        'path': '/health/',
+        'view': 'health_check',
+        'status': '200',
+        'correlation_id': 'req-42',
+    }
+
+
+@pytest.mark.django_db
+def test_tracing_middleware__invalid_request_id__new_one_generated(client):
+    # act
+    response = client.get('/health/', HTTP_X_REQUEST_ID='bad id\nwith newline')
+
+    # assert
+    assert len(response['X-Request-ID']) == 32
+    assert response['X-Request-ID'] != 'bad id\nwith newline'
+
+
+def test_log_exporter__proper_call__span_logged_as_json(caplog):
+    # arrange
+    logging_tracer = Tracer(sample_rate=1.0, exporter=LogExporter(service_name='wallet-demo'))
+
+    # act
+    with caplog.at_level(logging.INFO, logger='wallet_demo.tracing.spans'):
+        with logging_tracer.trace('operation', key='value'):
+            pass
+
+    # assert
+    [record] = caplog.records
+    span = json.loads(record.getMessage())
+    assert span['name'] == 'operation'
+    assert span['tags'] == {'key': 'value'}
+    assert span['localEndpoint'] == {'serviceName': 'wallet-demo'}
+
+
+def test_zipkin_exporter__flush__spans_posted_in_batches(mocker):
+    # arrange
+    post_mocker = mocker.patch('wallet_demo.tracing.requests.post')
+    zipkin_exporter = ZipkinExporter(
+        url='http://collector:9411/api/v2/spans',
+        service_name='wallet-demo',
+        batch_size=2,
+    )
+    mocker.patch.object(zipkin_exporter, '_ensure_worker')
+    zipkin_tracer = Tracer(sample_rate=1.0, exporter=zipkin_exporter)
+    with zipkin_tracer.trace('operation'):
+        with zipkin_tracer.span('operation.first'):
+            pass
+        with zipkin_tracer.span('operation.second'):
+            pass
+
+    # act
+    zipkin_exporter.flush()
+    zipkin_exporter.flush()
+
+    # assert
+    assert post_mocker.call_count == 2
+    first_batch = post_mocker.call_args_list[0][1]['json']
+    assert [span['name'] for span in first_batch] == ['operation.first', 'operation.second']
+    assert post_mocker.call_args_list[0][0] == ('http://collector:9411/api/v2/spans',)
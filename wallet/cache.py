@@ -0,0 +1,72 @@
+import time
+from decimal import Decimal
+from threading import Lock
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+)
+
+from .metrics import EXCHANGE_RATES_CACHE_LOOKUPS
+
+
+RatesMatrix = Dict[str, Dict[str, Decimal]]
+
+
+class ExchangeRatesCache:
+    """
+    Кеш матрицы курсов валют в памяти процесса.
+
+    Пока не истёк TTL, матрица отдаётся без обращения к БД. После
+    истечения TTL запрашивается только версия последней пачки курсов,
+    и матрица перечитывается, лишь если версия изменилась.
+    """
+
+    def __init__(
+            self,
+            loader: Callable[[], RatesMatrix],
+            version_getter: Callable[[], Optional[Hashable]],
+            ttl: float,
+            timer: Callable[[], float] = time.monotonic,
+    ):
+        self._loader = loader
+        self._version_getter = version_getter
+        self._ttl = ttl
+        self._timer = timer
+        self._lock = Lock()
+        self._matrix = None
+        self._version = None
+        self._expires_at = 0.0
+
+    def get_matrix(self) -> RatesMatrix:
+        matrix = self._matrix
+        if matrix is not None and self._timer() < self._expires_at:
+            EXCHANGE_RATES_CACHE_LOOKUPS.labels('hit').inc()
+            return matrix
+
+        with self._lock:
+            now = self._timer()
+            if self._matrix is not None and now < self._expires_at:
+                EXCHANGE_RATES_CACHE_LOOKUPS.labels('hit').inc()
+                return self._matrix
+            # версию берём до загрузки: если между запросами появится
+            # новая пачка, на следующей проверке матрица перечитается
+            version = self._version_getter()
+            if self._matrix is None or version != self._version:
+                self._matrix = self._loader()
+                self._version = version
+                EXCHANGE_RATES_CACHE_LOOKUPS.labels('loaded').inc()
+            else:
+                EXCHANGE_RATES_CACHE_LOOKUPS.labels('revalidated').inc()
+            self._expires_at = now + self._ttl
+            return self._matrix
+
+    def get_rate(self, base_currency: str, target_currency: str) -> Optional[Decimal]:
+        return self.get_matrix().get(base_currency, {}).get(target_currency)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._matrix = None
+            self._version = None
+            self._expires_at = 0.0
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from ...services import compact_exchange_rates
+
+
+class Command(BaseCommand):
+    help = 'This command rolls old exchange rates up into hourly and daily aggregates'
+
+    def handle(self, *args, **options):
+        compact_exchange_rates()
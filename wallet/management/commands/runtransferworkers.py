@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from ...workers import run_transfer_workers
+
+
+class Command(BaseCommand):
+    help = 'Run worker processes which apply pending transfers in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=0.5,
+            help='Seconds to wait when the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        run_transfer_workers(
+            processes=options['processes'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ...services import enable_wallet_balance_shards
+
+
+class Command(BaseCommand):
+    help = 'This command spreads credits to a hot wallet over several balance shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('wallet_id', type=int)
+        parser.add_argument(
+            'shards_count',
+            type=int,
+            help='Number of balance shards, 0 disables sharding',
+        )
+
+    def handle(self, *args, **options):
+        enable_wallet_balance_shards(
+            wallet_id=options['wallet_id'],
+            shards_count=options['shards_count'],
+        )
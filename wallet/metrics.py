@@ -0,0 +1,31 @@
+from collections import Counter as PairsCounter
+from typing import Iterable
+
+from django.db import transaction
+from prometheus_client import Counter
+
+
+TRANSFERS = Counter(
+    'wallet_transfers',
+    'Проведённые переводы по валютам кошельков отправителя и получателя',
+    ['sender_currency', 'recipient_currency'],
+)
+EXCHANGE_RATES_CACHE_LOOKUPS = Counter(
+    'wallet_exchange_rates_cache_lookups',
+    'Обращения к кешу курсов: hit - из памяти, revalidated - версия в БД '
+    'не изменилась, loaded - матрица перечитана из БД',
+    ['result'],
+)
+
+
+def count_transfers(currency_pairs: Iterable[tuple]) -> None:
+    # переводы считаются только после коммита: откаченная транзакция, в
+    # том числе внешняя, не должна попадать в счётчик
+    pairs = PairsCounter(currency_pairs)
+
+    def increment() -> None:
+        for (sender_currency, recipient_currency), count in pairs.items():
+            TRANSFERS.labels(sender_currency, recipient_currency).inc(count)
+
+    if pairs:
+        transaction.on_commit(increment)
@@ -0,0 +1,54 @@
+# Generated by Django 2.2 on 2026-10-17 17:31
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_current_exchange_rates(apps, schema_editor):
+    ExchangeRate = apps.get_model('wallet', 'ExchangeRate')
+    CurrentExchangeRate = apps.get_model('wallet', 'CurrentExchangeRate')
+    last_records = ExchangeRate.objects.order_by(
+        'currency',
+        '-created_at',
+    ).distinct('currency')
+    CurrentExchangeRate.objects.bulk_create([
+        CurrentExchangeRate(
+            currency=record.currency,
+            rates=record.rates,
+            exchange_rate=record,
+        )
+        for record in last_records
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0002_auto_20200122_0813'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentExchangeRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('USD', 'USD'), ('EUR', 'EUR'), ('RUB', 'RUB'), ('GBP', 'GBP')], help_text='Код базовой валюты конвертирования по ISO', max_length=3, unique=True, verbose_name='Базовая валюта конвертирования')),
+                ('rates', django.contrib.postgres.fields.jsonb.JSONField(help_text='JSON с актуальными курсами валют', verbose_name='JSON с актуальными курсами валют')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='Дата и время обновления курсов', verbose_name='Дата и время обновления курсов')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='exchangerate',
+            index=models.Index(fields=['currency', '-created_at'], name='exchangerate_currency_created'),
+        ),
+        migrations.AddField(
+            model_name='currentexchangerate',
+            name='exchange_rate',
+            field=models.ForeignKey(help_text='Запись истории, из которой взяты курсы', on_delete=django.db.models.deletion.PROTECT, related_name='+', to='wallet.ExchangeRate', verbose_name='Запись истории, из которой взяты курсы'),
+        ),
+        migrations.RunPython(
+            fill_current_exchange_rates,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2 on 2026-10-17 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0003_current_exchange_rate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRateAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Час'), ('day', 'День')], help_text='Период агрегации', max_length=4, verbose_name='Период агрегации')),
+                ('currency', models.CharField(choices=[('USD', 'USD'), ('EUR', 'EUR'), ('RUB', 'RUB'), ('GBP', 'GBP')], help_text='Код базовой валюты конвертирования по ISO', max_length=3, verbose_name='Базовая валюта конвертирования')),
+                ('target_currency', models.CharField(choices=[('USD', 'USD'), ('EUR', 'EUR'), ('RUB', 'RUB'), ('GBP', 'GBP')], help_text='Код целевой валюты конвертирования по ISO', max_length=3, verbose_name='Целевая валюта конвертирования')),
+                ('period_start', models.DateTimeField(help_text='Начало периода', verbose_name='Начало периода')),
+                ('open', models.DecimalField(decimal_places=5, help_text='Курс на открытии периода', max_digits=10, verbose_name='Курс на открытии периода')),
+                ('high', models.DecimalField(decimal_places=5, help_text='Максимальный курс за период', max_digits=10, verbose_name='Максимальный курс за период')),
+                ('low', models.DecimalField(decimal_places=5, help_text='Минимальный курс за период', max_digits=10, verbose_name='Минимальный курс за период')),
+                ('close', models.DecimalField(decimal_places=5, help_text='Курс на закрытии периода', max_digits=10, verbose_name='Курс на закрытии периода')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='exchangerate',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, help_text='Дата и время создания записи о курсах валют', verbose_name='Дата и время создания записи о курсах валют'),
+        ),
+        migrations.AddConstraint(
+            model_name='exchangerateaggregate',
+            constraint=models.UniqueConstraint(fields=('period', 'currency', 'target_currency', 'period_start'), name='exchangerateaggregate_unique_period'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2 on 2026-10-17 17:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0004_exchange_rate_aggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='shards_count',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Зачисления распределяются по частям баланса, 0 - без разбиения', verbose_name='Количество частей баланса'),
+        ),
+        migrations.CreateModel(
+            name='WalletBalanceShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField(help_text='Номер части баланса', verbose_name='Номер части баланса')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, help_text='Зачисления, ещё не перенесённые в основной баланс', max_digits=11, verbose_name='Часть баланса')),
+                ('wallet', models.ForeignKey(help_text='Кошелёк', on_delete=django.db.models.deletion.PROTECT, related_name='balance_shards', to='wallet.Wallet', verbose_name='Кошелёк')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='walletbalanceshard',
+            constraint=models.UniqueConstraint(fields=('wallet', 'number'), name='walletbalanceshard_unique_wallet_number'),
+        ),
+    ]
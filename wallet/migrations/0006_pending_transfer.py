@@ -0,0 +1,35 @@
+# Generated by Django 2.2 on 2026-10-17 17:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet', '0005_wallet_balance_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingTransfer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sender_wallet_id', models.IntegerField(help_text='Id кошелька отправителя', verbose_name='Id кошелька отправителя')),
+                ('recipient_wallet_id', models.IntegerField(help_text='Id кошелька получателя', verbose_name='Id кошелька получателя')),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Ограничение в 1 млрд', max_digits=11, verbose_name='Сумма перевода')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('done', 'Проведён'), ('failed', 'Отклонён')], default='pending', help_text='Статус обработки перевода', max_length=7, verbose_name='Статус')),
+                ('error', models.TextField(blank=True, help_text='Причина отказа', verbose_name='Причина отказа')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Дата и время постановки в очередь', verbose_name='Дата и время постановки в очередь')),
+                ('processed_at', models.DateTimeField(blank=True, help_text='Дата и время обработки', null=True, verbose_name='Дата и время обработки')),
+                ('sender', models.ForeignKey(help_text='Пользователь, запросивший перевод', on_delete=django.db.models.deletion.PROTECT, related_name='pending_transfers', to=settings.AUTH_USER_MODEL, verbose_name='Отправитель')),
+                ('transaction', models.ForeignKey(blank=True, help_text='Проведённый перевод', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='wallet.Transaction', verbose_name='Проведённый перевод')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pendingtransfer',
+            index=models.Index(condition=models.Q(status='pending'), fields=['id'], name='pendingtransfer_pending_id'),
+        ),
+    ]
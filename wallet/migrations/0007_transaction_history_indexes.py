@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-17 17:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0006_pending_transfer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['sender', 'created_at', 'id'], name='transaction_sender_created'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['recipient', 'created_at', 'id'], name='transaction_recipient_created'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='recipient',
+            field=models.ForeignKey(db_index=False, help_text='Кошелёк получателя', on_delete=django.db.models.deletion.PROTECT, related_name='transactions_as_recipient', to='wallet.Wallet', verbose_name='Кошелёк получателя'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='sender',
+            field=models.ForeignKey(db_index=False, help_text='Кошелёк отправителя', on_delete=django.db.models.deletion.PROTECT, related_name='transactions_as_sender', to='wallet.Wallet', verbose_name='Кошелёк отправителя'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 2.2.28 on 2026-10-17 17:54
+
+from decimal import (
+    Decimal,
+    ROUND_HALF_DOWN,
+)
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_initial_balances(apps, schema_editor):
+    # начальный баланс не хранился: восстанавливаем его из текущего
+    # баланса (вместе с частями) и всех переводов кошелька
+    Wallet = apps.get_model('wallet', 'Wallet')
+    Transaction = apps.get_model('wallet', 'Transaction')
+    cents = Decimal('.01')
+    wallets = {
+        wallet.pk: wallet
+        for wallet in Wallet.objects.prefetch_related('balance_shards')
+    }
+    for wallet in wallets.values():
+        wallet.initial_balance = wallet.balance + sum(
+            shard.balance for shard in wallet.balance_shards.all()
+        )
+    transactions = Transaction.objects.values_list(
+        'sender_id',
+        'recipient_id',
+        'amount',
+        'exchange_rate',
+    )
+    for sender_id, recipient_id, amount, exchange_rate in transactions.iterator():
+        wallets[sender_id].initial_balance += amount
+        wallets[recipient_id].initial_balance -= (
+            exchange_rate * amount
+        ).quantize(cents, ROUND_HALF_DOWN)
+    Wallet.objects.bulk_update(
+        wallets.values(),
+        ['initial_balance'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalanceSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='День в часовом поясе TIME_ZONE', verbose_name='День')),
+                ('balance', models.DecimalField(decimal_places=2, help_text='Баланс на конец дня', max_digits=11, verbose_name='Баланс на конец дня')),
+                ('incoming', models.DecimalField(decimal_places=2, default=0, help_text='Сумма зачислений в валюте кошелька', max_digits=15, verbose_name='Зачислено за день')),
+                ('outgoing', models.DecimalField(decimal_places=2, default=0, help_text='Сумма списаний в валюте кошелька', max_digits=15, verbose_name='Списано за день')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='initial_balance',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Баланс на момент создания, от него считается история баланса', max_digits=11, verbose_name='Начальный баланс кошелька'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='transaction_created_brin'),
+        ),
+        migrations.AddField(
+            model_name='walletbalancesnapshot',
+            name='wallet',
+            field=models.ForeignKey(help_text='Кошелёк', on_delete=django.db.models.deletion.PROTECT, related_name='balance_snapshots', to='wallet.Wallet', verbose_name='Кошелёк'),
+        ),
+        migrations.AddConstraint(
+            model_name='walletbalancesnapshot',
+            constraint=models.UniqueConstraint(fields=('wallet', 'date'), name='walletbalancesnapshot_unique_wallet_date'),
+        ),
+        migrations.RunPython(
+            fill_initial_balances,
+            migrations.RunPython.noop,
+        ),
+    ]
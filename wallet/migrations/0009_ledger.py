@@ -0,0 +1,121 @@
+# Generated by Django 2.2.28 on 2026-10-17 18:24
+
+from decimal import (
+    Decimal,
+    ROUND_HALF_DOWN,
+)
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_ledger_entries(apps, schema_editor):
+    # по каждому прошлому переводу - списание у отправителя и
+    # зачисление получателю в валюте получателя, как при переводе
+    Transaction = apps.get_model('wallet', 'Transaction')
+    LedgerEntry = apps.get_model('wallet', 'LedgerEntry')
+    cents = Decimal('.01')
+    transactions = Transaction.objects.order_by('pk').values_list(
+        'pk',
+        'sender_id',
+        'recipient_id',
+        'amount',
+        'exchange_rate',
+        'created_at',
+    )
+    entries = []
+    for pk, sender_id, recipient_id, amount, exchange_rate, created_at in transactions.iterator():
+        entries.append(LedgerEntry(
+            transaction_id=pk,
+            wallet_id=sender_id,
+            amount=-amount,
+            created_at=created_at,
+        ))
+        entries.append(LedgerEntry(
+            transaction_id=pk,
+            wallet_id=recipient_id,
+            amount=(exchange_rate * amount).quantize(cents, ROUND_HALF_DOWN),
+            created_at=created_at,
+        ))
+        if len(entries) >= 2000:
+            LedgerEntry.objects.bulk_create(entries)
+            entries = []
+    LedgerEntry.objects.bulk_create(entries)
+
+
+FORBID_LEDGER_CHANGES_SQL = """
+    CREATE FUNCTION wallet_ledgerentry_append_only() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'wallet_ledgerentry is append-only';
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER wallet_ledgerentry_append_only
+    BEFORE UPDATE OR DELETE ON wallet_ledgerentry
+    FOR EACH STATEMENT EXECUTE PROCEDURE wallet_ledgerentry_append_only();
+"""
+
+ALLOW_LEDGER_CHANGES_SQL = """
+    DROP TRIGGER wallet_ledgerentry_append_only ON wallet_ledgerentry;
+    DROP FUNCTION wallet_ledgerentry_append_only();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0008_wallet_balance_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalanceCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ledger_entry_id', models.BigIntegerField(help_text='Баланс учитывает проводки кошелька с id не больше этого', verbose_name='Последняя учтённая проводка')),
+                ('balance', models.DecimalField(decimal_places=2, help_text='Баланс после проводки ledger_entry_id', max_digits=11, verbose_name='Баланс кошелька')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Дата и время создания', verbose_name='Дата и время создания')),
+                ('wallet', models.ForeignKey(help_text='Кошелёк', on_delete=django.db.models.deletion.PROTECT, related_name='balance_checkpoints', to='wallet.Wallet', verbose_name='Кошелёк')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='В валюте кошелька: списание отрицательное, зачисление положительное', max_digits=11, verbose_name='Сумма проводки')),
+                ('created_at', models.DateTimeField(help_text='Дата и время перевода', verbose_name='Дата и время перевода')),
+                ('transaction', models.ForeignKey(help_text='Перевод, которым создана проводка', on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='wallet.Transaction', verbose_name='Перевод')),
+                ('wallet', models.ForeignKey(db_index=False, help_text='Кошелёк', on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='wallet.Wallet', verbose_name='Кошелёк')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerHorizon',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ledger_entry_id', models.BigIntegerField(help_text='Наибольший id проводки на момент снимка', verbose_name='Последняя видимая проводка')),
+                ('snapshot_xmax', models.BigIntegerField(help_text='Граница действительна, когда xmin текущего снимка не меньше этого', verbose_name='xmax снимка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Дата и время создания', verbose_name='Дата и время создания')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='walletbalancecheckpoint',
+            constraint=models.UniqueConstraint(fields=('wallet', 'ledger_entry_id'), name='walletbalancecheckpoint_unique_wallet_entry'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['wallet', 'id'], name='ledgerentry_wallet_id'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='ledgerentry_created_brin'),
+        ),
+        migrations.RunPython(
+            fill_ledger_entries,
+            migrations.RunPython.noop,
+        ),
+        migrations.RunSQL(
+            FORBID_LEDGER_CHANGES_SQL,
+            ALLOW_LEDGER_CHANGES_SQL,
+        ),
+    ]
@@ -2,6 +2,7 @@ from decimal import Decimal
 
 from django.conf import settings
 from django.contrib.postgres import fields
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
 
@@ -22,6 +23,25 @@ CURRENCY_TYPES = (
     (GBP, 'GBP'),
 )
 
+LOCKING_TRANSFER_MODE = 'locking'
+RETURNING_TRANSFER_MODE = 'returning'
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+PENDING_TRANSFER_STATUSES = (
+    (PENDING, 'Ожидает обработки'),
+    (DONE, 'Проведён'),
+    (FAILED, 'Отклонён'),
+)
+
+HOUR = 'hour'
+DAY = 'day'
+AGGREGATION_PERIODS = (
+    (HOUR, 'Час'),
+    (DAY, 'День'),
+)
+
 
 class Wallet(models.Model):
 
@@ -54,11 +74,96 @@ class Wallet(models.Model):
         verbose_name='Активен',
         help_text='Активен',
     )
+    shards_count = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Количество частей баланса',
+        help_text='Зачисления распределяются по частям баланса, 0 - без разбиения',
+    )
+    initial_balance = models.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+        default=0,
+        verbose_name='Начальный баланс кошелька',
+        help_text='Баланс на момент создания, от него считается история баланса',
+    )
 
     def __str__(self):
         return f'{self.owner}: #{self.pk}({self.currency})'
 
 
+class WalletBalanceShard(models.Model):
+
+    wallet = models.ForeignKey(
+        Wallet,
+        on_delete=models.PROTECT,
+        related_name='balance_shards',
+        verbose_name='Кошелёк',
+        help_text='Кошелёк',
+    )
+    number = models.PositiveSmallIntegerField(
+        verbose_name='Номер части баланса',
+        help_text='Номер части баланса',
+    )
+    balance = models.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+        default=0,
+        verbose_name='Часть баланса',
+        help_text='Зачисления, ещё не перенесённые в основной баланс',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['wallet', 'number'],
+                name='walletbalanceshard_unique_wallet_number',
+            ),
+        ]
+
+
+class WalletBalanceSnapshot(models.Model):
+
+    wallet = models.ForeignKey(
+        Wallet,
+        on_delete=models.PROTECT,
+        related_name='balance_snapshots',
+        verbose_name='Кошелёк',
+        help_text='Кошелёк',
+    )
+    date = models.DateField(
+        verbose_name='День',
+        help_text='День в часовом поясе TIME_ZONE',
+    )
+    balance = models.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+        verbose_name='Баланс на конец дня',
+        help_text='Баланс на конец дня',
+    )
+    incoming = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        verbose_name='Зачислено за день',
+        help_text='Сумма зачислений в валюте кошелька',
+    )
+    outgoing = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        verbose_name='Списано за день',
+        help_text='Сумма списаний в валюте кошелька',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['wallet', 'date'],
+                name='walletbalancesnapshot_unique_wallet_date',
+            ),
+        ]
+
+
 class ExchangeRate(models.Model):
 
     currency = models.CharField(
@@ -73,10 +178,104 @@ class ExchangeRate(models.Model):
     )
     created_at = models.DateTimeField(
         auto_now_add=True,
+        db_index=True,
         verbose_name='Дата и время создания записи о курсах валют',
         help_text='Дата и время создания записи о курсах валют',
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['currency', '-created_at'],
+                name='exchangerate_currency_created',
+            ),
+        ]
+
+
+class CurrentExchangeRate(models.Model):
+
+    currency = models.CharField(
+        max_length=3,
+        choices=CURRENCY_TYPES,
+        unique=True,
+        verbose_name='Базовая валюта конвертирования',
+        help_text='Код базовой валюты конвертирования по ISO',
+    )
+    rates = fields.JSONField(
+        verbose_name='JSON с актуальными курсами валют',
+        help_text='JSON с актуальными курсами валют',
+    )
+    exchange_rate = models.ForeignKey(
+        ExchangeRate,
+        on_delete=models.PROTECT,
+        related_name='+',
+        verbose_name='Запись истории, из которой взяты курсы',
+        help_text='Запись истории, из которой взяты курсы',
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата и время обновления курсов',
+        help_text='Дата и время обновления курсов',
+    )
+
+
+class ExchangeRateAggregate(models.Model):
+
+    period = models.CharField(
+        max_length=4,
+        choices=AGGREGATION_PERIODS,
+        verbose_name='Период агрегации',
+        help_text='Период агрегации',
+    )
+    currency = models.CharField(
+        max_length=3,
+        choices=CURRENCY_TYPES,
+        verbose_name='Базовая валюта конвертирования',
+        help_text='Код базовой валюты конвертирования по ISO',
+    )
+    target_currency = models.CharField(
+        max_length=3,
+        choices=CURRENCY_TYPES,
+        verbose_name='Целевая валюта конвертирования',
+        help_text='Код целевой валюты конвертирования по ISO',
+    )
+    period_start = models.DateTimeField(
+        verbose_name='Начало периода',
+        help_text='Начало периода',
+    )
+    open = models.DecimalField(
+        max_digits=10,
+        decimal_places=5,
+        verbose_name='Курс на открытии периода',
+        help_text='Курс на открытии периода',
+    )
+    high = models.DecimalField(
+        max_digits=10,
+        decimal_places=5,
+        verbose_name='Максимальный курс за период',
+        help_text='Максимальный курс за период',
+    )
+    low = models.DecimalField(
+        max_digits=10,
+        decimal_places=5,
+        verbose_name='Минимальный курс за период',
+        help_text='Минимальный курс за период',
+    )
+    close = models.DecimalField(
+        max_digits=10,
+        decimal_places=5,
+        verbose_name='Курс на закрытии периода',
+        help_text='Курс на закрытии периода',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'currency', 'target_currency', 'period_start'],
+                name='exchangerateaggregate_unique_period',
+            ),
+        ]
+
 
 class Transaction(models.Model):
 
@@ -84,6 +283,8 @@ class Transaction(models.Model):
         Wallet,
         on_delete=models.PROTECT,
         related_name='transactions_as_sender',
+        # отдельный индекс не нужен: его заменяет составной индекс ниже
+        db_index=False,
         verbose_name='Кошелёк отправителя',
         help_text='Кошелёк отправителя',
     )
@@ -91,6 +292,8 @@ class Transaction(models.Model):
         Wallet,
         on_delete=models.PROTECT,
         related_name='transactions_as_recipient',
+        # отдельный индекс не нужен: его заменяет составной индекс ниже
+        db_index=False,
         verbose_name='Кошелёк получателя',
         help_text='Кошелёк получателя',
     )
@@ -112,3 +315,193 @@ class Transaction(models.Model):
         verbose_name='Дата и время создания записи о переводе',
         help_text='Дата и время создания записи о переводе',
     )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['sender', 'created_at', 'id'],
+                name='transaction_sender_created',
+            ),
+            models.Index(
+                fields=['recipient', 'created_at', 'id'],
+                name='transaction_recipient_created',
+            ),
+            # created_at растёт вместе с id, поэтому для выборки за
+            # период хватает маленького BRIN-индекса
+            BrinIndex(
+                fields=['created_at'],
+                name='transaction_created_brin',
+            ),
+        ]
+
+
+class LedgerEntry(models.Model):
+
+    # в журнал только добавляются строки (UPDATE и DELETE запрещены
+    # триггером), а id растёт вместе с created_at, поэтому таблицу можно
+    # секционировать по диапазонам id без изменения запросов
+    id = models.BigAutoField(
+        primary_key=True,
+    )
+    transaction = models.ForeignKey(
+        Transaction,
+        on_delete=models.PROTECT,
+        related_name='ledger_entries',
+        verbose_name='Перевод',
+        help_text='Перевод, которым создана проводка',
+    )
+    wallet = models.ForeignKey(
+        Wallet,
+        on_delete=models.PROTECT,
+        related_name='ledger_entries',
+        db_index=False,
+        verbose_name='Кошелёк',
+        help_text='Кошелёк',
+    )
+    amount = models.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+        verbose_name='Сумма проводки',
+        help_text='В валюте кошелька: списание отрицательное, зачисление положительное',
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата и время перевода',
+        help_text='Дата и время перевода',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['wallet', 'id'],
+                name='ledgerentry_wallet_id',
+            ),
+            BrinIndex(
+                fields=['created_at'],
+                name='ledgerentry_created_brin',
+            ),
+        ]
+
+
+class WalletBalanceCheckpoint(models.Model):
+
+    wallet = models.ForeignKey(
+        Wallet,
+        on_delete=models.PROTECT,
+        related_name='balance_checkpoints',
+        verbose_name='Кошелёк',
+        help_text='Кошелёк',
+    )
+    # не внешний ключ: на журнал не ссылается ни одна таблица, чтобы его
+    # секции можно было отсоединять и переносить
+    ledger_entry_id = models.BigIntegerField(
+        verbose_name='Последняя учтённая проводка',
+        help_text='Баланс учитывает проводки кошелька с id не больше этого',
+    )
+    balance = models.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+        verbose_name='Баланс кошелька',
+        help_text='Баланс после проводки ledger_entry_id',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата и время создания',
+        help_text='Дата и время создания',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['wallet', 'ledger_entry_id'],
+                name='walletbalancecheckpoint_unique_wallet_entry',
+            ),
+        ]
+
+
+class LedgerHorizon(models.Model):
+    """
+    Граница журнала для следующих контрольных точек: id последней
+    видимой проводки и xmax снимка, в котором он прочитан. Проводки с
+    меньшим id пишут только транзакции с xid меньше snapshot_xmax, поэтому
+    границей можно пользоваться, когда все они завершились.
+    """
+
+    ledger_entry_id = models.BigIntegerField(
+        verbose_name='Последняя видимая проводка',
+        help_text='Наибольший id проводки на момент снимка',
+    )
+    snapshot_xmax = models.BigIntegerField(
+        verbose_name='xmax снимка',
+        help_text='Граница действительна, когда xmin текущего снимка не меньше этого',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата и время создания',
+        help_text='Дата и время создания',
+    )
+
+
+class PendingTransfer(models.Model):
+
+    sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        related_name='pending_transfers',
+        verbose_name='Отправитель',
+        help_text='Пользователь, запросивший перевод',
+    )
+    sender_wallet_id = models.IntegerField(
+        verbose_name='Id кошелька отправителя',
+        help_text='Id кошелька отправителя',
+    )
+    recipient_wallet_id = models.IntegerField(
+        verbose_name='Id кошелька получателя',
+        help_text='Id кошелька получателя',
+    )
+    amount = models.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+        verbose_name='Сумма перевода',
+        help_text='Ограничение в 1 млрд',
+    )
+    status = models.CharField(
+        max_length=7,
+        choices=PENDING_TRANSFER_STATUSES,
+        default=PENDING,
+        verbose_name='Статус',
+        help_text='Статус обработки перевода',
+    )
+    transaction = models.ForeignKey(
+        Transaction,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Проведённый перевод',
+        help_text='Проведённый перевод',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Причина отказа',
+        help_text='Причина отказа',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата и время постановки в очередь',
+        help_text='Дата и время постановки в очередь',
+    )
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата и время обработки',
+        help_text='Дата и время обработки',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='pendingtransfer_pending_id',
+                condition=models.Q(status=PENDING),
+            ),
+        ]
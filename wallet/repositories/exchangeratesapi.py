@@ -1,30 +1,150 @@
-from typing import List, Dict
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+)
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .exceptions import ExchangeRatesApiException
 
 
+logger = logging.getLogger(__name__)
+
 EXCHANGE_RATES_URL = 'https://api.exchangeratesapi.io/latest'
 
+# (connect, read) в секундах
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_WORKERS = 4
+FETCH_METRICS_SIZE = 100
+
+
+class FetchMetric(NamedTuple):
+    base_currency: str
+    elapsed: float
+    succeeded: bool
+
+
+class ExchangeRatesApiClient:
+
+    def __init__(
+            self,
+            url: str = EXCHANGE_RATES_URL,
+            timeout=DEFAULT_TIMEOUT,
+            retries: int = DEFAULT_RETRIES,
+            backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+            pool_size: int = DEFAULT_POOL_SIZE,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.metrics: Deque[FetchMetric] = deque(maxlen=FETCH_METRICS_SIZE)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_exchange_rates(
+            self,
+            base_currency: str,
+            target_currencies: Iterable[str],
+    ) -> Dict[str, float]:
+        params = {
+            'base': base_currency,
+            'symbols': ','.join(sorted(target_currencies)),
+        }
+
+        started_at = time.perf_counter()
+        succeeded = False
+        try:
+            try:
+                response = self.session.get(
+                    url=self.url,
+                    params=params,
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as error:
+                raise ExchangeRatesApiException(str(error)) from error
+
+            if response.status_code != 200:
+                raise ExchangeRatesApiException(self._get_error(response))
+
+            rates = response.json()['rates']
+            succeeded = True
+            return rates
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.metrics.append(FetchMetric(base_currency, elapsed, succeeded))
+            logger.info(
+                'Exchange rates for %s fetched in %.3fs (succeeded: %s)',
+                base_currency,
+                elapsed,
+                succeeded,
+            )
+
+    def get_exchange_rates_many(
+            self,
+            base_currencies: Iterable[str],
+            target_currencies: Iterable[str],
+    ) -> Dict[str, Dict[str, float]]:
+        base_currencies = list(base_currencies)
+        target_currencies = set(target_currencies)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                base_currency: executor.submit(
+                    self.get_exchange_rates,
+                    base_currency=base_currency,
+                    target_currencies=target_currencies - {base_currency},
+                )
+                for base_currency in base_currencies
+            }
+        return {
+            base_currency: future.result()
+            for base_currency, future in futures.items()
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+    @staticmethod
+    def _get_error(response: requests.Response) -> str:
+        try:
+            return response.json()['error']
+        except (ValueError, KeyError):
+            return f'Unexpected response status {response.status_code}'
+
+
+client = ExchangeRatesApiClient()
+
 
 def get_exchange_rates(
         base_currency: str,
         target_currencies: List[str],
 ) -> Dict[str, float]:
-
-    target_url = EXCHANGE_RATES_URL
-    params = {
-        'base': base_currency,
-        'symbols': target_currencies,
-    }
-
-    response = requests.get(
-        url=target_url,
-        params=params,
+    return client.get_exchange_rates(
+        base_currency=base_currency,
+        target_currencies=target_currencies,
     )
-    if response.status_code != 200:
-        error = response.json()['error']
-        raise ExchangeRatesApiException(error)
-
-    return response.json()['rates']
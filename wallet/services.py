@@ -1,55 +1,338 @@
+import base64
+import itertools
+import json
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import (
+    date,
+    datetime,
+    time,
+    timedelta,
+)
 from decimal import (
     Decimal,
     ROUND_HALF_DOWN,
 )
 from typing import (
     Dict,
+    Hashable,
+    Iterable,
+    Iterator,
     List,
+    NamedTuple,
+    Optional,
+    Tuple,
 )
 
-from django.db import transaction
-from django.db.models import Q
+from django.conf import settings
+from django.db import (
+    DataError,
+    IntegrityError,
+    connection,
+    transaction,
+)
+from django.db.models import (
+    Case,
+    DateTimeField,
+    DecimalField,
+    F,
+    Max,
+    Min,
+    Q,
+    QuerySet,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from customauth.models import CustomUser
+from wallet_demo.tracing import tracer
+from .cache import (
+    ExchangeRatesCache,
+    RatesMatrix,
+)
 from .exceptions import (
     ExchangeRateCreationException,
     WalletCreationException,
     WalletOperationException,
 )
+from .metrics import count_transfers
 from .models import (
     CURRENCIES,
+    DAY,
+    DONE,
+    FAILED,
+    HOUR,
+    PENDING,
+    RETURNING_TRANSFER_MODE,
+    CurrentExchangeRate,
     ExchangeRate,
+    ExchangeRateAggregate,
+    LedgerEntry,
+    LedgerHorizon,
+    PendingTransfer,
     Transaction,
     Wallet,
+    WalletBalanceCheckpoint,
+    WalletBalanceShard,
+    WalletBalanceSnapshot,
 )
 from .repositories.exchangeratesapi import get_exchange_rates
 
 
+# сырые курсы сворачиваются окнами по одному дню, чтобы не держать
+# длинную транзакцию и не удалять всю историю одним DELETE
+EXCHANGE_RATES_COMPACTION_WINDOW = timedelta(days=1)
+
+# зачисления на кошелёк с разбитым балансом раскладываются по частям
+# по кругу
+shard_counter = itertools.count()
+
+# наибольший баланс, который помещается в numeric(11, 2)
+MAX_WALLET_BALANCE = Decimal('999999999.99')
+
+
 def create_exchange_rate(
         currency: str,
         exchange_rates: Dict[str, float],
 ) -> ExchangeRate:
     if currency in CURRENCIES and set(exchange_rates.keys()) - CURRENCIES == set():
-        return ExchangeRate.objects.create(
-            currency=currency,
-            rates=exchange_rates,
-        )
+        with transaction.atomic():
+            exchange_rate = ExchangeRate.objects.create(
+                currency=currency,
+                rates=exchange_rates,
+            )
+            CurrentExchangeRate.objects.update_or_create(
+                currency=currency,
+                defaults={
+                    'rates': exchange_rates,
+                    'exchange_rate': exchange_rate,
+                },
+            )
+        return exchange_rate
     raise ExchangeRateCreationException(
         f'Unknown currencies found among ({currency}, {exchange_rates}).',
     )
 
 
+def derive_cross_rates(
+        pivot_currency: str,
+        pivot_rates: Dict[str, float],
+) -> Dict[str, Dict[str, float]]:
+    # курс base -> target через опорную валюту: pivot->target / pivot->base
+    pivot_values = {
+        currency: Decimal(str(rate))
+        for currency, rate in pivot_rates.items()
+    }
+    pivot_values[pivot_currency] = Decimal(1)
+    return {
+        base: {
+            target: float(target_value / base_value)
+            for target, target_value in pivot_values.items()
+            if target != base
+        }
+        for base, base_value in pivot_values.items()
+    }
+
+
 def update_exchange_rates() -> None:
-    for currency in CURRENCIES:
-        target_currencies = CURRENCIES - {currency}
-        new_rates = get_exchange_rates(
-            base_currency=currency,
-            target_currencies=target_currencies,
+    with tracer.trace('update_exchange_rates'):
+        pivot_currency = settings.EXCHANGE_RATES_PIVOT_CURRENCY
+        with tracer.span('exchange_rates.fetch', pivot_currency=pivot_currency):
+            pivot_rates = get_exchange_rates(
+                base_currency=pivot_currency,
+                target_currencies=CURRENCIES - {pivot_currency},
+            )
+        with tracer.span('exchange_rates.derive'):
+            new_rates_by_currency = derive_cross_rates(
+                pivot_currency=pivot_currency,
+                pivot_rates=pivot_rates,
+            )
+
+        # все базовые валюты публикуются одной пачкой, чтобы читатели
+        # не видели курсы из разных обновлений
+        with tracer.span('exchange_rates.store', currencies=len(new_rates_by_currency)):
+            with transaction.atomic():
+                for currency, new_rates in new_rates_by_currency.items():
+                    create_exchange_rate(
+                        currency=currency,
+                        exchange_rates=new_rates,
+                    )
+        with tracer.span('exchange_rates.invalidate_cache'):
+            exchange_rates_cache.invalidate()
+
+
+def get_exchange_rates_version() -> Optional[int]:
+    return CurrentExchangeRate.objects.aggregate(
+        version=Max('exchange_rate_id'),
+    )['version']
+
+
+def quantize_rates(rates: Dict[str, float]) -> Dict[str, Decimal]:
+    accuracy = Decimal('.00001')
+    return {
+        currency: Decimal(rate).quantize(accuracy, ROUND_HALF_DOWN)
+        for currency, rate in rates.items()
+    }
+
+
+def load_exchange_rates_matrix() -> RatesMatrix:
+    last_records = CurrentExchangeRate.objects.all()
+    return {
+        record.currency: quantize_rates(record.rates)
+        for record in last_records
+    }
+
+
+exchange_rates_cache = ExchangeRatesCache(
+    loader=load_exchange_rates_matrix,
+    version_getter=get_exchange_rates_version,
+    ttl=settings.EXCHANGE_RATES_CACHE_TTL,
+)
+
+
+def truncate_to_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def truncate_to_day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate_ohlc(
+        points: Iterable[Tuple[Hashable, Decimal, Decimal, Decimal, Decimal]],
+) -> Dict[Hashable, List[Decimal]]:
+    # точки должны идти в хронологическом порядке
+    aggregates = {}
+    for key, open_rate, high_rate, low_rate, close_rate in points:
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregates[key] = [open_rate, high_rate, low_rate, close_rate]
+        else:
+            aggregate[1] = max(aggregate[1], high_rate)
+            aggregate[2] = min(aggregate[2], low_rate)
+            aggregate[3] = close_rate
+    return aggregates
+
+
+UPSERT_EXCHANGE_RATE_AGGREGATES_SQL = """
+    INSERT INTO {table} (period, currency, target_currency, period_start, open, high, low, close)
+    VALUES {values}
+    ON CONFLICT (period, currency, target_currency, period_start) DO UPDATE SET
+        high = GREATEST({table}.high, EXCLUDED.high),
+        low = LEAST({table}.low, EXCLUDED.low),
+        close = EXCLUDED.close
+"""
+
+
+def create_exchange_rate_aggregates(
+        period: str,
+        aggregates: Dict[Tuple[str, str, datetime], List[Decimal]],
+) -> None:
+    # за период уже может быть агрегат: курс, который был текущим и
+    # поэтому не сворачивался, попадает в уже свёрнутый час. Такие точки
+    # новее агрегата, поэтому open остаётся прежним, а close берётся новый
+    if not aggregates:
+        return
+    params = []
+    for (currency, target_currency, period_start), ohlc in aggregates.items():
+        params.extend([period, currency, target_currency, period_start, *ohlc])
+    sql = UPSERT_EXCHANGE_RATE_AGGREGATES_SQL.format(
+        table=ExchangeRateAggregate._meta.db_table,
+        values=', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(aggregates)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def compact_raw_exchange_rates(cutoff: datetime) -> None:
+    current_ids = CurrentExchangeRate.objects.values_list('exchange_rate_id', flat=True)
+    raw_records = ExchangeRate.objects.filter(
+        created_at__lt=cutoff,
+    ).exclude(
+        pk__in=current_ids,
+    )
+    oldest = raw_records.aggregate(oldest=Min('created_at'))['oldest']
+    if oldest is None:
+        return
+
+    # каждое окно агрегируется и удаляется в одной транзакции, поэтому
+    # в каждом часе не бывает частично свёрнутых данных
+    window_start = truncate_to_hour(oldest)
+    while window_start < cutoff:
+        window_end = min(window_start + EXCHANGE_RATES_COMPACTION_WINDOW, cutoff)
+        window_records = raw_records.filter(
+            created_at__gte=window_start,
+            created_at__lt=window_end,
         )
-        create_exchange_rate(
-            currency=currency,
-            exchange_rates=new_rates,
+        with transaction.atomic():
+            rows = window_records.order_by('created_at').values_list(
+                'currency',
+                'rates',
+                'created_at',
+            )
+            points = (
+                ((currency, target_currency, truncate_to_hour(created_at)), rate, rate, rate, rate)
+                for currency, rates, created_at in rows
+                for target_currency, rate in quantize_rates(rates).items()
+            )
+            create_exchange_rate_aggregates(
+                period=HOUR,
+                aggregates=aggregate_ohlc(points),
+            )
+            window_records.delete()
+        window_start = window_end
+
+
+def compact_hourly_exchange_rates(cutoff: datetime) -> None:
+    hourly_aggregates = ExchangeRateAggregate.objects.filter(
+        period=HOUR,
+        period_start__lt=cutoff,
+    )
+    oldest = hourly_aggregates.aggregate(oldest=Min('period_start'))['oldest']
+    if oldest is None:
+        return
+
+    window_start = truncate_to_day(oldest)
+    while window_start < cutoff:
+        window_end = min(window_start + timedelta(days=1), cutoff)
+        window_aggregates = hourly_aggregates.filter(
+            period_start__gte=window_start,
+            period_start__lt=window_end,
         )
+        with transaction.atomic():
+            rows = window_aggregates.order_by('period_start').values_list(
+                'currency',
+                'target_currency',
+                'period_start',
+                'open',
+                'high',
+                'low',
+                'close',
+            )
+            points = (
+                ((currency, target_currency, truncate_to_day(period_start)), *ohlc)
+                for currency, target_currency, period_start, *ohlc in rows
+            )
+            create_exchange_rate_aggregates(
+                period=DAY,
+                aggregates=aggregate_ohlc(points),
+            )
+            window_aggregates.delete()
+        window_start = window_end
+
+
+def compact_exchange_rates(now: Optional[datetime] = None) -> None:
+    now = now or timezone.now()
+    compact_raw_exchange_rates(
+        cutoff=truncate_to_hour(now - settings.EXCHANGE_RATES_RAW_RETENTION),
+    )
+    compact_hourly_exchange_rates(
+        cutoff=truncate_to_day(now - settings.EXCHANGE_RATES_HOURLY_RETENTION),
+    )
 
 
 def create_wallet(
@@ -59,10 +342,12 @@ def create_wallet(
 ) -> Wallet:
     if init_balance >= 0 and currency in CURRENCIES:
         cents = Decimal('.01')
+        init_balance = Decimal(init_balance).quantize(cents, ROUND_HALF_DOWN)
         return Wallet.objects.create(
             owner=user,
             currency=currency,
-            balance=Decimal(init_balance).quantize(cents, ROUND_HALF_DOWN),
+            balance=init_balance,
+            initial_balance=init_balance,
         )
     raise WalletCreationException(
         'Unable to create wallet with negative balance or currency is unknown',
@@ -75,22 +360,92 @@ def convert_amount(amount: Decimal, exchange_rate: Decimal) -> Decimal:
     return new_amount.quantize(cents, ROUND_HALF_DOWN)
 
 
+def enable_wallet_balance_shards(wallet_id: int, shards_count: int) -> Wallet:
+    with transaction.atomic():
+        wallet = lock_wallets([wallet_id])[wallet_id]
+        existing_numbers = set(wallet.balance_shards.values_list('number', flat=True))
+        WalletBalanceShard.objects.bulk_create([
+            WalletBalanceShard(wallet=wallet, number=number)
+            for number in range(shards_count)
+            if number not in existing_numbers
+        ])
+        if shards_count < wallet.shards_count:
+            # при уменьшении числа частей накопленное в них сразу
+            # переносится в баланс: иначе с shards_count = 0 эти деньги
+            # не видны ни балансу, ни списанию. Все части блокируются,
+            # чтобы дождаться зачислений, которые в них уже идут
+            list(WalletBalanceShard.objects.select_for_update().filter(wallet=wallet))
+            fold_wallet_balance_shards(wallet)
+        wallet.shards_count = shards_count
+        wallet.save(update_fields=['shards_count'])
+    return wallet
+
+
+def fold_wallet_balance_shards(wallet: Wallet) -> None:
+    # кошелёк должен быть заблокирован вызывающим кодом
+    with transaction.atomic():
+        shards = list(
+            WalletBalanceShard.objects.select_for_update().filter(
+                wallet=wallet,
+                balance__gt=0,
+            ),
+        )
+        if not shards:
+            return
+        WalletBalanceShard.objects.filter(
+            pk__in=[shard.pk for shard in shards],
+        ).update(balance=0)
+        wallet.balance += sum(shard.balance for shard in shards)
+        wallet.save(update_fields=['balance'])
+
+
+def fold_balance_shards() -> None:
+    wallet_ids = WalletBalanceShard.objects.filter(
+        balance__gt=0,
+    ).values_list('wallet_id', flat=True).distinct()
+    for wallet_id in wallet_ids:
+        with transaction.atomic():
+            wallet = lock_wallets([wallet_id])[wallet_id]
+            fold_wallet_balance_shards(wallet)
+
+
+def get_wallet_balance(wallet: Wallet) -> Decimal:
+    if not wallet.shards_count:
+        return wallet.balance
+    shards_balance = wallet.balance_shards.aggregate(total=Sum('balance'))['total']
+    return wallet.balance + (shards_balance or 0)
+
+
 def decrease_wallet_balance(wallet: Wallet, amount: Decimal) -> None:
     if amount <= 0:
         raise WalletOperationException('Сумма должна быть больше нуля.')
+    if amount > wallet.balance:
+        # списание идёт только из основного баланса, поэтому перед отказом
+        # переносим в него накопленные зачисления; части могут быть и у
+        # кошелька, с которого разбиение уже снято, если зачисление шло
+        # одновременно со снятием
+        fold_wallet_balance_shards(wallet)
     if amount > wallet.balance:
         raise WalletOperationException('Нельзя списать денег больше, чем у вас есть.')
     cents = Decimal('.01')
     wallet.balance -= amount.quantize(cents, ROUND_HALF_DOWN)
-    wallet.save()
+    wallet.save(update_fields=['balance'])
 
 
 def increase_wallet_balance(wallet: Wallet, amount: Decimal) -> None:
     if amount <= 0:
         raise WalletOperationException('Сумма должна быть больше нуля.')
     cents = Decimal('.01')
-    wallet.balance += amount.quantize(cents, ROUND_HALF_DOWN)
-    wallet.save()
+    amount = amount.quantize(cents, ROUND_HALF_DOWN)
+    if wallet.shards_count:
+        # зачисление в одну из частей не требует блокировки строки кошелька
+        WalletBalanceShard.objects.filter(
+            wallet=wallet,
+            number=next(shard_counter) % wallet.shards_count,
+        ).update(balance=F('balance') + amount)
+        return
+    wallet.balance += amount
+    wallet.save(update_fields=['balance'])
 
 
 def create_transaction(
@@ -107,88 +462,1044 @@ def create_transaction(
     )
 
 
-def get_current_exchange_rate(
-        base_currency: str,
-        target_currency: str,
-) -> Decimal:
+def create_ledger_entries(transactions: Iterable[Transaction]) -> None:
+    # по каждому переводу списание у отправителя и зачисление получателю,
+    # обе проводки в валюте своего кошелька; проводки всех переводов
+    # пишутся одним INSERT
+    cents = Decimal('.01')
+    entries = []
+    for created_transaction in transactions:
+        entries.append(LedgerEntry(
+            transaction=created_transaction,
+            wallet_id=created_transaction.sender_id,
+            amount=-created_transaction.amount.quantize(cents, ROUND_HALF_DOWN),
+            created_at=created_transaction.created_at,
+        ))
+        entries.append(LedgerEntry(
+            transaction=created_transaction,
+            wallet_id=created_transaction.recipient_id,
+            amount=convert_amount(created_transaction.amount, created_transaction.exchange_rate),
+            created_at=created_transaction.created_at,
+        ))
+    LedgerEntry.objects.bulk_create(entries)
+
+
+def validate_currency_pair(base_currency: str, target_currency: str) -> None:
     if base_currency not in CURRENCIES or target_currency not in CURRENCIES:
         raise ValueError(
             f'Pair ({base_currency}, {target_currency}) is invalid.',
         )
 
-    last_record = ExchangeRate.objects.filter(currency=base_currency).order_by('created_at').first()
 
-    if last_record:
-        accuracy = Decimal('.00001')
-        return Decimal(last_record.rates[target_currency]).quantize(accuracy, ROUND_HALF_DOWN)
+def get_current_exchange_rate(
+        base_currency: str,
+        target_currency: str,
+) -> Decimal:
+    validate_currency_pair(base_currency, target_currency)
+
+    exchange_rate = exchange_rates_cache.get_rate(
+        base_currency=base_currency,
+        target_currency=target_currency,
+    )
+
+    if exchange_rate is not None:
+        return exchange_rate
 
     raise ExchangeRate.DoesNotExist(
         f'No record for pair ({base_currency}, {target_currency}).',
     )
 
 
-def transfer_money_between_wallets(
+def get_exchange_rate_at(
+        base_currency: str,
+        target_currency: str,
+        timestamp: datetime,
+) -> Decimal:
+    validate_currency_pair(base_currency, target_currency)
+
+    rates = ExchangeRate.objects.filter(
+        currency=base_currency,
+        created_at__lte=timestamp,
+    ).order_by('-created_at').values_list('rates', flat=True).first()
+    if rates and target_currency in rates:
+        return quantize_rates(rates)[target_currency]
+
+    # сырые курсы могли быть уже свёрнуты в агрегаты, тогда берём курс
+    # на открытии самого мелкого периода, в который попадает момент
+    aggregate_rate = ExchangeRateAggregate.objects.filter(
+        currency=base_currency,
+        target_currency=target_currency,
+        period_start__lte=timestamp,
+    ).order_by('-period_start', '-period').values_list('open', flat=True).first()
+    if aggregate_rate is not None:
+        return aggregate_rate
+
+    raise ExchangeRate.DoesNotExist(
+        f'No record for pair ({base_currency}, {target_currency}) at {timestamp}.',
+    )
+
+
+def get_exchange_rates_at(
+        base_currency: str,
+        target_currency: str,
+        timestamps: Iterable[datetime],
+) -> List[Decimal]:
+    validate_currency_pair(base_currency, target_currency)
+    timestamps = list(timestamps)
+    if not timestamps:
+        return []
+    earliest, latest = min(timestamps), max(timestamps)
+
+    # курс на самый ранний момент даёт последняя запись до него,
+    # поэтому диапазон загрузки начинается с неё
+    anchor = ExchangeRate.objects.filter(
+        currency=base_currency,
+        created_at__lte=earliest,
+    ).order_by('-created_at').values_list('created_at', flat=True).first()
+    raw_points = ExchangeRate.objects.filter(
+        currency=base_currency,
+        created_at__gte=anchor or earliest,
+        created_at__lte=latest,
+    ).order_by('created_at').values_list('created_at', 'rates')
+    # то же для агрегатов: последний период, начавшийся не позже самого
+    # раннего момента, - подзапросом в том же запросе
+    aggregates = ExchangeRateAggregate.objects.filter(
+        currency=base_currency,
+        target_currency=target_currency,
+    )
+    aggregate_anchor = aggregates.filter(
+        period_start__lte=earliest,
+    ).order_by('-period_start').values('period_start')[:1]
+    aggregate_points = aggregates.filter(
+        period_start__gte=Coalesce(
+            Subquery(aggregate_anchor),
+            Value(earliest),
+            output_field=DateTimeField(),
+        ),
+        period_start__lte=latest,
+    ).order_by('period_start', 'period').values_list('period_start', 'open')
+
+    # агрегаты всегда старше сырых курсов, поэтому склейка остаётся
+    # отсортированной по времени
+    timeline = list(aggregate_points) + [
+        (created_at, quantize_rates(rates)[target_currency])
+        for created_at, rates in raw_points
+        if target_currency in rates
+    ]
+    moments = [moment for moment, _ in timeline]
+
+    exchange_rates = []
+    for timestamp in timestamps:
+        position = bisect_right(moments, timestamp)
+        if position == 0:
+            raise ExchangeRate.DoesNotExist(
+                f'No record for pair ({base_currency}, {target_currency}) at {timestamp}.',
+            )
+        exchange_rates.append(timeline[position - 1][1])
+    return exchange_rates
+
+
+LOCK_WALLETS_SQL = """
+    SELECT {columns}
+    FROM {wallet_table} AS wallet
+    JOIN {owner_table} AS owner ON owner.id = wallet.owner_id
+    WHERE {condition}
+    ORDER BY wallet.id
+    FOR NO KEY UPDATE OF wallet
+"""
+
+
+def select_wallets_for_update(condition: str, params: Dict) -> Dict[int, Wallet]:
+    # FOR NO KEY UPDATE вместо FOR UPDATE: такая блокировка не мешает
+    # KEY SHARE, который берут вставки переводов и проводок со ссылкой
+    # на кошелёк. Иначе свёртка, держащая кошелёк, и зачисление в его
+    # часть ждут друг друга. В Django 2.2 у select_for_update нет no_key,
+    # поэтому запрос с владельцем собирается вручную
+    wallet_fields = [field.attname for field in Wallet._meta.concrete_fields]
+    owner_fields = [field.attname for field in CustomUser._meta.concrete_fields]
+    sql = LOCK_WALLETS_SQL.format(
+        columns=', '.join(
+            [f'wallet.{field.column}' for field in Wallet._meta.concrete_fields]
+            + [f'owner.{field.column}' for field in CustomUser._meta.concrete_fields],
+        ),
+        wallet_table=Wallet._meta.db_table,
+        owner_table=CustomUser._meta.db_table,
+        condition=condition,
+    )
+    wallets = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            wallet = Wallet.from_db(connection.alias, wallet_fields, row[:len(wallet_fields)])
+            wallet.owner = CustomUser.from_db(connection.alias, owner_fields, row[len(wallet_fields):])
+            wallets[wallet.pk] = wallet
+    return wallets
+
+
+def lock_wallets(wallet_ids: Iterable[int]) -> Dict[int, Wallet]:
+    # строки блокируются по возрастанию id, поэтому встречные переводы
+    # между одними и теми же кошельками не приводят к взаимной блокировке
+    return select_wallets_for_update('wallet.id = ANY(%(wallet_ids)s)', {
+        'wallet_ids': list(set(wallet_ids)),
+    })
+
+
+def lock_transfer_wallets(
         sender: CustomUser,
         sender_wallet_id: int,
         recipient_wallet_id: int,
-        amount: Decimal,
-) -> Transaction:
-    sender_wallets = sender.wallets.all()
-    wallets_query = Wallet.objects.filter(
-        pk__in=[sender_wallet_id, recipient_wallet_id],
-    )
-    wallets = {wallet.pk: wallet for wallet in wallets_query}
+        lock_sharded_recipient: bool = True,
+) -> Tuple[Wallet, Wallet]:
+    if sender_wallet_id == recipient_wallet_id:
+        raise Wallet.DoesNotExist('Target wallet or you wallet does not exist.')
+
+    if lock_sharded_recipient:
+        wallets = lock_wallets([sender_wallet_id, recipient_wallet_id])
+    else:
+        # строка кошелька с разбитым балансом не блокируется: зачисление
+        # уйдёт в одну из его частей
+        wallets = select_wallets_for_update(
+            'wallet.id = %(sender_id)s OR (wallet.id = %(recipient_id)s AND wallet.shards_count = 0)',
+            {'sender_id': sender_wallet_id, 'recipient_id': recipient_wallet_id},
+        )
+        if sender_wallet_id in wallets and recipient_wallet_id not in wallets:
+            recipient_wallet = Wallet.objects.select_related('owner').filter(
+                pk=recipient_wallet_id,
+            ).first()
+            if recipient_wallet is not None:
+                wallets[recipient_wallet_id] = recipient_wallet
 
     if len(wallets) < 2:
         raise Wallet.DoesNotExist('Target wallet or you wallet does not exist.')
 
     sender_wallet, recipient_wallet = wallets[sender_wallet_id], wallets[recipient_wallet_id]
 
-    if sender_wallet not in set(sender_wallets):
+    if sender_wallet.owner_id != sender.pk:
         raise WalletOperationException('This is not your wallet. Try again.')
 
+    return sender_wallet, recipient_wallet
+
+
+def get_transfer_exchange_rate(
+        sender_wallet: Wallet,
+        recipient_wallet: Wallet,
+        amount: Decimal,
+) -> Tuple[Decimal, Decimal]:
     if sender_wallet.currency == recipient_wallet.currency:
-        exchange_rate, amount_to_transfer = Decimal(1), amount
-    else:
-        exchange_rate = get_current_exchange_rate(
-            base_currency=sender_wallet.currency,
-            target_currency=recipient_wallet.currency,
+        return Decimal(1), amount
+    exchange_rate = get_current_exchange_rate(
+        base_currency=sender_wallet.currency,
+        target_currency=recipient_wallet.currency,
+    )
+    amount_to_transfer = convert_amount(
+        amount=amount,
+        exchange_rate=exchange_rate,
+    )
+    return exchange_rate, amount_to_transfer
+
+
+def transfer_money_between_wallets(
+        sender: CustomUser,
+        sender_wallet_id: int,
+        recipient_wallet_id: int,
+        amount: Decimal,
+) -> Transaction:
+    with tracer.trace('transfer_money_between_wallets', mode=settings.WALLET_TRANSFER_MODE):
+        if settings.WALLET_TRANSFER_MODE == RETURNING_TRANSFER_MODE:
+            return transfer_money_with_returning(
+                sender=sender,
+                sender_wallet_id=sender_wallet_id,
+                recipient_wallet_id=recipient_wallet_id,
+                amount=amount,
+            )
+
+        with transaction.atomic():
+            # оборачиваем, чтобы не высыпались деньги между кошельками
+            with tracer.span('transfer.lock_wallets'):
+                sender_wallet, recipient_wallet = lock_transfer_wallets(
+                    sender=sender,
+                    sender_wallet_id=sender_wallet_id,
+                    recipient_wallet_id=recipient_wallet_id,
+                    lock_sharded_recipient=False,
+                )
+            with tracer.span('transfer.exchange_rate'):
+                exchange_rate, amount_to_transfer = get_transfer_exchange_rate(
+                    sender_wallet=sender_wallet,
+                    recipient_wallet=recipient_wallet,
+                    amount=amount,
+                )
+
+            with tracer.span('transfer.update_balances'):
+                decrease_wallet_balance(
+                    wallet=sender_wallet,
+                    amount=amount,
+                )
+                increase_wallet_balance(
+                    wallet=recipient_wallet,
+                    amount=amount_to_transfer,
+                )
+            with tracer.span('transfer.create_transaction'):
+                created_transaction = create_transaction(
+                    sender=sender_wallet,
+                    recipient=recipient_wallet,
+                    amount=amount,
+                    exchange_rate=exchange_rate,
+                )
+            with tracer.span('transfer.create_ledger_entries'):
+                create_ledger_entries([created_transaction])
+            count_transfers([(sender_wallet.currency, recipient_wallet.currency)])
+            # COMMIT выполняется при выходе из atomic()
+            commit_span = tracer.start_span('transfer.commit')
+        commit_span.finish()
+
+    return created_transaction
+
+
+TRANSFER_WITH_RETURNING_SQL = """
+    WITH debit AS (
+        UPDATE {wallet_table}
+        SET balance = balance - %(amount)s
+        WHERE id = %(sender_id)s AND owner_id = %(owner_id)s AND balance >= %(amount)s
+        RETURNING balance
+    ), credit AS (
+        UPDATE {wallet_table}
+        SET balance = balance + %(amount_to_transfer)s
+        WHERE id = %(recipient_id)s AND EXISTS (SELECT 1 FROM debit)
+        RETURNING balance
+    ), transfer AS (
+        INSERT INTO {transaction_table} (sender_id, recipient_id, amount, exchange_rate, created_at)
+        SELECT %(sender_id)s, %(recipient_id)s, %(amount)s, %(exchange_rate)s, %(created_at)s
+        FROM debit, credit
+        RETURNING id
+    ), entries AS (
+        INSERT INTO {ledger_table} (transaction_id, wallet_id, amount, created_at)
+        SELECT id, %(sender_id)s, %(debit_amount)s, %(created_at)s FROM transfer
+        UNION ALL
+        SELECT id, %(recipient_id)s, %(amount_to_transfer)s, %(created_at)s FROM transfer
+    )
+    SELECT id, (SELECT balance FROM debit), (SELECT balance FROM credit)
+    FROM transfer
+"""
+
+
+def transfer_money_with_returning(
+        sender: CustomUser,
+        sender_wallet_id: int,
+        recipient_wallet_id: int,
+        amount: Decimal,
+) -> Transaction:
+    # два запроса вместо пяти: блокировка кошельков и одно выражение,
+    # которое списывает, зачисляет и пишет перевод
+    cents = Decimal('.01')
+    amount = amount.quantize(cents, ROUND_HALF_DOWN)
+    if amount <= 0:
+        raise WalletOperationException('Сумма должна быть больше нуля.')
+
+    with transaction.atomic():
+        with tracer.span('transfer.lock_wallets'):
+            sender_wallet, recipient_wallet = lock_transfer_wallets(
+                sender=sender,
+                sender_wallet_id=sender_wallet_id,
+                recipient_wallet_id=recipient_wallet_id,
+            )
+        with tracer.span('transfer.exchange_rate'):
+            exchange_rate, amount_to_transfer = get_transfer_exchange_rate(
+                sender_wallet=sender_wallet,
+                recipient_wallet=recipient_wallet,
+                amount=amount,
+            )
+        if amount_to_transfer <= 0:
+            raise WalletOperationException('Сумма должна быть больше нуля.')
+        if amount > sender_wallet.balance:
+            with tracer.span('transfer.fold_shards'):
+                fold_wallet_balance_shards(sender_wallet)
+
+        created_at = timezone.now()
+        sql = TRANSFER_WITH_RETURNING_SQL.format(
+            wallet_table=Wallet._meta.db_table,
+            transaction_table=Transaction._meta.db_table,
+            ledger_table=LedgerEntry._meta.db_table,
         )
-        amount_to_transfer = convert_amount(
-            amount=amount,
-            exchange_rate=exchange_rate,
+        # списание, зачисление, запись перевода и проводок - одно выражение
+        with tracer.span('transfer.update_returning'), connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'amount': amount,
+                'amount_to_transfer': amount_to_transfer,
+                'debit_amount': -amount,
+                'exchange_rate': exchange_rate,
+                'sender_id': sender_wallet.pk,
+                'recipient_id': recipient_wallet.pk,
+                'owner_id': sender.pk,
+                'created_at': created_at,
+            })
+            row = cursor.fetchone()
+        if row is not None:
+            count_transfers([(sender_wallet.currency, recipient_wallet.currency)])
+        commit_span = tracer.start_span('transfer.commit')
+    commit_span.finish()
+
+    if row is None:
+        raise WalletOperationException('Нельзя списать денег больше, чем у вас есть.')
+
+    transaction_id, sender_wallet.balance, recipient_wallet.balance = row
+    return Transaction(
+        pk=transaction_id,
+        sender=sender_wallet,
+        recipient=recipient_wallet,
+        amount=amount,
+        exchange_rate=exchange_rate,
+        created_at=created_at,
+    )
+
+
+def set_wallet_balances(balances: Dict[int, Decimal]) -> None:
+    # кошельки уже заблокированы, поэтому итоговые балансы пишутся одним
+    # UPDATE без повторного чтения
+    if not balances:
+        return
+    Wallet.objects.filter(pk__in=balances.keys()).update(
+        balance=Case(
+            *[When(pk=pk, then=Value(balance)) for pk, balance in balances.items()],
+            output_field=DecimalField(max_digits=11, decimal_places=2),
+        ),
+    )
+
+
+def refresh_wallet_balances(wallets: Dict[int, Wallet]) -> None:
+    balances = dict(Wallet.objects.filter(pk__in=wallets.keys()).values_list('pk', 'balance'))
+    for pk, wallet in wallets.items():
+        wallet.balance = balances[pk]
+
+
+def transfer_money_in_batch(
+        sender: CustomUser,
+        transfers: List[Dict],
+        all_or_nothing: bool = True,
+        wallets: Optional[Dict[int, Wallet]] = None,
+) -> List[Dict]:
+    # wallets - кошельки, уже заблокированные вызывающим кодом; иначе
+    # кошельки пачки блокируются здесь
+    cents = Decimal('.01')
+    results = []
+    new_transactions = []
+
+    with transaction.atomic():
+        if wallets is None:
+            wallet_ids = {item['sender'] for item in transfers} | {item['recipient'] for item in transfers}
+            wallets = lock_wallets(wallet_ids)
+        balances = {pk: wallet.balance for pk, wallet in wallets.items()}
+
+        for index, item in enumerate(transfers):
+            result = {
+                'sender': item['sender'],
+                'recipient': item['recipient'],
+                'amount': item['amount'],
+            }
+            results.append(result)
+            try:
+                sender_wallet = wallets.get(item['sender'])
+                recipient_wallet = wallets.get(item['recipient'])
+                if sender_wallet is None or recipient_wallet is None or sender_wallet is recipient_wallet:
+                    raise Wallet.DoesNotExist('Target wallet or you wallet does not exist.')
+                if sender_wallet.owner_id != sender.pk:
+                    raise WalletOperationException('This is not your wallet. Try again.')
+
+                amount = item['amount'].quantize(cents, ROUND_HALF_DOWN)
+                if amount <= 0:
+                    raise WalletOperationException('Сумма должна быть больше нуля.')
+                if amount > balances[sender_wallet.pk]:
+                    balance_before_fold = sender_wallet.balance
+                    fold_wallet_balance_shards(sender_wallet)
+                    balances[sender_wallet.pk] += sender_wallet.balance - balance_before_fold
+                if amount > balances[sender_wallet.pk]:
+                    raise WalletOperationException('Нельзя списать денег больше, чем у вас есть.')
+                exchange_rate, amount_to_transfer = get_transfer_exchange_rate(
+                    sender_wallet=sender_wallet,
+                    recipient_wallet=recipient_wallet,
+                    amount=amount,
+                )
+                # балансы пачки пишутся одним UPDATE, и переполнение у
+                # одного получателя откатило бы всю пачку
+                if balances[recipient_wallet.pk] + amount_to_transfer > MAX_WALLET_BALANCE:
+                    raise WalletOperationException('Баланс получателя превысит допустимый.')
+            except (ExchangeRate.DoesNotExist, Wallet.DoesNotExist, WalletOperationException) as error:
+                if all_or_nothing:
+                    raise WalletOperationException(f'Transfer #{index} failed: {error}') from error
+                result['error'] = str(error)
+                continue
+
+            balances[sender_wallet.pk] -= amount
+            balances[recipient_wallet.pk] += amount_to_transfer
+            new_transactions.append((result, Transaction(
+                sender=sender_wallet,
+                recipient=recipient_wallet,
+                amount=amount,
+                exchange_rate=exchange_rate,
+            )))
+
+        changed_balances = {
+            pk: balance
+            for pk, balance in balances.items()
+            if balance != wallets[pk].balance
+        }
+        set_wallet_balances(changed_balances)
+        # те же объекты кошельков может использовать следующая пачка
+        for pk, balance in changed_balances.items():
+            wallets[pk].balance = balance
+        Transaction.objects.bulk_create([
+            new_transaction for _, new_transaction in new_transactions
+        ])
+        create_ledger_entries(
+            new_transaction for _, new_transaction in new_transactions
+        )
+        count_transfers(
+            (new_transaction.sender.currency, new_transaction.recipient.currency)
+            for _, new_transaction in new_transactions
         )
 
+    for result, new_transaction in new_transactions:
+        result['transaction'] = new_transaction.pk
+    return results
+
+
+def create_pending_transfer(
+        sender: CustomUser,
+        sender_wallet_id: int,
+        recipient_wallet_id: int,
+        amount: Decimal,
+) -> PendingTransfer:
+    return PendingTransfer.objects.create(
+        sender=sender,
+        sender_wallet_id=sender_wallet_id,
+        recipient_wallet_id=recipient_wallet_id,
+        amount=amount,
+    )
+
+
+def transfer_pending_transfers(
+        sender: CustomUser,
+        pending_transfers: List[PendingTransfer],
+        wallets: Dict[int, Wallet],
+) -> List[Dict]:
+    return transfer_money_in_batch(
+        sender=sender,
+        transfers=[
+            {
+                'sender': pending_transfer.sender_wallet_id,
+                'recipient': pending_transfer.recipient_wallet_id,
+                'amount': pending_transfer.amount,
+            }
+            for pending_transfer in pending_transfers
+        ],
+        all_or_nothing=False,
+        wallets=wallets,
+    )
+
+
+def process_pending_transfers(batch_size: int) -> int:
+    # вся пачка проводится одним коммитом; skip_locked позволяет
+    # нескольким обработчикам разбирать очередь параллельно
     with transaction.atomic():
-        # оборачиваем, чтобы не высыпались деньги между кошельками
-        decrease_wallet_balance(
-            wallet=sender_wallet,
-            amount=amount,
+        pending_transfers = list(
+            PendingTransfer.objects.select_for_update(
+                skip_locked=True,
+                of=('self',),
+            ).select_related(
+                'sender',
+            ).filter(
+                status=PENDING,
+            ).order_by('pk')[:batch_size],
         )
-        increase_wallet_balance(
-            wallet=recipient_wallet,
-            amount=amount_to_transfer,
+        if not pending_transfers:
+            return 0
+
+        transfers_by_sender = defaultdict(list)
+        for pending_transfer in pending_transfers:
+            transfers_by_sender[pending_transfer.sender].append(pending_transfer)
+        # кошельки всей пачки блокируются разом по возрастанию id: если
+        # блокировать их по группам отправителей, два обработчика могут
+        # взять одни и те же кошельки в разном порядке
+        wallets = lock_wallets(itertools.chain.from_iterable(
+            (pending_transfer.sender_wallet_id, pending_transfer.recipient_wallet_id)
+            for pending_transfer in pending_transfers
+        ))
+
+        processed_at = timezone.now()
+        for sender, sender_transfers in transfers_by_sender.items():
+            try:
+                results = transfer_pending_transfers(sender, sender_transfers, wallets)
+            except (DataError, IntegrityError):
+                # группа откатилась к своей точке сохранения. Чтобы одна
+                # строка не останавливала очередь, группа проводится по
+                # одному переводу, а упавший помечается FAILED
+                refresh_wallet_balances(wallets)
+                results = []
+                for pending_transfer in sender_transfers:
+                    try:
+                        results.extend(transfer_pending_transfers(sender, [pending_transfer], wallets))
+                    except (DataError, IntegrityError) as error:
+                        refresh_wallet_balances(wallets)
+                        results.append({'error': str(error)})
+            for pending_transfer, result in zip(sender_transfers, results):
+                if 'transaction' in result:
+                    pending_transfer.status = DONE
+                    pending_transfer.transaction_id = result['transaction']
+                else:
+                    pending_transfer.status = FAILED
+                    pending_transfer.error = result['error']
+                pending_transfer.processed_at = processed_at
+
+        PendingTransfer.objects.bulk_update(
+            pending_transfers,
+            fields=['status', 'transaction', 'error', 'processed_at'],
         )
-        created_transaction = create_transaction(
-            sender=sender_wallet,
-            recipient=recipient_wallet,
-            amount=amount,
-            exchange_rate=exchange_rate,
+    return len(pending_transfers)
+
+
+def retrieve_pending_transfer(
+        user: CustomUser,
+        pending_transfer_id: int,
+) -> PendingTransfer:
+    pending_transfer = PendingTransfer.objects.filter(
+        sender=user,
+        pk=pending_transfer_id,
+    ).first()
+    if pending_transfer is None:
+        raise PendingTransfer.DoesNotExist('Transfer does not exist.')
+    return pending_transfer
+
+
+def check_wallet_owner(user: CustomUser, wallet_id: int) -> None:
+    if not user.wallets.filter(id=wallet_id).exists():
+        raise WalletOperationException(
+            'This is not your wallet',
         )
 
-    return created_transaction
+
+class WalletBalance(NamedTuple):
+    wallet: Wallet
+    balance: Decimal
+
+
+def retrieve_wallet_balance(user: CustomUser, wallet_id: int) -> WalletBalance:
+    # проверка владельца и чтение кошелька одним запросом
+    wallet = user.wallets.filter(pk=wallet_id).first()
+    if wallet is None:
+        raise WalletOperationException(
+            'This is not your wallet',
+        )
+    return WalletBalance(wallet=wallet, balance=get_wallet_balance(wallet))
 
 
 def retrieve_transactions_by_wallet_id(
         user: CustomUser,
         wallet_id: int,
 ) -> List[Transaction]:
-    user_wallets_ids = set(user.wallets.all().values_list('id', flat=True))
-    if wallet_id in user_wallets_ids:
-        transactions = Transaction.objects.filter(
-            Q(sender_id=wallet_id) | Q(recipient_id=wallet_id),
+    check_wallet_owner(user=user, wallet_id=wallet_id)
+    transactions = Transaction.objects.filter(
+        Q(sender_id=wallet_id) | Q(recipient_id=wallet_id),
+    )
+    return transactions
+
+
+def iterate_transactions_by_wallet_id(
+        user: CustomUser,
+        wallet_id: int,
+        fields: Iterable[str],
+        chunk_size: int,
+) -> Iterator[tuple]:
+    # владелец проверяется сразу, а строки читаются лениво серверным
+    # курсором по chunk_size штук, не загружая историю целиком
+    transactions = retrieve_transactions_by_wallet_id(
+        user=user,
+        wallet_id=wallet_id,
+    )
+    return (
+        transactions
+        .order_by('created_at', 'id')
+        .values_list(*fields)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def encode_transactions_cursor(created_at: datetime, pk: int) -> str:
+    position = [created_at.isoformat(), pk]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_transactions_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError) as error:
+        raise WalletOperationException('Invalid cursor') from error
+
+
+def select_transactions_page(
+        wallet_id: int,
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        fields: Optional[Iterable[str]] = None,
+) -> QuerySet:
+    position = Q()
+    if after is not None:
+        created_at, pk = after
+        position = (
+            Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
         )
-        return transactions
-    raise WalletOperationException(
-        'This is not your wallet',
+    # OR по отправителю и получателю не даёт Postgres читать индекс по
+    # порядку, поэтому каждое направление сканируется своим индексом
+    # (sender/recipient, created_at, id) и обрезается до limit + 1 строк,
+    # а сортируются уже только эти строки
+    sent = Transaction.objects.filter(position, sender_id=wallet_id)
+    received = (
+        Transaction.objects
+        .filter(position, recipient_id=wallet_id)
+        .exclude(sender_id=wallet_id)
+    )
+    if fields is not None:
+        sent = sent.values_list(*fields)
+        received = received.values_list(*fields)
+    sent = sent.order_by('-created_at', '-id')[:limit + 1]
+    received = received.order_by('-created_at', '-id')[:limit + 1]
+    return (
+        sent
+        .union(received, all=True)
+        .order_by('-created_at', '-id')[:limit + 1]
     )
+
+
+def retrieve_transactions_page(
+        user: CustomUser,
+        wallet_id: int,
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+) -> Tuple[List[Transaction], Optional[str]]:
+    # курсор по (created_at, id) вместо OFFSET: любая страница читается
+    # с позиции курсора, а не пропуском всех предыдущих строк
+    check_wallet_owner(user=user, wallet_id=wallet_id)
+    page = list(select_transactions_page(
+        wallet_id=wallet_id,
+        limit=limit,
+        after=after,
+    ))
+    if len(page) > limit:
+        last_transaction = page[limit - 1]
+        cursor = encode_transactions_cursor(
+            created_at=last_transaction.created_at,
+            pk=last_transaction.pk,
+        )
+        return page[:limit], cursor
+    return page, None
+
+
+def retrieve_transaction_rows_page(
+        user: CustomUser,
+        wallet_id: int,
+        fields: Iterable[str],
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+) -> Tuple[List[tuple], Optional[str]]:
+    # то же, что retrieve_transactions_page, но без создания моделей:
+    # строки - кортежи полей fields, первыми в которых идут id и created_at
+    check_wallet_owner(user=user, wallet_id=wallet_id)
+    page = list(select_transactions_page(
+        wallet_id=wallet_id,
+        limit=limit,
+        after=after,
+        fields=fields,
+    ))
+    if len(page) > limit:
+        pk, created_at = page[limit - 1][:2]
+        cursor = encode_transactions_cursor(created_at=created_at, pk=pk)
+        return page[:limit], cursor
+    return page, None
+
+
+class WalletStatement(NamedTuple):
+    wallet: Wallet
+    start: datetime
+    end: datetime
+    opening_balance: Decimal
+    closing_balance: Decimal
+    incoming: Decimal
+    outgoing: Decimal
+
+
+def get_day_start(day: date) -> datetime:
+    # дни считаются в часовом поясе TIME_ZONE
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def get_last_snapshot_date() -> Optional[date]:
+    return WalletBalanceSnapshot.objects.aggregate(
+        last_date=Max('date'),
+    )['last_date']
+
+
+def create_balance_snapshots(today: Optional[date] = None) -> int:
+    # снимки пишутся только за закрытые дни и только для кошельков, у
+    # которых за день были переводы; задача запускается после полуночи,
+    # чтобы успели закоммититься переводы, начатые до неё
+    today = today or timezone.localdate()
+    last_date = get_last_snapshot_date()
+    period = Q(created_at__lt=get_day_start(today))
+    if last_date is not None:
+        since = get_day_start(last_date + timedelta(days=1))
+        period &= Q(created_at__gte=since)
+
+    # (кошелёк, день) -> [зачислено, списано]
+    turnovers = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    transactions = (
+        Transaction.objects
+        .filter(period)
+        .values_list('sender_id', 'recipient_id', 'amount', 'exchange_rate', 'created_at')
+        .iterator(chunk_size=2000)
+    )
+    for sender_id, recipient_id, amount, exchange_rate, created_at in transactions:
+        day = timezone.localtime(created_at).date()
+        turnovers[(recipient_id, day)][0] += convert_amount(amount, exchange_rate)
+        turnovers[(sender_id, day)][1] += amount
+    if not turnovers:
+        return 0
+
+    wallet_ids = {wallet_id for wallet_id, _ in turnovers}
+    balances = dict(
+        Wallet.objects.filter(pk__in=wallet_ids).values_list('pk', 'initial_balance'),
+    )
+    balances.update(
+        WalletBalanceSnapshot.objects
+        .filter(wallet_id__in=wallet_ids)
+        .order_by('wallet_id', '-date')
+        .distinct('wallet_id')
+        .values_list('wallet_id', 'balance')
+    )
+    snapshots = []
+    for (wallet_id, day), (incoming, outgoing) in sorted(turnovers.items()):
+        balances[wallet_id] += incoming - outgoing
+        snapshots.append(WalletBalanceSnapshot(
+            wallet_id=wallet_id,
+            date=day,
+            balance=balances[wallet_id],
+            incoming=incoming,
+            outgoing=outgoing,
+        ))
+    # снимки детерминированы, поэтому параллельный запуск задачи
+    # просто пропустит уже записанные строки
+    WalletBalanceSnapshot.objects.bulk_create(
+        snapshots,
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return len(snapshots)
+
+
+def scan_wallet_turnover(
+        wallet_id: int,
+        since: Optional[datetime],
+        until: datetime,
+) -> Tuple[Decimal, Decimal]:
+    period = Q(created_at__lt=until)
+    if since is not None:
+        period &= Q(created_at__gte=since)
+    outgoing = Transaction.objects.filter(
+        period,
+        sender_id=wallet_id,
+    ).aggregate(total=Sum('amount'))['total']
+    # зачисление округляется после конвертации, как при переводе
+    incoming = sum(
+        (
+            convert_amount(amount, exchange_rate)
+            for amount, exchange_rate in Transaction.objects.filter(
+                period,
+                recipient_id=wallet_id,
+            ).values_list('amount', 'exchange_rate')
+        ),
+        Decimal(0),
+    )
+    return incoming, outgoing or Decimal(0)
+
+
+def get_wallet_balance_at(wallet: Wallet, moment: datetime) -> Decimal:
+    # баланс до момента moment, не включая его: последний снимок до дня
+    # moment и переводы после этого снимка. Дни между снимком и днём
+    # moment либо без переводов кошелька, либо ещё не обработаны задачей
+    if moment <= wallet.created_at:
+        return Decimal(0)
+    day = timezone.localtime(moment).date()
+    snapshot = wallet.balance_snapshots.filter(date__lt=day).order_by('-date').first()
+    if snapshot is not None:
+        balance = snapshot.balance
+        since = get_day_start(snapshot.date + timedelta(days=1))
+    else:
+        balance = wallet.initial_balance
+        since = None
+    incoming, outgoing = scan_wallet_turnover(
+        wallet_id=wallet.pk,
+        since=since,
+        until=moment,
+    )
+    return balance + incoming - outgoing
+
+
+def get_wallet_turnover(
+        wallet: Wallet,
+        start: datetime,
+        end: datetime,
+) -> Tuple[Decimal, Decimal]:
+    # целые обработанные дни внутри [start, end) берутся из снимков,
+    # неполные дни по краям и необработанные дни - из переводов
+    first_day = timezone.localtime(start).date()
+    if get_day_start(first_day) < start:
+        first_day += timedelta(days=1)
+    last_day = timezone.localtime(end).date() - timedelta(days=1)
+    last_snapshot_date = get_last_snapshot_date()
+    if last_snapshot_date is not None:
+        last_day = min(last_day, last_snapshot_date)
+    if last_snapshot_date is None or first_day > last_day:
+        return scan_wallet_turnover(wallet_id=wallet.pk, since=start, until=end)
+
+    totals = wallet.balance_snapshots.filter(
+        date__range=(first_day, last_day),
+    ).aggregate(
+        incoming=Sum('incoming'),
+        outgoing=Sum('outgoing'),
+    )
+    head_incoming, head_outgoing = scan_wallet_turnover(
+        wallet_id=wallet.pk,
+        since=start,
+        until=get_day_start(first_day),
+    )
+    tail_incoming, tail_outgoing = scan_wallet_turnover(
+        wallet_id=wallet.pk,
+        since=get_day_start(last_day + timedelta(days=1)),
+        until=end,
+    )
+    incoming = (totals['incoming'] or Decimal(0)) + head_incoming + tail_incoming
+    outgoing = (totals['outgoing'] or Decimal(0)) + head_outgoing + tail_outgoing
+    return incoming, outgoing
+
+
+def retrieve_wallet_statement(
+        user: CustomUser,
+        wallet_id: int,
+        start: datetime,
+        end: datetime,
+) -> WalletStatement:
+    check_wallet_owner(user=user, wallet_id=wallet_id)
+    if start > end:
+        raise WalletOperationException('Statement start is after its end')
+    wallet = Wallet.objects.get(pk=wallet_id)
+    incoming, outgoing = get_wallet_turnover(wallet=wallet, start=start, end=end)
+    return WalletStatement(
+        wallet=wallet,
+        start=start,
+        end=end,
+        opening_balance=get_wallet_balance_at(wallet=wallet, moment=start),
+        closing_balance=get_wallet_balance_at(wallet=wallet, moment=end),
+        incoming=incoming,
+        outgoing=outgoing,
+    )
+
+
+CREATE_LEDGER_CHECKPOINTS_SQL = """
+    WITH turnover AS (
+        SELECT wallet_id, SUM(amount) AS amount
+        FROM {ledger_table}
+        WHERE id > %(since_id)s AND id <= %(until_id)s
+        GROUP BY wallet_id
+    ), last_checkpoint AS (
+        SELECT DISTINCT ON (wallet_id) wallet_id, balance
+        FROM {checkpoint_table}
+        WHERE wallet_id IN (SELECT wallet_id FROM turnover)
+        ORDER BY wallet_id, ledger_entry_id DESC
+    )
+    INSERT INTO {checkpoint_table} (wallet_id, ledger_entry_id, balance, created_at)
+    SELECT
+        turnover.wallet_id,
+        %(until_id)s,
+        COALESCE(last_checkpoint.balance, wallet.initial_balance) + turnover.amount,
+        %(created_at)s
+    FROM turnover
+    JOIN {wallet_table} wallet ON wallet.id = turnover.wallet_id
+    LEFT JOIN last_checkpoint ON last_checkpoint.wallet_id = turnover.wallet_id
+    ON CONFLICT DO NOTHING
+"""
+
+
+READ_LEDGER_HORIZON_SQL = """
+    SELECT
+        txid_snapshot_xmin(txid_current_snapshot()),
+        txid_snapshot_xmax(txid_current_snapshot()),
+        (SELECT MAX(id) FROM {ledger_table})
+"""
+
+
+def create_ledger_checkpoints(now: Optional[datetime] = None) -> int:
+    # каждый запуск записывает точку всем кошелькам с проводками после
+    # предыдущей точки, поэтому последняя точка любого кошелька - это его
+    # баланс на момент предыдущего запуска, и читается только журнал с
+    # прошлого запуска. Проводка с меньшим id может закоммититься позже
+    # проводки с большим, поэтому точка доходит только до границы,
+    # прочитанной одним из прошлых запусков, после которой завершились все
+    # транзакции, шедшие в момент её чтения (см. LedgerHorizon)
+    now = now or timezone.now()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(READ_LEDGER_HORIZON_SQL.format(
+                ledger_table=LedgerEntry._meta.db_table,
+            ))
+            snapshot_xmin, snapshot_xmax, last_id = cursor.fetchone()
+        horizon = LedgerHorizon.objects.filter(
+            snapshot_xmax__lte=snapshot_xmin,
+        ).order_by('-ledger_entry_id').first()
+        latest_horizon_id = LedgerHorizon.objects.aggregate(
+            last_id=Max('ledger_entry_id'),
+        )['last_id'] or 0
+        if last_id is not None and last_id > latest_horizon_id:
+            LedgerHorizon.objects.create(
+                ledger_entry_id=last_id,
+                snapshot_xmax=snapshot_xmax,
+            )
+        if horizon is None:
+            return 0
+        LedgerHorizon.objects.filter(
+            ledger_entry_id__lt=horizon.ledger_entry_id,
+        ).delete()
+
+        since_id = WalletBalanceCheckpoint.objects.aggregate(
+            last_id=Max('ledger_entry_id'),
+        )['last_id'] or 0
+        until_id = horizon.ledger_entry_id
+        if until_id <= since_id:
+            return 0
+
+        sql = CREATE_LEDGER_CHECKPOINTS_SQL.format(
+            ledger_table=LedgerEntry._meta.db_table,
+            checkpoint_table=WalletBalanceCheckpoint._meta.db_table,
+            wallet_table=Wallet._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'since_id': since_id,
+                'until_id': until_id,
+                'created_at': now,
+            })
+            return cursor.rowcount
+
+
+def get_ledger_balance(wallet: Wallet) -> Decimal:
+    # последняя точка и короткий хвост проводок после неё по индексу
+    # (wallet, id)
+    checkpoint = wallet.balance_checkpoints.order_by('-ledger_entry_id').first()
+    if checkpoint is not None:
+        balance = checkpoint.balance
+        since_id = checkpoint.ledger_entry_id
+    else:
+        balance = wallet.initial_balance
+        since_id = 0
+    tail = LedgerEntry.objects.filter(
+        wallet=wallet,
+        pk__gt=since_id,
+    ).aggregate(total=Sum('amount'))['total']
+    return balance + (tail or Decimal(0))
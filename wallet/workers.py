@@ -0,0 +1,66 @@
+import logging
+import multiprocessing
+import time
+
+from django.db import (
+    DatabaseError,
+    connections,
+)
+
+from .services import process_pending_transfers
+
+
+logger = logging.getLogger(__name__)
+
+# после ошибки БД пауза удваивается, но не больше этого числа секунд
+MAX_RETRY_DELAY = 30.0
+
+
+def run_transfer_worker(batch_size: int, poll_interval: float) -> None:
+    failures = 0
+    try:
+        while True:
+            try:
+                processed = process_pending_transfers(batch_size=batch_size)
+            except DatabaseError:
+                # пачка откатилась целиком и остаётся в очереди; соединение
+                # могло оборваться, поэтому следующая попытка откроет новое
+                failures += 1
+                delay = min(poll_interval * 2 ** failures, MAX_RETRY_DELAY)
+                logger.exception('Failed to process pending transfers, retrying in %.1fs', delay)
+                connections.close_all()
+                time.sleep(delay)
+                continue
+            failures = 0
+            if processed:
+                logger.info('Processed %s pending transfers', processed)
+            else:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connections.close_all()
+
+
+def run_transfer_workers(processes: int, batch_size: int, poll_interval: float) -> None:
+    # соединения с БД не должны достаться дочерним процессам по наследству
+    connections.close_all()
+    workers = [
+        multiprocessing.Process(
+            target=run_transfer_worker,
+            kwargs={
+                'batch_size': batch_size,
+                'poll_interval': poll_interval,
+            },
+            daemon=True,
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
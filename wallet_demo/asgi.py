@@ -0,0 +1,30 @@
+"""
+ASGI config for wallet_demo project.
+
+It exposes the ASGI callable as a module-level variable named ``application``:
+
+    DJANGO_SETTINGS_MODULE=wallet_demo.settings_production \
+        uvicorn --host 0.0.0.0 --port 8000 wallet_demo.asgi:application
+
+Django 2.2 has no ASGI handler, so the Django application is wrapped
+into api.asgi.BoundedWSGIApplication. One process serves thousands of
+open client connections, while requests run in at most ASGI_DB_THREADS
+threads of that process.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wallet_demo.settings')
+
+wsgi_application = get_wsgi_application()
+
+# модули приложений импортируются только после django.setup()
+from api.asgi import BoundedWSGIApplication  # noqa: E402
+
+application = BoundedWSGIApplication(
+    wsgi_application,
+    threads=settings.ASGI_DB_THREADS,
+)
@@ -0,0 +1,78 @@
+"""
+Gunicorn config for the pre-fork deployment:
+
+    DJANGO_SETTINGS_MODULE=wallet_demo.settings_production \
+        gunicorn -c python:wallet_demo.gunicorn_conf wallet_demo.wsgi
+
+Each worker thread keeps its own persistent database connection, so
+workers * threads per instance must fit into Postgres max_connections
+(or the pooler limit) together with the scheduler and transfer workers.
+"""
+import glob
+import multiprocessing
+import os
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# запросы в основном ждут БД, поэтому процессов больше, чем ядер
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+
+# перезапуск воркеров после N запросов страхует от роста памяти; разброс
+# не даёт всем воркерам перезапуститься одновременно
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+# приложение загружается до fork и делится между воркерами через
+# copy-on-write; соединения с БД при этом не открываются
+preload_app = True
+
+accesslog = '-'
+
+# воркеры пишут метрики Prometheus в файлы этого каталога, /metrics любого
+# воркера суммирует их; переменная должна быть задана до импорта
+# prometheus_client, то есть до загрузки приложения
+metrics_dir = os.environ.setdefault(
+    'prometheus_multiproc_dir',
+    os.environ.get('METRICS_DIR', '/tmp/wallet-demo-metrics'),
+)
+
+
+def on_starting(server):
+    # счётчики прошлого запуска не должны попасть в новые значения
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(path)
+
+
+def when_ready(server):
+    from django.conf import settings
+
+    # удаление токена сбрасывает кеш в памяти только того воркера, где
+    # оно произошло, остальные пускают по токену до AUTH_TOKEN_CACHE_TTL
+    if server.cfg.workers > 1 and settings.AUTH_TOKEN_CACHE_ALIAS is None:
+        server.log.warning(
+            'Auth token cache is per-process with %s workers: revoked tokens '
+            'stay valid in other workers for up to %ss. Set AUTH_TOKEN_CACHE_ALIAS.',
+            server.cfg.workers,
+            settings.AUTH_TOKEN_CACHE_TTL,
+        )
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    # на случай, если при загрузке приложения всё же открылось соединение
+    for connection in connections.all():
+        connection.close()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,91 @@
+import os
+import time
+
+from django.http import HttpRequest
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+
+
+# Под gunicorn каждый воркер пишет метрики в свои mmap-файлы в каталоге
+# prometheus_multiproc_dir (см. gunicorn_conf), /metrics суммирует их при
+# чтении. Воркеры не делят между собой ни память, ни блокировки.
+MULTIPROCESS_DIR_ENV = 'prometheus_multiproc_dir'
+
+UNRESOLVED_VIEW = 'unresolved'
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Время обработки запроса до отдачи ответа',
+    ['view', 'method'],
+)
+REQUESTS = Counter(
+    'http_requests',
+    'Обработанные запросы',
+    ['view', 'method', 'status'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Число запросов к БД за один HTTP-запрос',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf')),
+)
+REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds',
+    'Суммарное время запросов к БД за один HTTP-запрос',
+    ['view'],
+)
+
+
+class QueryStats:
+    """
+    Обёртка для connection.execute_wrapper: считает запросы к БД и их
+    суммарное время.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started_at
+            self.count += 1
+
+
+def get_view_name(request: HttpRequest) -> str:
+    match = request.resolver_match
+    if match is None:
+        return UNRESOLVED_VIEW
+    # у представлений-классов as_view() оставляет ссылку на класс
+    view = getattr(match.func, 'view_class', match.func)
+    return view.__name__
+
+
+def observe_request(
+        view: str,
+        method: str,
+        status: int,
+        duration: float,
+        query_stats: QueryStats,
+) -> None:
+    REQUEST_DURATION.labels(view, method).observe(duration)
+    REQUESTS.labels(view, method, str(status)).inc()
+    REQUEST_DB_QUERIES.labels(view).observe(query_stats.count)
+    REQUEST_DB_DURATION.labels(view).observe(query_stats.duration)
+
+
+def render_metrics() -> bytes:
+    if MULTIPROCESS_DIR_ENV not in os.environ:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return generate_latest(registry)
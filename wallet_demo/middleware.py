@@ -0,0 +1,96 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import (
+    connection,
+    connections,
+)
+
+from .metrics import (
+    QueryStats,
+    get_view_name,
+    observe_request,
+)
+from .tracing import (
+    current_correlation_id,
+    get_correlation_id,
+    tracer,
+)
+
+
+class ConnectionHealthCheckMiddleware:
+    """
+    Проверяет постоянные соединения с БД (CONN_MAX_AGE > 0), которые
+    простаивали дольше DB_HEALTH_CHECK_IDLE_TIME, и закрывает мёртвые,
+    чтобы запрос открыл новое соединение, а не упал на первом запросе
+    к БД. Соединения, которые используются постоянно, не проверяются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.idle_time = settings.DB_HEALTH_CHECK_IDLE_TIME
+        # соединения Django свои у каждого потока
+        self.local = threading.local()
+
+    def __call__(self, request):
+        last_used_at = getattr(self.local, 'last_used_at', None)
+        if last_used_at is not None and time.monotonic() - last_used_at > self.idle_time:
+            for connection in connections.all():
+                if connection.connection is not None and not connection.is_usable():
+                    connection.close()
+        try:
+            return self.get_response(request)
+        finally:
+            self.local.last_used_at = time.monotonic()
+
+
+class MetricsMiddleware:
+    """
+    Записывает для каждого запроса время обработки, число запросов к БД
+    и их суммарное время с меткой представления, которое его обработало.
+
+    Для потоковых ответов учитывается только время до начала отдачи:
+    запросы к БД при чтении тела ответа в метрики не попадают.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_stats = QueryStats()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(query_stats):
+            response = self.get_response(request)
+        observe_request(
+            view=get_view_name(request),
+            method=request.method,
+            status=response.status_code,
+            duration=time.perf_counter() - started_at,
+            query_stats=query_stats,
+        )
+        return response
+
+
+class TracingMiddleware:
+    """
+    Присваивает запросу correlation id - из заголовка X-Request-ID или
+    новый - и возвращает его в том же заголовке ответа. Запрос - корень
+    трассы: спаны сервисов, вызванных из представления, попадают в неё.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        correlation_id = get_correlation_id(request.META.get('HTTP_X_REQUEST_ID'))
+        context_token = current_correlation_id.set(correlation_id)
+        try:
+            with tracer.trace('http.request', method=request.method, path=request.path) as span:
+                response = self.get_response(request)
+                span.set_tag('view', get_view_name(request))
+                span.set_tag('status', response.status_code)
+        finally:
+            current_correlation_id.reset(context_token)
+        response['X-Request-ID'] = correlation_id
+        return response
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+from datetime import timedelta
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -47,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'wallet_demo.middleware.MetricsMiddleware',
+    'wallet_demo.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -141,6 +144,66 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'customauth.authentication.CachingTokenAuthentication',
     ),
 }
+
+
+# Exchange rates
+
+# Сколько секунд матрица курсов отдаётся из памяти процесса без проверки
+# версии в БД
+EXCHANGE_RATES_CACHE_TTL = 30
+
+# Все курсы запрашиваются у провайдера одним вызовом относительно этой
+# валюты, кросс-курсы считаются локально
+EXCHANGE_RATES_PIVOT_CURRENCY = 'EUR'
+
+# Сырые курсы хранятся столько времени, затем сворачиваются в часовые
+# OHLC-агрегаты; часовые агрегаты сворачиваются в дневные
+EXCHANGE_RATES_RAW_RETENTION = timedelta(days=7)
+EXCHANGE_RATES_HOURLY_RETENTION = timedelta(days=90)
+
+
+# Wallets
+
+# 'locking' - перевод через ORM с блокировкой строк кошельков;
+# 'returning' - перевод одним UPDATE ... RETURNING после блокировки
+WALLET_TRANSFER_MODE = 'locking'
+
+# API
+
+# Ответы на запросы с заголовком Idempotency-Key хранятся не меньше
+# этого времени, затем удаляются периодической задачей
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# Токен -> пользователь кешируется в памяти процесса (LRU на
+# AUTH_TOKEN_CACHE_SIZE записей) или, если задан алиас из CACHES, в общем
+# для всех процессов кеше. Запись живёт не дольше AUTH_TOKEN_CACHE_TTL
+# секунд. Кеш в памяти годится только для одного процесса: удаление
+# токена сбрасывает запись лишь в том процессе, где оно произошло
+AUTH_TOKEN_CACHE_ALIAS = None
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+
+# Выгрузка истории кошелька читается из БД пачками такого размера
+TRANSACTIONS_EXPORT_CHUNK_SIZE = 2000
+
+# Размер пула потоков ASGI-приложения (wallet_demo.asgi): столько
+# запросов процесса одновременно работают с БД и столько соединений с
+# БД он держит, сколько бы клиентов ни было подключено
+ASGI_DB_THREADS = 20
+
+
+# Tracing
+
+# Доля трасс, которые записываются (корень трассы - HTTP-запрос или
+# операция вне запроса, например обновление курсов); 0 - трассировка
+# выключена и спаны ничего не стоят
+TRACING_SAMPLE_RATE = 0.0
+
+# 'log' - спан строкой JSON в логгер wallet_demo.tracing.spans;
+# 'zipkin' - пачками в коллектор по TRACING_ZIPKIN_URL (Zipkin v2 API)
+TRACING_EXPORTER = 'log'
+TRACING_ZIPKIN_URL = 'http://localhost:9411/api/v2/spans'
+TRACING_SERVICE_NAME = 'wallet-demo'
@@ -0,0 +1,144 @@
+"""
+Production settings for wallet_demo project.
+
+Everything environment-specific is read from environment variables:
+
+    DJANGO_SETTINGS_MODULE=wallet_demo.settings_production
+    DJANGO_SECRET_KEY=...
+    DJANGO_ALLOWED_HOSTS=api.example.com,10.0.0.5
+    DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+
+
+def get_env(name: str, default=None) -> str:
+    value = os.environ.get(name, default)
+    if value is None:
+        raise ImproperlyConfigured(f'Set the {name} environment variable')
+    return value
+
+
+def get_bool_env(name: str, default: bool) -> bool:
+    return get_env(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+SECRET_KEY = get_env('DJANGO_SECRET_KEY')
+
+# с выключенным DEBUG Django не копит в памяти все выполненные запросы
+DEBUG = get_bool_env('DJANGO_DEBUG', False)
+
+ALLOWED_HOSTS = get_env('DJANGO_ALLOWED_HOSTS', '*').split(',')
+
+
+# Database
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': get_env('DB_NAME', 'wallet_demo_db'),
+        'USER': get_env('DB_USER', 'postgresql_user'),
+        'PASSWORD': get_env('DB_PASSWORD', 'postgresql_password'),
+        'HOST': get_env('DB_HOST', 'db'),
+        'PORT': get_env('DB_PORT', '5432'),
+        # соединение переиспользуется запросами одного потока, пока не
+        # истечёт CONN_MAX_AGE секунд; 0 - новое соединение на запрос
+        'CONN_MAX_AGE': int(get_env('DB_CONN_MAX_AGE', '60')),
+    },
+}
+
+# постоянное соединение, простоявшее без запросов дольше этого числа
+# секунд, проверяется перед запросом и переоткрывается, если БД его
+# закрыла (перезапуск, таймаут простоя в пулере)
+DB_HEALTH_CHECK_IDLE_TIME = float(get_env('DB_HEALTH_CHECK_IDLE_TIME', '10'))
+
+# режим проведения переводов, см. settings.WALLET_TRANSFER_MODE
+WALLET_TRANSFER_MODE = get_env('WALLET_TRANSFER_MODE', WALLET_TRANSFER_MODE)  # noqa: F405
+
+# Кеш токенов общий для всех процессов: с кешем в памяти процесса
+# удалённый токен или выключенный пользователь ещё до
+# AUTH_TOKEN_CACHE_TTL секунд проходят проверку в остальных воркерах.
+# По умолчанию это таблица в той же БД (manage.py createcachetable),
+# memcached задаётся через AUTH_TOKEN_CACHE_BACKEND и _LOCATION
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'auth_tokens': {
+        'BACKEND': get_env('AUTH_TOKEN_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': get_env('AUTH_TOKEN_CACHE_LOCATION', 'auth_token_cache'),
+    },
+}
+AUTH_TOKEN_CACHE_ALIAS = 'auth_tokens'
+
+# под uvicorn (wallet_demo.asgi) - соединений с БД на процесс
+ASGI_DB_THREADS = int(get_env('ASGI_DB_THREADS', '20'))
+
+# проверка соединений идёт сразу после трассировки, чтобы её время
+# входило во время запроса и в спан запроса
+MIDDLEWARE = list(MIDDLEWARE)  # noqa: F405
+MIDDLEWARE.insert(
+    MIDDLEWARE.index('wallet_demo.middleware.TracingMiddleware') + 1,
+    'wallet_demo.middleware.ConnectionHealthCheckMiddleware',
+)
+
+
+# Tracing
+
+TRACING_SAMPLE_RATE = float(get_env('TRACING_SAMPLE_RATE', '0'))
+TRACING_EXPORTER = get_env('TRACING_EXPORTER', TRACING_EXPORTER)  # noqa: F405
+TRACING_ZIPKIN_URL = get_env('TRACING_ZIPKIN_URL', TRACING_ZIPKIN_URL)  # noqa: F405
+TRACING_SERVICE_NAME = get_env('TRACING_SERVICE_NAME', TRACING_SERVICE_NAME)  # noqa: F405
+
+
+# Logging
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'correlation_id': {
+            '()': 'wallet_demo.tracing.CorrelationIdFilter',
+        },
+    },
+    'formatters': {
+        'plain': {
+            'format': '%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s',
+        },
+        # спаны пишутся как есть, строка - один JSON
+        'span': {
+            'format': '%(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'plain',
+            'filters': ['correlation_id'],
+        },
+        'spans': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'span',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': get_env('DJANGO_LOG_LEVEL', 'INFO'),
+    },
+    'loggers': {
+        # SQL-запросы не пишутся в лог даже при включённом DEBUG
+        'django.db.backends': {
+            'level': 'WARNING',
+            'propagate': True,
+        },
+        'wallet_demo.tracing.spans': {
+            'handlers': ['spans'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,330 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+
+import requests
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+spans_logger = logging.getLogger(f'{__name__}.spans')
+
+CORRELATION_ID_RE = re.compile(r'^[\w.:-]{1,64}$')
+
+# трасса, в которой сейчас выполняется код, и идентификатор запроса;
+# contextvars, а не threading.local, чтобы работало и в корутинах
+current_trace = ContextVar('current_trace', default=None)
+current_correlation_id = ContextVar('current_correlation_id', default=None)
+
+
+def get_correlation_id(header_value: Optional[str]) -> str:
+    # идентификатор от балансировщика или клиента принимается, только
+    # если он похож на идентификатор, иначе выдаётся новый
+    if header_value and CORRELATION_ID_RE.match(header_value):
+        return header_value
+    return uuid.uuid4().hex
+
+
+class CorrelationIdFilter(logging.Filter):
+    """
+    Добавляет в записи лога correlation_id текущего запроса, чтобы его
+    можно было вывести в формате: %(correlation_id)s.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = current_correlation_id.get() or '-'
+        return True
+
+
+class NoopSpan:
+    """
+    Спан, который ничего не записывает: его возвращает трассировщик,
+    когда трасса не пишется, поэтому выключенная трассировка стоит
+    одного чтения ContextVar на спан.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> 'NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+    def start(self) -> 'NoopSpan':
+        return self
+
+    def finish(self, error: Optional[str] = None) -> None:
+        pass
+
+    def set_tag(self, key: str, value) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Trace:
+
+    __slots__ = ('trace_id', 'correlation_id', 'spans', 'stack')
+
+    def __init__(self, correlation_id: Optional[str]):
+        self.trace_id = uuid.uuid4().hex
+        self.correlation_id = correlation_id
+        self.spans = []
+        self.stack = []
+
+
+class Span:
+
+    __slots__ = (
+        'tracer', 'trace', 'name', 'tags', 'span_id', 'parent_id',
+        'timestamp', 'started_at', 'duration', 'context_token',
+    )
+
+    def __init__(self, tracer: 'Tracer', trace: Trace, name: str, tags: Dict):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.tags = tags
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = None
+        self.timestamp = None
+        self.started_at = None
+        self.duration = None
+        self.context_token = None
+
+    def __enter__(self) -> 'Span':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.finish(error=exc_type.__name__ if exc_type is not None else None)
+        return False
+
+    def start(self) -> 'Span':
+        stack = self.trace.stack
+        if stack:
+            self.parent_id = stack[-1].span_id
+        else:
+            self.context_token = current_trace.set(self.trace)
+        stack.append(self)
+        self.timestamp = time.time()
+        self.started_at = time.perf_counter()
+        return self
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self.duration = time.perf_counter() - self.started_at
+        if error is not None:
+            self.tags['error'] = error
+        stack = self.trace.stack
+        if stack and stack[-1] is self:
+            stack.pop()
+        else:
+            stack.remove(self)
+        self.trace.spans.append(self)
+        if self.context_token is not None:
+            # корневой спан закрыт - трасса готова к отправке
+            current_trace.reset(self.context_token)
+            self.tracer.exporter.export(self.trace.spans)
+
+    def set_tag(self, key: str, value) -> None:
+        self.tags[key] = value
+
+    def to_dict(self, service_name: str) -> Dict:
+        # формат Zipkin v2: его принимают Zipkin, Jaeger и OpenTelemetry
+        # Collector, а строки JSON-лога можно переотправить в коллектор
+        tags = {key: str(value) for key, value in self.tags.items()}
+        if self.trace.correlation_id is not None:
+            tags['correlation_id'] = self.trace.correlation_id
+        span = {
+            'traceId': self.trace.trace_id,
+            'id': self.span_id,
+            'name': self.name,
+            'timestamp': int(self.timestamp * 1000000),
+            'duration': max(int(self.duration * 1000000), 1),
+            'localEndpoint': {'serviceName': service_name},
+            'tags': tags,
+        }
+        if self.parent_id is not None:
+            span['parentId'] = self.parent_id
+        return span
+
+
+class UnsampledSpan:
+    """
+    Корень трассы, не попавшей в выборку: вложенные trace() внутри него
+    не начинают собственных трасс.
+    """
+
+    __slots__ = ('context_token',)
+
+    def __enter__(self) -> 'UnsampledSpan':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.finish()
+        return False
+
+    def start(self) -> 'UnsampledSpan':
+        self.context_token = current_trace.set(UNSAMPLED_TRACE)
+        return self
+
+    def finish(self, error: Optional[str] = None) -> None:
+        current_trace.reset(self.context_token)
+
+    def set_tag(self, key: str, value) -> None:
+        pass
+
+
+UNSAMPLED_TRACE = Trace(correlation_id=None)
+
+
+class LogExporter:
+    """
+    Пишет каждый спан строкой JSON в логгер wallet_demo.tracing.spans.
+    """
+
+    def __init__(self, service_name: str):
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]) -> None:
+        for span in spans:
+            spans_logger.info(json.dumps(span.to_dict(self.service_name)))
+
+
+class ZipkinExporter:
+    """
+    Отправляет спаны пачками в коллектор с Zipkin v2 API из фонового
+    потока, не задерживая запросы. Если коллектор не успевает, спаны
+    сверх max_queue_size отбрасываются.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            service_name: str,
+            max_queue_size: int = 10000,
+            batch_size: int = 100,
+            interval: float = 1.0,
+            timeout: float = 2.0,
+    ):
+        self.url = url
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        self._ensure_worker()
+        for span in spans:
+            try:
+                self.queue.put_nowait(span.to_dict(self.service_name))
+            except queue.Full:
+                self.dropped += 1
+
+    def flush(self) -> None:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        try:
+            requests.post(self.url, json=batch, timeout=self.timeout)
+        except requests.RequestException as error:
+            logger.warning('Failed to export %s spans: %s', len(batch), error)
+
+    def _ensure_worker(self) -> None:
+        # потоки не переживают fork, поэтому в каждом воркере gunicorn
+        # поток отправки запускается заново
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            while not self.queue.empty():
+                self.flush()
+
+
+class Tracer:
+
+    def __init__(
+            self,
+            sample_rate: float,
+            exporter,
+            sampler: Callable[[], float] = random.random,
+    ):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.sampler = sampler
+
+    def trace(self, name: str, **tags):
+        """
+        Спан операции: дочерний, если код уже выполняется внутри трассы,
+        иначе - корень новой трассы, которая пишется с вероятностью
+        sample_rate.
+        """
+        trace = current_trace.get()
+        if trace is not None:
+            if trace is UNSAMPLED_TRACE:
+                return NOOP_SPAN
+            return Span(self, trace, name, tags)
+        if not self.sample_rate:
+            return NOOP_SPAN
+        if self.sampler() >= self.sample_rate:
+            return UnsampledSpan()
+        return Span(self, Trace(current_correlation_id.get()), name, tags)
+
+    def span(self, name: str, **tags):
+        """
+        Спан этапа операции: пишется, только если есть текущая трасса.
+        """
+        trace = current_trace.get()
+        if trace is None or trace is UNSAMPLED_TRACE:
+            return NOOP_SPAN
+        return Span(self, trace, name, tags)
+
+    def start_span(self, name: str, **tags):
+        # для этапов, границы которых не совпадают с блоком with,
+        # например коммит при выходе из transaction.atomic()
+        return self.span(name, **tags).start()
+
+
+def build_exporter():
+    if settings.TRACING_EXPORTER == 'zipkin':
+        return ZipkinExporter(
+            url=settings.TRACING_ZIPKIN_URL,
+            service_name=settings.TRACING_SERVICE_NAME,
+        )
+    return LogExporter(service_name=settings.TRACING_SERVICE_NAME)
+
+
+tracer = Tracer(
+    sample_rate=settings.TRACING_SAMPLE_RATE,
+    exporter=build_exporter(),
+)
@@ -1,8 +1,15 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from .views import (
+    health_check,
+    metrics,
+)
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('health/', health_check),
+    path('metrics', metrics),
 ]
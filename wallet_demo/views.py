@@ -0,0 +1,25 @@
+from django.db import (
+    DatabaseError,
+    connection,
+)
+from django.http import (
+    HttpResponse,
+    JsonResponse,
+)
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from .metrics import render_metrics
+
+
+def health_check(request):
+    # для балансировщика и оркестратора: процесс жив и БД доступна
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError as error:
+        return JsonResponse({'status': 'unavailable', 'error': str(error)}, status=503)
+    return JsonResponse({'status': 'ok'})
+
+
+def metrics(request):
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)